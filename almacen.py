@@ -0,0 +1,203 @@
+"""
+Lectura y escritura de las tablas intermedias de data_interfaz/.
+
+Por defecto todo sigue siendo CSV. Con la variable de entorno
+FORMATO_INTERMEDIOS se puede elegir un formato columnar:
+
+- csv:      como hasta ahora (texto, sin tipos)
+- parquet:  nombres con codificación de diccionario e indicadores en float32
+- arrow:    Arrow IPC (Feather v2) sin comprimir, que se lee con memory-map
+
+Los formatos columnares conservan los tipos: las listas [min, media] de
+intervalos_ia vuelven como listas y no como cadenas, y los enteros con
+huecos siguen siendo enteros. Necesitan pyarrow (opcional):
+
+    pip install pyarrow
+
+Las rutas se escriben siempre con extensión .csv en el código; la extensión
+real la pone el formato. Al leer se busca primero el fichero del formato
+configurado y, si no existe, cualquiera de los otros, así que un pipeline a
+medio migrar sigue funcionando.
+
+Uso:
+    from almacen import escribir_tabla, leer_tabla
+
+    escribir_tabla(df, "data_interfaz/valores.csv")     # valores.parquet con FORMATO_INTERMEDIOS=parquet
+    df = leer_tabla("data_interfaz/valores.csv")
+"""
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+
+EXTENSIONES = {"csv": ".csv", "parquet": ".parquet", "arrow": ".arrow"}
+
+FORMATO = os.environ.get("FORMATO_INTERMEDIOS", "csv").lower()
+if FORMATO not in EXTENSIONES:
+    raise ValueError(f"FORMATO_INTERMEDIOS={FORMATO!r} no válido. Opciones: {', '.join(EXTENSIONES)}")
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+    except ImportError as e:
+        raise ImportError(
+            "Los formatos parquet y arrow necesitan pyarrow: pip install pyarrow "
+            "(o usa FORMATO_INTERMEDIOS=csv)"
+        ) from e
+    return pyarrow
+
+
+# =========================
+# RUTAS
+# =========================
+def ruta_formato(ruta, formato=None):
+    """La misma ruta con la extensión del formato."""
+    return os.path.splitext(ruta)[0] + EXTENSIONES[formato or FORMATO]
+
+
+def formato_de(ruta):
+    extension = os.path.splitext(ruta)[1].lower()
+    for formato, ext in EXTENSIONES.items():
+        if ext == extension:
+            return formato
+    raise ValueError(f"Extensión desconocida en {ruta}")
+
+
+def ruta_existente(ruta, formato=None):
+    """
+    Fichero que hay en disco para la tabla: primero el del formato pedido,
+    luego los demás. Si no hay ninguno devuelve la del formato pedido.
+    """
+    formato = formato or FORMATO
+    candidatas = [ruta_formato(ruta, formato)] + [
+        ruta_formato(ruta, f) for f in EXTENSIONES if f != formato
+    ]
+    return next((r for r in candidatas if os.path.exists(r)), candidatas[0])
+
+
+def buscar_tablas(carpeta, formato=None):
+    """
+    Tablas bajo la carpeta (recursivo), una por nombre sin extensión.
+    Si una tabla está en varios formatos se queda la del formato pedido.
+    """
+    formato = formato or FORMATO
+    preferencia = [formato] + [f for f in EXTENSIONES if f != formato]
+    tablas = {}
+    for f in reversed(preferencia):
+        for ruta in glob.glob(os.path.join(carpeta, "**", "*" + EXTENSIONES[f]), recursive=True):
+            tablas[os.path.splitext(ruta)[0]] = ruta
+    return sorted(tablas.values())
+
+
+# =========================
+# TIPOS COLUMNARES
+# =========================
+def _esquema_compacto(tabla):
+    """float64 → float32 (también dentro de listas) y texto → diccionario."""
+    pa = _pyarrow()
+    campos = []
+    for campo in tabla.schema:
+        tipo = campo.type
+        if pa.types.is_float64(tipo):
+            tipo = pa.float32()
+        elif pa.types.is_list(tipo) and pa.types.is_floating(tipo.value_type):
+            tipo = pa.list_(pa.float32())
+        elif pa.types.is_string(tipo) or pa.types.is_large_string(tipo):
+            tipo = pa.dictionary(pa.int32(), pa.string())
+        campos.append(campo.with_type(tipo))
+    return pa.schema(campos, metadata=tabla.schema.metadata)
+
+
+def a_arrow(df, index=False):
+    pa = _pyarrow()
+    tabla = pa.Table.from_pandas(df, preserve_index=index)
+    return tabla.cast(_esquema_compacto(tabla))
+
+
+def a_pandas(tabla, categorias=False, **opciones):
+    """
+    DataFrame con los tipos de pandas originales. Los textos vuelven como
+    object salvo que se pida categorias=True (más ligero, pero cambia el dtype).
+    """
+    if not categorias:
+        pa = _pyarrow()
+        tabla = tabla.cast(pa.schema(
+            [c.with_type(pa.string()) if pa.types.is_dictionary(c.type) else c for c in tabla.schema],
+            metadata=tabla.schema.metadata,
+        ))
+    return tabla.to_pandas(**opciones)
+
+
+# =========================
+# ESCRITURA Y LECTURA
+# =========================
+def escribir_tabla(df, ruta, formato=None, index=False, particion=None):
+    """
+    Escribe la tabla en el formato pedido (o el configurado). Devuelve la ruta real.
+
+    Con `particion` (nombre de columna) las filas se ordenan por esa columna y,
+    en los formatos columnares, cada valor va en su propio row group (parquet)
+    o record batch (arrow): leer un municipio no obliga a descomprimir el resto.
+    """
+    formato = formato or FORMATO
+    destino = ruta_formato(ruta, formato)
+    os.makedirs(os.path.dirname(destino) or ".", exist_ok=True)
+    if particion is not None:
+        df = df.sort_values(particion, kind="stable")
+
+    if formato == "csv":
+        df.to_csv(destino, index=index)
+        return destino
+
+    pa = _pyarrow()
+    tabla = a_arrow(df, index=index)
+    lotes = [tabla]
+    if particion is not None and len(df):
+        # Límites de cada valor en la tabla ya ordenada
+        grupos = pd.factorize(df[particion])[0]
+        cortes = [0] + (np.flatnonzero(np.diff(grupos)) + 1).tolist() + [len(grupos)]
+        lotes = [tabla.slice(a, b - a) for a, b in zip(cortes, cortes[1:])]
+    tmp = destino + ".tmp"
+    if formato == "parquet":
+        with pa.parquet.ParquetWriter(tmp, tabla.schema, compression="zstd") as writer:
+            for lote in lotes:
+                writer.write_table(lote)
+    else:
+        # Sin comprimir: es lo que permite mapear el fichero en memoria
+        with pa.OSFile(tmp, "wb") as f, pa.ipc.new_file(f, tabla.schema) as writer:
+            for lote in lotes:
+                writer.write_table(lote)
+    os.replace(tmp, destino)
+    return destino
+
+
+def leer_tabla(ruta, formato=None, columnas=None, index_col=None, mmap=True, categorias=False):
+    """
+    Lee una tabla intermedia buscando el fichero por formato (ver ruta_existente).
+
+    index_col solo afecta al CSV; en los formatos columnares el índice se
+    guarda con la tabla. Con arrow y mmap=True el fichero se mapea en memoria
+    en lugar de leerse entero.
+    """
+    origen = ruta_existente(ruta, formato)
+    formato_real = formato_de(origen)
+
+    if formato_real == "csv":
+        df = pd.read_csv(origen, index_col=index_col)
+        return df[columnas] if columnas is not None else df
+
+    pa = _pyarrow()
+    if formato_real == "parquet":
+        tabla = pa.parquet.read_table(origen, columns=columnas, memory_map=mmap)
+    else:
+        fuente = pa.memory_map(origen, "r") if mmap else pa.OSFile(origen, "rb")
+        tabla = pa.ipc.open_file(fuente).read_all()
+        if columnas is not None:
+            tabla = tabla.select(columnas)
+        # Sin consolidar bloques, las columnas numéricas sin nulos apuntan al mapa
+        return a_pandas(tabla, categorias=categorias, split_blocks=mmap)
+    return a_pandas(tabla, categorias=categorias)
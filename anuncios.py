@@ -0,0 +1,381 @@
+"""
+Almacén de anuncios de Idealista sin duplicados (SQLite).
+
+Las búsquedas por radio (2 km alrededor de cada municipio) se solapan, así que
+el mismo anuncio (propertyCode) aparece en los CSV de varios municipios y cada
+nueva descarga lo vuelve a añadir. Aquí cada anuncio es una fila:
+
+- clave primaria propertyCode; upsert en cada descarga
+- codigo_ine del municipio en el que se vio por primera vez (no se mueve
+  aunque lo devuelva la búsqueda de un vecino), con índice
+- latitud / longitud cuando la fuente las trae, y codigo_ine_punto: el
+  municipio en el que cae el punto (asignacion_espacial.py, -1 si cae fuera
+  de la Comunidad). Cuando existe manda sobre codigo_ine
+- apariciones: qué búsquedas de municipio lo devolvieron. Sirve para no dejar
+  sin anuncios a un pueblo cuyos anuncios ya se habían visto desde un vecino.
+  Su rowid crece con cada inserción: es la marca con la que los resúmenes
+  (resumenes_vivienda.py) leen solo lo nuevo
+- primera_vez / ultima_vez y el historial de precios (tabla aparte, la
+  rellenan triggers cuando el precio cambia)
+- modificaciones: un trigger apunta cada anuncio al que le cambia un valor
+  resumido (precio, tamaño, habitaciones, baños) o el municipio en el que
+  cuenta, con el municipio anterior. Su id crece con cada cambio: es la
+  segunda marca de los resúmenes
+
+Un anuncio que vuelve sin cambios el mismo día no se escribe: el upsert solo
+toca la fila si cambia algún campo o si es otro día (para mover ultima_vez).
+Un campo vacío en la descarga no borra el valor que ya había (las fuentes
+antiguas no traen coordenadas ni tamaño).
+
+Después de importar se asignan por coordenadas los anuncios nuevos
+(asignacion_espacial.py).
+
+Uso:
+    python anuncios.py                       # tabla limpia (limpieza_idealista.py) o datos_filtrados
+    python anuncios.py --importar otra/carpeta
+"""
+import argparse
+import csv
+import glob
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+ALMACEN_ANUNCIOS = os.path.join("data", "vivienda", "anuncios.sqlite")
+DIR_FILTRADOS = os.path.join("data", "vivienda", "datos_filtrados")
+TABLA_LIMPIA = os.path.join("data", "vivienda", "limpios", "anuncios.csv")
+
+CAMPOS = ["precio", "banos", "habitaciones", "tamano_m2", "direccion", "barrio", "url", "latitud", "longitud"]
+
+# Municipio del anuncio: el del punto si se ha asignado, el de la búsqueda si
+# no; NULL si el punto cae fuera de la Comunidad
+CODIGO_EFECTIVO = "CASE WHEN {t}codigo_ine_punto = -1 THEN NULL ELSE coalesce({t}codigo_ine_punto, {t}codigo_ine) END"
+
+ESQUEMA = f"""
+CREATE TABLE IF NOT EXISTS anuncios (
+    propertyCode TEXT PRIMARY KEY,
+    codigo_ine   INTEGER,
+    precio       REAL,
+    banos        INTEGER,
+    habitaciones INTEGER,
+    tamano_m2    REAL,
+    direccion    TEXT,
+    barrio       TEXT,
+    url          TEXT,
+    latitud      REAL,
+    longitud     REAL,
+    codigo_ine_punto INTEGER,
+    primera_vez  TEXT NOT NULL,
+    ultima_vez   TEXT NOT NULL
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS anuncios_municipio ON anuncios (codigo_ine);
+
+CREATE TABLE IF NOT EXISTS apariciones (
+    propertyCode TEXT NOT NULL,
+    codigo_ine   INTEGER NOT NULL,
+    PRIMARY KEY (propertyCode, codigo_ine)
+);
+
+CREATE TABLE IF NOT EXISTS historial_precios (
+    propertyCode TEXT NOT NULL,
+    fecha        TEXT NOT NULL,
+    precio       REAL,
+    PRIMARY KEY (propertyCode, fecha)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS precio_inicial AFTER INSERT ON anuncios
+BEGIN
+    INSERT OR REPLACE INTO historial_precios VALUES (new.propertyCode, new.primera_vez, new.precio);
+END;
+
+CREATE TRIGGER IF NOT EXISTS precio_cambiado AFTER UPDATE OF precio ON anuncios
+WHEN old.precio IS NOT new.precio
+BEGIN
+    INSERT OR REPLACE INTO historial_precios VALUES (new.propertyCode, new.ultima_vez, new.precio);
+END;
+
+CREATE TABLE IF NOT EXISTS modificaciones (
+    id              INTEGER PRIMARY KEY AUTOINCREMENT,
+    propertyCode    TEXT NOT NULL,
+    codigo_anterior INTEGER
+);
+
+CREATE TRIGGER IF NOT EXISTS anuncio_modificado
+AFTER UPDATE OF precio, tamano_m2, habitaciones, banos, codigo_ine, codigo_ine_punto ON anuncios
+WHEN old.precio IS NOT new.precio OR old.tamano_m2 IS NOT new.tamano_m2
+  OR old.habitaciones IS NOT new.habitaciones OR old.banos IS NOT new.banos
+  OR ({CODIGO_EFECTIVO.format(t="old.")}) IS NOT ({CODIGO_EFECTIVO.format(t="new.")})
+  OR (old.codigo_ine_punto IS -1) IS NOT (new.codigo_ine_punto IS -1)
+BEGIN
+    INSERT INTO modificaciones (propertyCode, codigo_anterior)
+    VALUES (new.propertyCode, {CODIGO_EFECTIVO.format(t="old.")});
+END;
+"""
+
+UPSERT = f"""
+INSERT INTO anuncios (propertyCode, codigo_ine, {", ".join(CAMPOS)}, primera_vez, ultima_vez)
+VALUES (?, ?, {", ".join("?" for _ in CAMPOS)}, ?, ?)
+ON CONFLICT (propertyCode) DO UPDATE SET
+    {", ".join(f"{c} = coalesce(excluded.{c}, anuncios.{c})" for c in CAMPOS)},
+    codigo_ine = coalesce(anuncios.codigo_ine, excluded.codigo_ine),
+    codigo_ine_punto = CASE
+        WHEN coalesce(excluded.latitud, anuncios.latitud) IS anuncios.latitud
+         AND coalesce(excluded.longitud, anuncios.longitud) IS anuncios.longitud
+        THEN anuncios.codigo_ine_punto END,
+    ultima_vez = max(anuncios.ultima_vez, excluded.ultima_vez)
+WHERE {" OR ".join(f"(excluded.{c} IS NOT NULL AND anuncios.{c} IS NOT excluded.{c})" for c in CAMPOS)}
+   OR (anuncios.codigo_ine IS NULL AND excluded.codigo_ine IS NOT NULL)
+   OR date(anuncios.ultima_vez) < date(excluded.ultima_vez)
+"""
+
+
+def _numero(valor, tipo=float):
+    """'' / 'nan' / None → None; '350000.0' → 350000.0 (o int para baños/habitaciones)."""
+    if valor is None:
+        return None
+    try:
+        numero = float(valor)
+    except (TypeError, ValueError):
+        return None
+    if numero != numero:
+        return None
+    return int(numero) if tipo is int else numero
+
+
+def _texto(valor):
+    if valor is None:
+        return None
+    valor = str(valor).strip()
+    return valor or None
+
+
+def _ahora():
+    return datetime.now().isoformat(timespec="seconds")
+
+
+class AlmacenAnuncios:
+    """
+    Conexión al almacén. Se puede usar desde varios hilos (el crawler escribe
+    con asyncio.to_thread): las escrituras van serializadas con un lock.
+    """
+
+    def __init__(self, ruta=ALMACEN_ANUNCIOS):
+        self.ruta = ruta
+        os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self.conexion = sqlite3.connect(ruta, check_same_thread=False)
+        self.conexion.execute("PRAGMA journal_mode = WAL")
+        self.conexion.execute("PRAGMA synchronous = NORMAL")
+        self.conexion.executescript(ESQUEMA)
+
+    def close(self):
+        self.conexion.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def guardar(self, filas, codigo_ine=None, fecha=None):
+        """
+        Upsert de una página (una transacción). `filas` son dicts con
+        propertyCode y los CAMPOS (como las del crawler).
+
+        Devuelve {"nuevos", "cambiados", "sin_cambios"}. Solo se escriben los
+        nuevos, los que cambian y los que no se habían visto ese día.
+        """
+        fecha = fecha or _ahora()
+        registros = {}
+        for fila in filas:
+            codigo = _texto(fila.get("propertyCode"))
+            if codigo is None:
+                continue
+            if codigo.endswith(".0"):
+                codigo = codigo[:-2]
+            # Dentro de una misma página gana la última aparición
+            registros[codigo] = (
+                codigo,
+                fila.get("codigo_ine", codigo_ine),
+                _numero(fila.get("precio")),
+                _numero(fila.get("banos"), int),
+                _numero(fila.get("habitaciones"), int),
+                _numero(fila.get("tamano_m2")),
+                _texto(fila.get("direccion")),
+                _texto(fila.get("barrio")),
+                _texto(fila.get("url")),
+                _numero(fila.get("latitud")),
+                _numero(fila.get("longitud")),
+                fecha,
+                fecha,
+            )
+        if not registros:
+            return {"nuevos": 0, "cambiados": 0, "sin_cambios": 0}
+
+        with self._lock, self.conexion:
+            existentes = self._existentes(list(registros))
+            nuevos, cambiados, escribir = 0, 0, []
+            for codigo, registro in registros.items():
+                previo = existentes.get(codigo)
+                if previo is None:
+                    nuevos += 1
+                elif any(nuevo is not None and nuevo != viejo for viejo, nuevo in zip(previo[1:-1], registro[2:-2])) \
+                        or (previo[0] is None and registro[1] is not None):
+                    cambiados += 1
+                elif previo[-1][:10] >= fecha[:10]:
+                    continue
+                escribir.append(registro)
+            # Solo se escriben los nuevos, los cambiados y los vistos otro día
+            self.conexion.executemany(UPSERT, escribir)
+            self.conexion.executemany(
+                "INSERT OR IGNORE INTO apariciones VALUES (?, ?)",
+                [(r[0], r[1]) for r in registros.values() if r[1] is not None],
+            )
+
+        return {"nuevos": nuevos, "cambiados": cambiados, "sin_cambios": len(registros) - nuevos - cambiados}
+
+    def _existentes(self, codigos):
+        """{propertyCode: (codigo_ine, *CAMPOS, ultima_vez)} de los que ya están."""
+        encontrados = {}
+        for i in range(0, len(codigos), 500):
+            lote = codigos[i:i + 500]
+            consulta = (f"SELECT propertyCode, codigo_ine, {', '.join(CAMPOS)}, ultima_vez FROM anuncios "
+                        f"WHERE propertyCode IN ({', '.join('?' * len(lote))})")
+            encontrados.update((fila[0], fila[1:]) for fila in self.conexion.execute(consulta, lote))
+        return encontrados
+
+    def asignar_municipios(self, pares):
+        """Guarda codigo_ine_punto: pares (codigo_ine_punto, propertyCode)."""
+        with self._lock, self.conexion:
+            self.conexion.executemany("UPDATE anuncios SET codigo_ine_punto = ? WHERE propertyCode = ?", pares)
+
+    def tabla(self, columnas=("propertyCode", "codigo_ine", "precio", "habitaciones", "banos")):
+        """
+        DataFrame de anuncios, uno por propertyCode, con el municipio del punto
+        si se ha asignado (los de fuera de la Comunidad quedan sin código) o
+        el de su primera búsqueda.
+        """
+        import pandas as pd
+
+        efectivo = CODIGO_EFECTIVO.format(t="")
+        propias = ", ".join(f"{efectivo} AS codigo_ine" if c == "codigo_ine" else c for c in columnas)
+        return pd.read_sql_query(f"SELECT {propias} FROM anuncios", self.conexion)
+
+    def prestados(self, columnas=("propertyCode", "codigo_ine", "precio", "habitaciones", "banos")):
+        """
+        Anuncios que devolvió la búsqueda de los municipios que se quedan sin
+        anuncios propios (todos se vieron antes desde un vecino), con el
+        código de ese municipio.
+
+        Ya cuentan en tabla() en su propio municipio, y uno puede aparecer en
+        varios municipios vecinos: sirven para los indicadores por municipio,
+        no para sumar con tabla().
+        """
+        import pandas as pd
+
+        efectivo = CODIGO_EFECTIVO.format(t="")
+        prestadas = ", ".join("p.codigo_ine" if c == "codigo_ine" else f"a.{c}" for c in columnas)
+        consulta = f"""
+            SELECT {prestadas}
+            FROM apariciones p JOIN anuncios a USING (propertyCode)
+            WHERE p.codigo_ine NOT IN (SELECT {efectivo} FROM anuncios WHERE {efectivo} IS NOT NULL)
+              AND a.codigo_ine_punto IS NOT -1
+        """
+        return pd.read_sql_query(consulta, self.conexion)
+
+    def resumen(self):
+        consulta = f"""
+            SELECT count(*), count(DISTINCT {CODIGO_EFECTIVO.format(t="")}),
+                   (SELECT count(*) FROM historial_precios)
+            FROM anuncios
+        """
+        anuncios, municipios, precios = self.conexion.execute(consulta).fetchone()
+        return {"anuncios": anuncios, "municipios": municipios, "precios": precios}
+
+
+# =========================
+# IMPORTACIÓN DE CSV
+# =========================
+def importar_csv(almacen, rutas):
+    """
+    Carga los CSV por municipio que escribe el crawler. El municipio sale de la
+    columna `municipio` o, si no la hay, del nombre del fichero; la fecha es la
+    de modificación del fichero.
+    """
+    from municipios import resolutor
+
+    resolver = resolutor()
+    totales = {"nuevos": 0, "cambiados": 0, "sin_cambios": 0}
+    for ruta in sorted(rutas):
+        with open(ruta, encoding="utf-8", newline="") as f:
+            filas = list(csv.DictReader(f))
+        if not filas:
+            continue
+        nombre = filas[0].get("municipio") or os.path.splitext(os.path.basename(ruta))[0]
+        codigo = resolver.resolver(nombre, fuente=ruta)
+        fecha = datetime.fromtimestamp(os.path.getmtime(ruta)).isoformat(timespec="seconds")
+        for clave, n in almacen.guardar(filas, codigo_ine=codigo, fecha=fecha).items():
+            totales[clave] += n
+    return totales
+
+
+def importar_tabla(almacen, ruta=TABLA_LIMPIA):
+    """
+    Carga la tabla consolidada de limpieza_idealista.py (ya trae codigo_ine).
+    Los zip se importan en su orden (fuente) y la fecha es la del zip.
+    """
+    from almacen import leer_tabla, ruta_existente
+
+    origen = ruta_existente(ruta)
+    tabla = leer_tabla(ruta).dropna(subset=["codigo_ine"])
+    carpeta = os.path.dirname(os.path.dirname(origen))
+    totales = {"nuevos": 0, "cambiados": 0, "sin_cambios": 0}
+    for fuente, df_fuente in tabla.groupby("fuente", sort=False):
+        zip_fuente = os.path.join(carpeta, f"{fuente}.zip")
+        marca = os.path.getmtime(zip_fuente if os.path.exists(zip_fuente) else origen)
+        fecha = datetime.fromtimestamp(marca).isoformat(timespec="seconds")
+        for codigo, filas in df_fuente.groupby("codigo_ine", sort=False):
+            filas = filas.drop(columns=["codigo_ine"]).astype(object).where(filas.notna(), None)
+            for clave, n in almacen.guardar(filas.to_dict("records"), codigo_ine=int(codigo), fecha=fecha).items():
+                totales[clave] += n
+    return totales
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Almacén de anuncios de Idealista")
+    parser.add_argument("--importar", nargs="*", default=None, metavar="CARPETA",
+                        help="carpetas de CSV por municipio (por defecto la tabla limpia o datos_filtrados)")
+    parser.add_argument("--tabla", default=TABLA_LIMPIA, help="tabla de limpieza_idealista.py")
+    parser.add_argument("--almacen", default=ALMACEN_ANUNCIOS)
+    parser.add_argument("--sin-asignar", action="store_true", help="no asignar municipios por coordenadas")
+    args = parser.parse_args()
+
+    from almacen import ruta_existente
+
+    inicio = time.perf_counter()
+    with AlmacenAnuncios(args.almacen) as almacen:
+        if args.importar is None and os.path.exists(ruta_existente(args.tabla)):
+            origen = ruta_existente(args.tabla)
+            totales = importar_tabla(almacen, args.tabla)
+        else:
+            rutas = [r for carpeta in args.importar or [DIR_FILTRADOS] for r in glob.glob(os.path.join(carpeta, "*.csv"))]
+            origen = f"{len(rutas)} CSV"
+            totales = importar_csv(almacen, rutas)
+        asignados, fuera = 0, []
+        if not args.sin_asignar:
+            from asignacion_espacial import FUERA, asignar_pendientes
+
+            asignados, fuera = asignar_pendientes(almacen)
+        resumen = almacen.resumen()
+    print(f"{origen} importado en {time.perf_counter() - inicio:.2f}s: "
+          f"{totales['nuevos']} nuevos, {totales['cambiados']} cambiados, {totales['sin_cambios']} sin cambios")
+    print(f"Almacén {args.almacen}: {resumen['anuncios']} anuncios únicos en {resumen['municipios']} municipios, "
+          f"{resumen['precios']} precios en el historial")
+    if asignados:
+        print(f"{asignados} anuncios asignados por coordenadas")
+    if len(fuera):
+        print(f"⚠️ {len(fuera)} anuncios nuevos fuera de todos los municipios "
+              f"(python asignacion_espacial.py los lista en {FUERA})")
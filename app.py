@@ -1,70 +1,107 @@
-from flask import Flask, render_template, request
+from flask import Flask, abort, render_template, request, jsonify
 import pandas as pd
 import os
 import json
+import math
 import plotly.graph_objs as go
 import plotly.express as px
 import plotly
-import re
-import unicodedata
-import geopandas as gpd
-
-# Rutas
-CSV_PATH = os.path.join("data_interfaz", "valores.csv")
-GEOJSON_PATH = os.path.join("static", "municipios_madrid_4326.geojson")
-
-gdf = gpd.read_file("static/municipios_madrid.geojson")
-# Transformar a WGS84
-gdf = gdf.to_crs(epsg=4326)
-# Guardar nuevo GeoJSON proyectado
-gdf.to_file("static/municipios_madrid_4326.geojson", driver="GeoJSON")
-
-# Inicializar Flask
-app = Flask(__name__)
-
-# Cargar datos
-df = pd.read_csv(CSV_PATH)
-with open(GEOJSON_PATH, encoding="utf-8") as f:
-    geojson_data = json.load(f)
-
-# Función de normalización
-def normalizar(nombre):
-    if not isinstance(nombre, str):
-        return ""
-    nombre = nombre.lower().strip()
-    nombre = unicodedata.normalize("NFD", nombre)
-    nombre = "".join(c for c in nombre if unicodedata.category(c) != "Mn")
-    match = re.search(r"\((el|la|los|las)\)$", nombre)
-    if match:
-        articulo = match.group(1)
-        nombre = re.sub(r"\s*\((el|la|los|las)\)$", "", nombre)
-        nombre = f"{articulo} {nombre}"
-    nombre = re.sub(r"\s+", " ", nombre)
-    return nombre
-
-# Añadir campo ETIQUETA_NORM al GeoJSON
-for f in geojson_data["features"]:
-    f["properties"]["ETIQUETA_NORM"] = normalizar(f["properties"]["ETIQUETA"])
-
-# Verificación de nombres
-df_verificacion = df.copy()
-df_verificacion["nombre_norm"] = df_verificacion["Nombre"].apply(normalizar)
-
-geojson_nombres = set(
-    f["properties"]["ETIQUETA_NORM"] for f in geojson_data["features"]
-)
-
-df_verificacion["coincide_con_geojson"] = df_verificacion["nombre_norm"].apply(
-    lambda x: "✅ SÍ" if x in geojson_nombres else "❌ NO"
-)
-
-df_verificacion[["Nombre", "nombre_norm", "coincide_con_geojson"]].to_csv(
-    "external_data/verificacion_nombres.csv", index=False
-)
+
+from snapshot import SNAPSHOT_PATH, cargar_snapshot
+from motor_recomendador import MotorRecomendador, preferencias_desde_respuestas
+from similares import DIMENSIONES, IndiceSimilares, K_SIMILARES
+from cache_figuras import CacheFiguras
+from topologia import nivel_para_zoom
+from metricas import METRICAS, fase, instrumentar
+from historico import CuboHistorico
+from entrega import Estaticos, paquete, registrar, responder
+
+# Inicializar Flask (importar el módulo no carga datos ni escribe nada:
+# eso lo hace crear_app). /static lo sirve entrega.py (variantes comprimidas,
+# ETag y 304)
+app = Flask(__name__, static_folder=None)
+estaticos = Estaticos()
+registrar(app, estaticos)
+
+# Estado de servicio, de solo lectura una vez cargado (ver cargar_datos)
+snapshot = df = geometrias = proximidad = motor = similares = cache_figuras = historico = None
+GEOJSON_CODIGOS = frozenset()
+ZOOM_INICIAL = 8
+
+# Tiempos por ruta y por fase en /metrics (y perfilador con PERFILAR_LENTAS_MS)
+instrumentar(app)
+
+
+def cargar_datos(ruta=SNAPSHOT_PATH):
+    """Carga el snapshot de servicio (generado con `python snapshot.py`) y los índices."""
+    global snapshot, df, geometrias, proximidad, motor, similares, cache_figuras, historico, GEOJSON_CODIGOS
+
+    snapshot = cargar_snapshot(ruta)
+    df = snapshot["valores"]
+    GEOJSON_CODIGOS = frozenset(snapshot["geojson_codigos"])
+
+    # Niveles de geometría simplificada (por zoom) y separados por clúster
+    geometrias = snapshot["geometrias"]
+
+    # Centroides y distancias entre municipios (filtro por distancia al trabajo)
+    proximidad = snapshot["proximidad"]
+
+    # Matrices normalizadas por clúster para el recomendador
+    motor = MotorRecomendador(df, proximidad=proximidad)
+
+    # Vecinos por perfil de las cinco dimensiones ("municipios parecidos")
+    similares = IndiceSimilares(df)
+
+    # Figuras ya serializadas por ruta, parámetros y versión del snapshot
+    cache_figuras = CacheFiguras(
+        snapshot["version"], max_entradas=int(os.environ.get("CACHE_FIGURAS_MAX", 512))
+    )
+
+    # Cubo municipio × indicador × año (python historico.py), mapeado en memoria
+    try:
+        historico = CuboHistorico.cargar()
+    except FileNotFoundError:
+        historico = None
+
+    # Hashes y variantes comprimidas de static/ (python entrega.py)
+    estaticos.cargar()
+
+
+def crear_app(ruta=SNAPSHOT_PATH, precalentar=None):
+    """
+    Devuelve la app con los datos cargados (una sola vez por proceso).
+
+    Con varios trabajadores (servidor.py) se llama en el proceso principal
+    antes del fork, así que todos comparten las páginas de los datos.
+    """
+    if snapshot is None:
+        cargar_datos(ruta)
+        if precalentar is None:
+            precalentar = os.environ.get("PRECALENTAR_FIGURAS") == "1"
+        if precalentar:
+            precalentar_figuras()
+    return app
+
+
+def metricas_cache_figuras():
+    if cache_figuras is None:
+        return []
+    estadisticas = cache_figuras.estadisticas()
+    lineas = []
+    for campo in ("aciertos", "fallos", "expulsiones"):
+        lineas.append(f"# TYPE vivienda_cache_figuras_{campo}_total counter")
+        lineas.append(f"vivienda_cache_figuras_{campo}_total {estadisticas[campo]}")
+    return lineas
+
+
+METRICAS.recolectores.append(metricas_cache_figuras)
 
 # Etiquetas para clústeres
 CLUSTER_LABELS = {"1.0": "Poca población", "2.0": "Media población", "3.0": "Mucha población"}
 
+# Conjunto con el que se compara un municipio en estudio_municipio
+COMPARACIONES = ("todos", "cluster")
+
 # ---------------------- RUTAS -------------------------
 
 @app.route("/")
@@ -86,27 +123,32 @@ def estudio_cluster():
         )
 
     # =========================
-    # POST → clúster elegido
+    # POST → clúster elegido (mapa y municipios en /api/figuras/cluster)
     # =========================
     cluster = request.form.get("cluster")
+    with fase("render"):
+        return render_template(
+            "resultado_cluster.html",
+            cluster=CLUSTER_LABELS.get(cluster, cluster),
+            cluster_id=cluster,
+            niveles=[{"nivel": n["nivel"], "zoom_min": n["zoom_min"]} for n in geometrias["niveles"]],
+            nivel_inicial=nivel_para_zoom(ZOOM_INICIAL, geometrias["niveles"]),
+        )
+
 
+def filtrar_cluster(cluster):
     # 1️⃣ Filtrar por clúster
     df_cluster = df[df["grupo"].astype(str) == cluster].copy()
 
-    # 2️⃣ Normalizar nombres
-    df_cluster["nombre_norm"] = df_cluster["Nombre"].apply(normalizar)
-
-    # 3️⃣ Coincidencia con GeoJSON
-    geojson_nombres = {
-        f["properties"]["ETIQUETA_NORM"]
-        for f in geojson_data["features"]
-    }
-
+    # 2️⃣ Coincidencia con GeoJSON
     df_cluster = df_cluster[
-        df_cluster["nombre_norm"].isin(geojson_nombres)
+        df_cluster["codigo_ine"].isin(GEOJSON_CODIGOS)
     ].copy()
+    # Enteros de Python (object): plotly los serializa como lista normal, que
+    # es lo que casa con properties.codigo_ine en cualquier versión de plotly.js
+    df_cluster["codigo_ine"] = df_cluster["codigo_ine"].astype(int).astype(object)
 
-    # 4️⃣ Ranking por TOTAL
+    # 3️⃣ Ranking por TOTAL
     df_cluster["total"] = pd.to_numeric(df_cluster["total"], errors="coerce")
     df_cluster = df_cluster.dropna(subset=["total"])
 
@@ -115,58 +157,66 @@ def estudio_cluster():
     ).reset_index(drop=True)
 
     df_cluster["ranking"] = df_cluster.index + 1
+    return df_cluster
 
-    # =========================
-    # MAPA: SOLO LÍNEAS + HOVER NOMBRE
-    # =========================
-    fig = px.choropleth_mapbox(
-        df_cluster,
-        geojson=geojson_data,
-        locations="nombre_norm",
-        featureidkey="properties.ETIQUETA_NORM",
-        color_discrete_sequence=["rgba(0,0,0,0)"],
-        center={"lat": 40.4168, "lon": -3.7038},
-        zoom=8,
-        hover_name="Nombre"
-    )
 
-    fig.update_traces(
-        marker_line_width=1,
-        marker_line_color="black"
-    )
+GEOMETRIAS_VACIAS = b'{"type":"FeatureCollection","features":[]}'
 
-    fig.update_layout(
-        mapbox_style="carto-positron",
-        margin={"r": 0, "t": 0, "l": 0, "b": 0}
-    )
 
+def geometrias_cluster(cluster, nivel):
+    """FeatureCollection (JSON en bytes) con solo los municipios del clúster en ese nivel."""
+    return geometrias["por_cluster"].get(cluster, {}).get(nivel, GEOMETRIAS_VACIAS)
+
+
+def crear_mapa_cluster(df_cluster, cluster):
     # =========================
-    # Render
+    # MAPA: SOLO LÍNEAS + HOVER NOMBRE
     # =========================
-    return render_template(
-        "resultado_cluster.html",
-        cluster=CLUSTER_LABELS.get(cluster, cluster),
-        datos=df_cluster.to_dict(orient="records"),
-        grafico=fig.to_json()
-    )
+    nivel = nivel_para_zoom(ZOOM_INICIAL, geometrias["niveles"])
+    with fase("figura"):
+        fig = px.choropleth_mapbox(
+            df_cluster,
+            geojson=json.loads(geometrias_cluster(cluster, nivel)),
+            locations="codigo_ine",
+            featureidkey="properties.codigo_ine",
+            color_discrete_sequence=["rgba(0,0,0,0)"],
+            center={"lat": 40.4168, "lon": -3.7038},
+            zoom=ZOOM_INICIAL,
+            hover_name="Nombre"
+        )
 
+        fig.update_traces(
+            marker_line_width=1,
+            marker_line_color="black"
+        )
 
+        fig.update_layout(
+            mapbox_style="carto-positron",
+            margin={"r": 0, "t": 0, "l": 0, "b": 0}
+        )
+
+    with fase("serializar"):
+        return fig.to_json()
 
-DATA_PATH = os.path.join("data_interfaz", "valores.csv")
-df = pd.read_csv(DATA_PATH)
 
-def crear_boxplot_municipio(df, datos):
+def crear_boxplot_municipio(estadisticas, datos):
     dimensiones = ["educacion", "salud", "transporte", "economia", "housing"]
     fig = go.Figure()
 
     for dim in dimensiones:
-        # Boxplot del conjunto
-        fig.add_trace(go.Box(
-            y=df[dim],
-            name=dim.capitalize(),
-            boxpoints=False,
-            marker_color="lightgray"
-        ))
+        # Boxplot del conjunto a partir de los cuartiles precalculados
+        caja = estadisticas[dim]
+        if caja is not None:
+            fig.add_trace(go.Box(
+                x=[dim.capitalize()],
+                q1=[caja["q1"]],
+                median=[caja["mediana"]],
+                q3=[caja["q3"]],
+                lowerfence=[caja["bigote_inf"]],
+                upperfence=[caja["bigote_sup"]],
+                name=dim.capitalize(),
+                marker_color="lightgray"
+            ))
 
         # Punto del municipio seleccionado
         fig.add_trace(go.Scatter(
@@ -187,6 +237,44 @@ def crear_boxplot_municipio(df, datos):
 
     return json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
 
+def crear_radar_municipio(datos):
+    labels = ["educacion", "salud", "transporte", "economia", "housing"]
+    radar = go.Figure()
+    radar.add_trace(go.Scatterpolar(
+        r=[datos[l] for l in labels],
+        theta=[l.capitalize() for l in labels],
+        fill="toself"
+    ))
+    radar.update_layout(
+        polar=dict(radialaxis=dict(range=[0, 1])),
+        title="Perfil del municipio"
+    )
+
+    return json.dumps(radar, cls=plotly.utils.PlotlyJSONEncoder)
+
+def paquete_cluster(cluster):
+    """JSON {"figura": mapa, "datos": municipios con su ranking} del clúster."""
+    with fase("filtrar"):
+        df_cluster = filtrar_cluster(cluster)
+    figura = crear_mapa_cluster(df_cluster, cluster)
+    with fase("registros"):
+        datos = df_cluster.to_json(orient="records", force_ascii=False)
+    return paquete(f'{{"figura":{figura},"datos":{datos}}}'.encode(), snapshot["version"])
+
+
+def figuras_municipio(datos, comparar="todos"):
+    # Radar + boxplot comparativo (con todos los municipios o con su clúster)
+    if comparar == "cluster":
+        estadisticas = snapshot["estadisticas"]["por_cluster"][str(datos["grupo"])]
+    else:
+        estadisticas = snapshot["estadisticas"]["global"]
+    with fase("figura"):
+        return crear_radar_municipio(datos), crear_boxplot_municipio(estadisticas, datos)
+
+def paquete_municipio(datos, comparar):
+    radar, boxplot = figuras_municipio(datos, comparar)
+    return paquete(f'{{"radar":{radar},"boxplot":{boxplot}}}'.encode(), snapshot["version"])
+
 def crear_grafico_resultados(resultados):
     nombres = [r["Nombre"] for r in resultados]
     dimensiones = ["educacion", "salud", "transporte", "economia", "housing"]
@@ -215,118 +303,165 @@ def crear_grafico_resultados(resultados):
 @app.route("/recomendador", methods=["GET", "POST"])
 def recomendador():
     if request.method == "GET":
-        return render_template("recomendador.html")
+        municipios = sorted(
+            (proximidad.nombres[i], int(c)) for i, c in enumerate(proximidad.codigos)
+        )
+        return render_template("recomendador.html", municipios=municipios)
 
-    # =========================
-    # 1️⃣ POBLACIÓN → CLÚSTER
-    # =========================
     poblacion = request.form.get("cluster", "media")
-
-    if poblacion == "poca":
-        cluster = 1
-    elif poblacion == "mucha":
-        cluster = 3
-    else:
-        cluster = 2
-
-    # =========================
-    # 2️⃣ PREFERENCIAS
-    # =========================
-    educacion = int(request.form.get("educacion", 3))
-    salud = int(request.form.get("salud", 3))
-    transporte = int(request.form.get("transporte", 3))
-    economia = int(request.form.get("economia", 3))
-    housing = int(request.form.get("housing", 3))
-    ocio = int(request.form.get("ocio", 3))
     entorno = request.form.get("entorno", "mixto")
+    try:
+        municipios_recomendados, cluster, trabajo = recomendar(request.form)
+    except (TypeError, ValueError) as e:
+        abort(400, description=str(e))
 
-    # =========================
-    # 3️⃣ AJUSTES
-    # =========================
-    if entorno == "urbano":
-        transporte += 1
-        economia += 1
-    elif entorno == "natural":
-        housing += 1
-        salud += 1
-
-    transporte += ocio // 2
-    economia += ocio // 2
-
-    preferencias = {
-        "educacion": educacion,
-        "salud": salud,
-        "transporte": transporte,
-        "economia": economia,
-        "housing": housing,
-    }
-
-    # =========================
-    # 4️⃣ FILTRADO REAL POR CLÚSTER (CLAVE)
-    # =========================
-    df_local = df.loc[df["grupo"].astype(int) == int(cluster)].copy()
-
-    if df_local.empty:
-        raise ValueError("df_local está vacío: problema con el filtro por clúster")
-
-    # =========================
-    # 5️⃣ NORMALIZACIÓN (SOLO df_local)
-    # =========================
-    for dim in preferencias:
-        min_val = df_local[dim].min()
-        max_val = df_local[dim].max()
+    # El gráfico se pide aparte (/api/figuras/recomendador) con las mismas respuestas
+    with fase("render"):
+        return render_template(
+            "resultados.html",
+            resultados=municipios_recomendados,
+            respuestas=request.form.to_dict(),
+            cluster=cluster,
+            poblacion=poblacion,
+            entorno=entorno,
+            trabajo=trabajo
+        )
 
-        if max_val != min_val:
-            df_local[f"{dim}_norm"] = (df_local[dim] - min_val) / (max_val - min_val)
-        else:
-            df_local[f"{dim}_norm"] = 0.0
 
+def recomendar(respuestas):
+    """(municipios recomendados, clúster, trabajo) para las respuestas del formulario."""
     # =========================
-    # 6️⃣ ÍNDICE PERSONALIZADO
+    # 1️⃣ RESPUESTAS → CLÚSTER, PREFERENCIAS Y RADIO
     # =========================
-    suma_pesos = sum(preferencias.values()) or 1.0
-
-    df_local["indice_personalizado"] = 0.0
-    for dim, peso in preferencias.items():
-        df_local["indice_personalizado"] += (
-            peso / suma_pesos
-        ) * df_local[f"{dim}_norm"]
+    cluster, preferencias = preferencias_desde_respuestas(respuestas)
+    # Un trabajo o un radio no válidos son un error (400), como en /api/recomendador
+    codigos = motor.permitidos(respuestas)
+    trabajo = None
+    if codigos is not None:
+        trabajo = {
+            "Nombre": proximidad.nombres[proximidad.indice(respuestas["trabajo"])],
+            "radio_km": float(respuestas["radio_km"]),
+        }
 
     # =========================
-    # 7️⃣ SELECCIÓN DE MUNICIPIOS
+    # 2️⃣ SELECCIÓN DE MUNICIPIOS (motor precalculado)
     # =========================
-    orden_bloques = sorted(preferencias, key=preferencias.get, reverse=True)
+    with fase("puntuar"):
+        return motor.recomendar(cluster, preferencias, codigos), cluster, trabajo
+
+
+def paquete_recomendador(respuestas):
+    municipios_recomendados = recomendar(respuestas)[0]
+    with fase("figura"):
+        grafico = crear_grafico_resultados(municipios_recomendados)
+    return paquete(grafico.encode(), snapshot["version"])
+
+
+# ---------------------- FIGURAS -------------------------
+# Datos de los gráficos por GET: se comprimen una vez al entrar en la caché de
+# figuras y se revalidan con ETag (304 en las visitas repetidas)
+
+@app.route("/api/figuras/cluster")
+def api_figura_cluster():
+    """Mapa y municipios (con su ranking) de resultado_cluster.html. Parámetro: cluster."""
+    cluster = request.args.get("cluster", "")
+    # Sin construir (ni guardar en la caché) figuras de clústeres que no existen
+    if cluster not in geometrias["por_cluster"]:
+        return jsonify({"error": f"Clúster desconocido: {cluster}"}), 404
+    return responder(*cache_figuras.obtener("figura_cluster", (cluster,), lambda: paquete_cluster(cluster)))
+
+
+@app.route("/api/figuras/municipio")
+def api_figura_municipio():
+    """Radar y boxplot de resultado_municipio.html. Parámetros: municipio (nombre) y comparar."""
+    municipio = request.args.get("municipio", "")
+    comparar = request.args.get("comparar", "todos")
+    # Antes de la clave de caché: cada valor distinto sería una entrada más en la LRU
+    if comparar not in COMPARACIONES:
+        return jsonify({"error": f"comparar debe ser uno de: {', '.join(COMPARACIONES)}"}), 400
+    with fase("filtrar"):
+        filas = df[df["Nombre"] == municipio]
+    if filas.empty:
+        return jsonify({"error": f"Municipio desconocido: {municipio}"}), 404
+    return responder(*cache_figuras.obtener(
+        "figura_municipio", (municipio, comparar), lambda: paquete_municipio(filas.iloc[0].to_dict(), comparar)
+    ))
 
-    municipios_recomendados = []
-    ya_elegidos = set()
 
-    for bloque in orden_bloques:
-        mejor = (
-            df_local
-            .sort_values(by=bloque, ascending=False)
-            .loc[~df_local["Nombre"].isin(ya_elegidos)]
-        )
-
-        if not mejor.empty:
-            municipio = mejor.iloc[0].to_dict()
-            municipio["destaca_en"] = bloque
-            municipio["cluster"] = cluster
-            municipios_recomendados.append(municipio)
-            ya_elegidos.add(municipio["Nombre"])
-
-        if len(municipios_recomendados) == 3:
-            break
-
-    grafico = crear_grafico_resultados(municipios_recomendados)
-
-    return render_template(
-        "resultados.html",
-        resultados=municipios_recomendados,
-        grafico=grafico,
-        cluster=cluster,
-        poblacion=poblacion,
-        entorno=entorno
-    )
+@app.route("/api/figuras/recomendador")
+def api_figura_recomendador():
+    """Gráfico de resultados.html. Parámetros: los mismos campos que el formulario del recomendador."""
+    respuestas = request.args.to_dict()
+    try:
+        return responder(*cache_figuras.obtener(
+            "figura_recomendador", tuple(sorted(respuestas.items())), lambda: paquete_recomendador(respuestas)
+        ))
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route("/api/recomendador", methods=["POST"])
+def api_recomendador():
+    """
+    Recomendación por lotes para análisis what-if.
+
+    Cuerpo: {"perfiles": [{"cluster": "media", "educacion": 4, ...}, ...], "k": 5}
+    Cada perfil usa los mismos campos que el formulario del recomendador.
+    """
+    cuerpo = request.get_json(silent=True) or {}
+    perfiles = cuerpo.get("perfiles") if isinstance(cuerpo, dict) else None
+    if not isinstance(perfiles, list):
+        return jsonify({"error": "Se esperaba una lista 'perfiles'"}), 400
+
+    try:
+        with fase("puntuar"):
+            resultados = motor.recomendar_lote(perfiles, k=int(cuerpo.get("k", 0)))
+    except (TypeError, ValueError, AttributeError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    with fase("serializar"):
+        return jsonify({"version": snapshot["version"], "resultados": resultados})
+
+
+@app.route("/api/proximidad")
+def api_proximidad():
+    """
+    Municipios cercanos a un municipio o a un punto.
+
+    Parámetros: municipio (código INE) o lon y lat, y radio_km o k.
+    Con un municipio de origen, k cuenta el propio municipio (a 0 km).
+    """
+    if "municipio" in request.args:
+        origen = request.args.get("municipio", type=int)
+        if origen is None:
+            return jsonify({"error": "municipio debe ser un código INE"}), 400
+    elif "lon" in request.args and "lat" in request.args:
+        origen = (request.args.get("lon", type=float), request.args.get("lat", type=float))
+        if None in origen:
+            return jsonify({"error": "lon y lat deben ser números"}), 400
+    else:
+        return jsonify({"error": "Se esperaba 'municipio' o 'lon' y 'lat'"}), 400
+
+    radio = request.args.get("radio_km", type=float)
+    k = request.args.get("k", type=int)
+    if (radio is None) == (k is None):
+        return jsonify({"error": "Se esperaba 'radio_km' o 'k' (solo uno)"}), 400
+    # Como en el recomendador (filtro_desde_respuestas): NaN devolvería todos
+    if radio is not None and not (math.isfinite(radio) and radio >= 0):
+        return jsonify({"error": "radio_km debe ser un número no negativo"}), 400
+    if k is not None and k < 0:
+        return jsonify({"error": "k no puede ser negativo"}), 400
+
+    try:
+        indices, distancias = proximidad.radio(origen, radio) if radio is not None else proximidad.vecinos(origen, k)
+    except KeyError as e:
+        return jsonify({"error": e.args[0]}), 404
+
+    return jsonify({
+        "version": snapshot["version"],
+        "origen": origen,
+        "municipios": proximidad.registros(indices, distancias),
+    })
 
 
 @app.route("/estudio_municipio", methods=["GET", "POST"])
@@ -336,32 +471,192 @@ def estudio_municipio():
         return render_template("estudio_municipio.html", municipios=nombres)
 
     municipio = request.form.get("municipio")
-    datos = df[df["Nombre"] == municipio].iloc[0].to_dict()
+    comparar = request.form.get("comparar", "todos")
+    if comparar not in COMPARACIONES:
+        abort(400, description=f"comparar debe ser uno de: {', '.join(COMPARACIONES)}")
+    with fase("filtrar"):
+        filas = df[df["Nombre"] == municipio]
+    if filas.empty:
+        abort(404, description=f"Municipio desconocido: {municipio}")
+    datos = filas.iloc[0].to_dict()
+
+    # Municipios con el perfil más parecido (de su clúster si se compara con él)
+    try:
+        with fase("similares"):
+            parecidos = similares.registros(
+                *similares.vecinos(datos["codigo_ine"], mismo_grupo=comparar == "cluster")
+            )
+    except (KeyError, TypeError, ValueError):
+        parecidos = []
+
+    with fase("render"):
+        return render_template(
+            "resultado_municipio.html",
+            datos=datos,
+            comparar=comparar,
+            parecidos=parecidos
+        )
 
-    # Radar
-    labels = ["educacion", "salud", "transporte", "economia", "housing"]
-    radar = go.Figure()
-    radar.add_trace(go.Scatterpolar(
-        r=[datos[l] for l in labels],
-        theta=[l.capitalize() for l in labels],
-        fill="toself"
-    ))
-    radar.update_layout(
-        polar=dict(radialaxis=dict(range=[0, 1])),
-        title="Perfil del municipio"
+
+def codigo_municipio(municipio):
+    """Código INE a partir de un código o de un nombre de valores.csv (None si no existe)."""
+    if municipio.isdigit():
+        return int(municipio)
+    coincidencias = df.loc[df["Nombre"] == municipio, "codigo_ine"].dropna()
+    return None if coincidencias.empty else int(coincidencias.iloc[0])
+
+
+@app.route("/api/similares")
+def api_similares():
+    """
+    Municipios con el perfil más parecido.
+
+    Parámetros: municipio (código INE o nombre), k, mismo_grupo=1 y,
+    opcionalmente, un peso por dimensión (p. ej. educacion=2&housing=0).
+    """
+    municipio = codigo_municipio(request.args.get("municipio", ""))
+    if municipio is None:
+        return jsonify({"error": f"Municipio desconocido: {request.args.get('municipio', '')}"}), 404
+
+    k = request.args.get("k", K_SIMILARES, type=int)
+    if k < 1:
+        return jsonify({"error": "k debe ser al menos 1"}), 400
+
+    pesos = {d: request.args[d] for d in DIMENSIONES if d in request.args}
+    try:
+        filas, distancias = similares.vecinos(
+            municipio,
+            k=k,
+            mismo_grupo=request.args.get("mismo_grupo", "0") in ("1", "true", "si"),
+            pesos=pesos,
+            anio=request.args.get("anio", type=int),
+        )
+    except KeyError as e:
+        return jsonify({"error": e.args[0]}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify({
+        "version": snapshot["version"],
+        "municipio": int(municipio),
+        "similares": similares.registros(filas, distancias),
+    })
+
+@app.route("/api/historico")
+def api_historico():
+    """Indicadores del cubo histórico con su primer y último año."""
+    if historico is None:
+        return jsonify({"error": "No hay cubo histórico. Ejecuta: python historico.py"}), 503
+    return jsonify({"anios": [int(historico.anios[0]), int(historico.anios[-1])],
+                    "indicadores": historico.catalogo()})
+
+
+@app.route("/api/historico/serie")
+def api_historico_serie():
+    """
+    Evolución de un municipio en un indicador.
+
+    Parámetros: municipio (código INE o nombre) e indicador (p. ej.
+    transporte/paradas_bus, o puntuacion/transporte si historico.py encontró
+    valores_anuales). Cada año trae el valor, la variación con el año anterior
+    con dato y el puesto entre todos.
+    """
+    if historico is None:
+        return jsonify({"error": "No hay cubo histórico. Ejecuta: python historico.py"}), 503
+    municipio = codigo_municipio(request.args.get("municipio", ""))
+    if municipio is None:
+        return jsonify({"error": f"Municipio desconocido: {request.args.get('municipio', '')}"}), 404
+    indicador = request.args.get("indicador", "")
+    try:
+        serie = historico.serie(municipio, indicador)
+    except KeyError as e:
+        return jsonify({"error": e.args[0]}), 404
+
+    return jsonify({
+        "municipio": municipio,
+        "Nombre": historico.nombres.get(municipio),
+        "indicador": indicador,
+        "serie": historico.registros_serie(*serie),
+    })
+
+
+@app.route("/api/historico/ranking")
+def api_historico_ranking():
+    """
+    Municipios que más puestos suben y bajan en un indicador entre dos años.
+
+    Parámetros: indicador, desde, hasta y k (por cada lado, 10 por defecto).
+    """
+    if historico is None:
+        return jsonify({"error": "No hay cubo histórico. Ejecuta: python historico.py"}), 503
+    indicador = request.args.get("indicador", "")
+    desde = request.args.get("desde", type=int)
+    hasta = request.args.get("hasta", type=int)
+    if desde is None or hasta is None:
+        return jsonify({"error": "Se esperaban los años 'desde' y 'hasta'"}), 400
+    k = request.args.get("k", 10, type=int)
+    if k < 1:
+        return jsonify({"error": "k debe ser al menos 1"}), 400
+    try:
+        cambios = historico.cambios_ranking(indicador, desde, hasta, k=k)
+    except KeyError as e:
+        return jsonify({"error": e.args[0]}), 404
+
+    return jsonify({
+        "indicador": indicador,
+        "desde": desde,
+        "hasta": hasta,
+        "municipios": historico.registros_ranking(*cambios),
+    })
+
+
+@app.route("/api/geometrias")
+def api_geometrias():
+    """
+    Geometrías de un clúster al nivel de simplificación adecuado.
+
+    Parámetros: cluster (p. ej. "2.0") y zoom del mapa, o directamente nivel.
+    """
+    cluster = request.args.get("cluster", "")
+    if cluster not in geometrias["por_cluster"]:
+        return jsonify({"error": f"Clúster desconocido: {cluster}"}), 404
+    if "nivel" in request.args:
+        nivel = request.args.get("nivel", type=int)
+        if nivel not in geometrias["por_cluster"][cluster]:
+            return jsonify({"error": f"Nivel de geometría no disponible: {request.args['nivel']}"}), 400
+    else:
+        nivel = nivel_para_zoom(request.args.get("zoom", ZOOM_INICIAL, type=float), geometrias["niveles"])
+
+    # Ya serializadas y comprimidas en el snapshot: se envían tal cual
+    return responder(
+        geometrias_cluster(cluster, nivel),
+        f"{snapshot['version']}-{cluster}-{nivel}",
+        geometrias["comprimidas"].get(cluster, {}).get(nivel),
+        cabeceras={"X-Nivel-Geometria": str(nivel)},
     )
 
-    radar_json = json.dumps(radar, cls=plotly.utils.PlotlyJSONEncoder)
 
-    # Boxplot comparativo
-    boxplot_json = crear_boxplot_municipio(df, datos)
+@app.route("/api/cache_figuras")
+def api_cache_figuras():
+    return jsonify(cache_figuras.estadisticas())
+
+
+def precalentar_figuras():
+    """Construye las figuras de todos los clústeres y municipios."""
+    tareas = []
+    for c in df["grupo"].dropna().unique():
+        cluster = str(c)
+        tareas.append(("figura_cluster", (cluster,), lambda cluster=cluster: paquete_cluster(cluster)))
+    for _, fila in df.dropna(subset=["Nombre"]).drop_duplicates("Nombre").iterrows():
+        datos = fila.to_dict()
+        for comparar in COMPARACIONES:
+            tareas.append((
+                "figura_municipio", (datos["Nombre"], comparar),
+                lambda datos=datos, comparar=comparar: paquete_municipio(datos, comparar)
+            ))
+    cache_figuras.precalentar(tareas)
 
-    return render_template(
-        "resultado_municipio.html",
-        datos=datos,
-        radar=radar_json,
-        boxplot=boxplot_json
-    )
 
 if __name__ == "__main__":
-    app.run(debug=True, port=5002)
+    # Desarrollo; en producción: python servidor.py
+    crear_app().run(debug=True, port=5002)
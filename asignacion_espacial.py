@@ -0,0 +1,242 @@
+"""
+Asignación de anuncios a su municipio real por coordenadas.
+
+El crawler busca en un círculo de 2 km alrededor del centro de cada
+municipio y atribuye los anuncios a ese municipio, así que los que están
+cerca de la frontera (o fuera de la Comunidad) caen en el municipio
+equivocado. Aquí cada anuncio con coordenadas se cruza con los polígonos de
+data/muni2024/muni2024.shp:
+
+- índice espacial STRtree sobre los polígonos (en EPSG:4326, como las
+  coordenadas de Idealista) y una malla regular precalculada con él: cada
+  celda está dentro de un municipio, fuera de todos o en frontera con sus
+  polígonos candidatos. Todo se cachea en disco por huella del shapefile
+- consulta vectorizada: la celda de cada punto sale con aritmética de numpy
+  y solo los puntos de celdas de frontera pasan por contains_xy sobre los
+  polígonos preparados (los que caen en la frontera exacta se resuelven con
+  intersects_xy)
+- los anuncios fuera de todos los polígonos se marcan con -1 y se listan
+
+El resultado va a anuncios.codigo_ine_punto en el almacén (anuncios.py), que
+tiene prioridad sobre el municipio de la búsqueda. Solo se procesan los
+anuncios con coordenadas que aún no tienen asignación.
+
+Uso:
+    python asignacion_espacial.py [--almacen data/vivienda/anuncios.sqlite]
+"""
+import argparse
+import hashlib
+import os
+import pickle
+import time
+
+import numpy as np
+import pandas as pd
+
+SHAPEFILE = os.path.join("data", "muni2024", "muni2024.shp")
+CACHE_INDICE = os.path.join("data_interfaz", "indice_municipios.pkl")
+FUERA = os.path.join("data_interfaz", "anuncios_fuera_de_madrid.csv")
+
+FUERA_DE_MADRID = -1
+FRONTERA = -2
+# Celdas por lado de la malla (~120 m en la Comunidad de Madrid)
+CELDAS_MALLA = 512
+VERSION_CACHE = 2
+
+
+def huella_shapefile(ruta=SHAPEFILE):
+    """Hash de los ficheros del shapefile (.shp, .shx, .dbf, .prj)."""
+    base = os.path.splitext(ruta)[0]
+    h = hashlib.sha256(str(VERSION_CACHE).encode())
+    for extension in (".shp", ".shx", ".dbf", ".prj"):
+        if os.path.exists(base + extension):
+            with open(base + extension, "rb") as f:
+                h.update(f.read())
+    return h.hexdigest()
+
+
+class IndiceMunicipios:
+    """
+    Polígonos municipales en EPSG:4326 con su STRtree y códigos INE.
+
+    Además guarda una malla regular sobre la caja de la Comunidad: cada celda
+    se clasifica una vez (dentro de un único municipio, fuera de todos o en
+    frontera con sus polígonos candidatos). Un punto se lleva a su celda con
+    aritmética de numpy, y solo los de celdas de frontera pasan por el test
+    punto en polígono.
+    """
+
+    def __init__(self, codigos, geometrias, celdas=CELDAS_MALLA):
+        import shapely
+
+        self.codigos = np.asarray(codigos, dtype=np.int32)
+        self.arbol = shapely.STRtree(geometrias)
+        self._preparar()
+        self._construir_malla(celdas)
+
+    def _preparar(self):
+        import shapely
+
+        self.geometrias = self.arbol.geometries
+        shapely.prepare(self.geometrias)
+
+    def _construir_malla(self, celdas):
+        import shapely
+
+        x0, y0, x1, y1 = shapely.total_bounds(self.geometrias)
+        self.origen = (x0, y0)
+        self.paso = ((x1 - x0) / celdas, (y1 - y0) / celdas)
+        self.celdas = celdas
+
+        ix, iy = np.meshgrid(np.arange(celdas), np.arange(celdas))
+        ix, iy = ix.ravel(), iy.ravel()
+        cajas = shapely.box(x0 + ix * self.paso[0], y0 + iy * self.paso[1],
+                            x0 + (ix + 1) * self.paso[0], y0 + (iy + 1) * self.paso[1])
+        # 1️⃣ Polígonos cuya caja toca cada celda (pares ordenados por celda)
+        celda, poligono = self.arbol.query(cajas)
+        # 2️⃣ Celdas enteras dentro de un polígono: todo su contenido es de ese municipio
+        llena = shapely.contains(self.geometrias[poligono], cajas[celda])
+
+        self.malla = np.full(celdas * celdas, FRONTERA, dtype=np.int32)
+        self.malla[np.setdiff1d(np.arange(celdas * celdas), celda)] = FUERA_DE_MADRID
+        self.malla[celda[llena][::-1]] = self.codigos[poligono[llena][::-1]]
+        # 3️⃣ Candidatos de las celdas de frontera en formato CSR
+        frontera = self.malla[celda] == FRONTERA
+        self.candidatos = poligono[frontera].astype(np.int32)
+        conteo = np.bincount(celda[frontera], minlength=celdas * celdas)
+        self.inicio = np.concatenate([[0], np.cumsum(conteo)]).astype(np.int64)
+
+    def __getstate__(self):
+        # Las geometrías preparadas no se serializan; el árbol y la malla sí
+        estado = self.__dict__.copy()
+        del estado["geometrias"]
+        return estado
+
+    def __setstate__(self, estado):
+        self.__dict__.update(estado)
+        self._preparar()
+
+    @classmethod
+    def desde_shapefile(cls, ruta=SHAPEFILE):
+        import geopandas as gpd
+
+        gdf = gpd.read_file(ruta).to_crs("EPSG:4326")
+        # Mismo código que geometrias-municipios.py: 28 + CMUN
+        return cls(28000 + gdf["CMUN"].astype(int).to_numpy(), np.asarray(gdf.geometry))
+
+    def asignar(self, longitud, latitud):
+        """Código INE de cada punto (FUERA_DE_MADRID si no cae en ningún polígono)."""
+        import shapely
+
+        longitud = np.asarray(longitud, dtype=np.float64)
+        latitud = np.asarray(latitud, dtype=np.float64)
+        resultado = np.full(len(longitud), FUERA_DE_MADRID, dtype=np.int32)
+        if len(longitud) == 0:
+            return resultado
+
+        # 1️⃣ Celda de cada punto; los que caen fuera de la malla (o sin coordenadas) quedan fuera
+        with np.errstate(invalid="ignore"):
+            ix = np.floor((longitud - self.origen[0]) / self.paso[0])
+            iy = np.floor((latitud - self.origen[1]) / self.paso[1])
+        en_malla = (ix >= 0) & (ix < self.celdas) & (iy >= 0) & (iy < self.celdas)
+        celda = np.zeros(len(longitud), dtype=np.int64)
+        celda[en_malla] = iy[en_malla].astype(np.int64) * self.celdas + ix[en_malla].astype(np.int64)
+        resultado[en_malla] = self.malla[celda[en_malla]]
+
+        # 2️⃣ Celdas de frontera: pares (punto, polígono candidato)
+        pendientes = np.flatnonzero(resultado == FRONTERA)
+        resultado[pendientes] = FUERA_DE_MADRID
+        if len(pendientes) == 0:
+            return resultado
+        desde = self.inicio[celda[pendientes]]
+        cuantos = self.inicio[celda[pendientes] + 1] - desde
+        puntos = np.repeat(pendientes, cuantos)
+        desplazamiento = np.arange(len(puntos)) - np.repeat(np.cumsum(cuantos) - cuantos, cuantos)
+        poligonos = self.candidatos[np.repeat(desde, cuantos) + desplazamiento]
+
+        # 3️⃣ Punto en polígono exacto sobre los polígonos preparados
+        dentro = shapely.contains_xy(self.geometrias[poligonos], longitud[puntos], latitud[puntos])
+        resultado[puntos[dentro]] = self.codigos[poligonos[dentro]]
+
+        # 4️⃣ Puntos justo en la frontera: el primer polígono que los toca
+        sin_asignar = (resultado[puntos] == FUERA_DE_MADRID) & ~dentro
+        if sin_asignar.any():
+            p, g = puntos[sin_asignar], poligonos[sin_asignar]
+            toca = shapely.intersects_xy(self.geometrias[g], longitud[p], latitud[p])
+            p, g = p[toca][::-1], g[toca][::-1]
+            resultado[p] = self.codigos[g]
+        return resultado
+
+
+def cargar_indice(ruta=SHAPEFILE, cache=CACHE_INDICE):
+    """Índice desde la caché si la huella del shapefile coincide; si no, se construye y se guarda."""
+    huella = huella_shapefile(ruta)
+    if cache and os.path.exists(cache):
+        try:
+            with open(cache, "rb") as f:
+                guardado = pickle.load(f)
+            if guardado.get("huella") == huella:
+                return guardado["indice"]
+        except (pickle.UnpicklingError, EOFError, AttributeError, KeyError):
+            pass
+
+    indice = IndiceMunicipios.desde_shapefile(ruta)
+    if cache:
+        os.makedirs(os.path.dirname(cache) or ".", exist_ok=True)
+        tmp = cache + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump({"huella": huella, "indice": indice}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, cache)
+    return indice
+
+
+# =========================
+# ALMACÉN DE ANUNCIOS
+# =========================
+def asignar_pendientes(almacen, indice=None):
+    """
+    Asigna los anuncios con coordenadas y sin codigo_ine_punto. Devuelve
+    (asignados, DataFrame de los que caen fuera de todos los polígonos).
+    """
+    pendientes = pd.read_sql_query(
+        """SELECT propertyCode, codigo_ine, latitud, longitud FROM anuncios
+           WHERE latitud IS NOT NULL AND longitud IS NOT NULL AND codigo_ine_punto IS NULL""",
+        almacen.conexion,
+    )
+    if pendientes.empty:
+        return 0, pendientes.assign(codigo_ine_punto=pd.Series(dtype="int32"))
+
+    indice = indice or cargar_indice()
+    pendientes["codigo_ine_punto"] = indice.asignar(pendientes["longitud"], pendientes["latitud"])
+    almacen.asignar_municipios(zip(pendientes["codigo_ine_punto"].tolist(), pendientes["propertyCode"]))
+    fuera = pendientes[pendientes["codigo_ine_punto"] == FUERA_DE_MADRID]
+    return len(pendientes), fuera
+
+
+if __name__ == "__main__":
+    from anuncios import ALMACEN_ANUNCIOS, AlmacenAnuncios
+
+    parser = argparse.ArgumentParser(description="Asignación de anuncios a municipios por coordenadas")
+    parser.add_argument("--almacen", default=ALMACEN_ANUNCIOS)
+    parser.add_argument("--fuera", default=FUERA, help="CSV con los anuncios fuera de todos los municipios")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    indice = cargar_indice()
+    t_indice = time.perf_counter() - inicio
+    with AlmacenAnuncios(args.almacen) as almacen:
+        asignados, _ = asignar_pendientes(almacen, indice)
+        movidos = almacen.conexion.execute(
+            "SELECT count(*) FROM anuncios WHERE codigo_ine_punto NOT IN (codigo_ine, ?)", (FUERA_DE_MADRID,)
+        ).fetchone()[0]
+        fuera = pd.read_sql_query(
+            "SELECT propertyCode, codigo_ine, latitud, longitud, url FROM anuncios WHERE codigo_ine_punto = ?",
+            almacen.conexion, params=(FUERA_DE_MADRID,),
+        )
+    print(f"Índice de {len(indice.codigos)} municipios en {t_indice * 1000:.0f} ms; "
+          f"{asignados} anuncios asignados en {time.perf_counter() - inicio:.2f}s")
+    print(f"{movidos} anuncios están en un municipio distinto al de su búsqueda")
+    if len(fuera):
+        os.makedirs(os.path.dirname(args.fuera) or ".", exist_ok=True)
+        fuera.to_csv(args.fuera, index=False)
+        print(f"⚠️ {len(fuera)} anuncios fuera de todos los municipios (lista en {args.fuera})")
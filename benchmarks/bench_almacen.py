@@ -0,0 +1,126 @@
+"""
+Benchmark de carga de las tablas intermedias: CSV frente a Parquet y Arrow.
+
+Para cada tabla de data_interfaz/ (valores, intervalos_ia,
+clusterAtractividadJuntos_<año>) y una tabla sintética con la forma de las
+del join (municipios x indicadores, multiplicada por --escala), escribe las
+tres versiones en una carpeta temporal y mide:
+
+- csv:          pd.read_csv
+- parquet:      leer_tabla (diccionario + float32)
+- arrow:        leer_tabla sin memory-map
+- arrow_mmap:   leer_tabla con memory-map
+
+y comprueba que los valores coinciden con los del CSV (tolerancia de float32).
+
+FORMATO_INTERMEDIOS no influye: se prueban siempre los tres formatos.
+
+Uso:
+    python benchmarks/bench_almacen.py [--escala 50] [--repeticiones 5]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from almacen import escribir_tabla, leer_tabla, ruta_existente  # noqa: E402
+
+TABLAS = ["valores", "intervalos_ia"] + [f"clusterAtractividadJuntos_{a}" for a in ("2023", "2024", "2025")]
+
+
+def tabla_sintetica(escala, columnas=40, semilla=0):
+    """Misma forma que clusterAtractividadJuntos: Nombre, grupo y indicadores."""
+    rng = np.random.default_rng(semilla)
+    filas = 179 * escala
+    df = pd.DataFrame(
+        rng.gamma(2.0, 10.0, size=(filas, columnas)),
+        columns=[f"indicador_{i}" for i in range(columnas)],
+    )
+    df[df < 1] = np.nan
+    df.insert(0, "grupo", rng.integers(1, 4, filas).astype(float))
+    df.insert(0, "Nombre", [f"Municipio {i % 179}" for i in range(filas)])
+    df.insert(0, "codigo_ine", 28001 + np.arange(filas) % 179)
+    return df
+
+
+def cronometrar(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos), resultado
+
+
+def iguales(a, b):
+    if a.shape != b.shape or list(a.columns) != list(b.columns):
+        return False
+    for columna in a.columns:
+        x, y = a[columna], b[columna]
+        if pd.api.types.is_numeric_dtype(x) and pd.api.types.is_numeric_dtype(y):
+            if not np.allclose(x.to_numpy(np.float64, na_value=np.nan), y.to_numpy(np.float64, na_value=np.nan),
+                               rtol=1e-6, equal_nan=True):
+                return False
+        elif not x.astype(str).equals(y.astype(str)):
+            # Listas: en CSV son el texto "[a, b]", aquí listas de float32
+            if not all(np.allclose(np.array(eval(u, {"nan": np.nan}) if isinstance(u, str) else np.nan, dtype=float),
+                                   np.array(v if v is not None else np.nan, dtype=float),
+                                   rtol=1e-6, equal_nan=True)
+                       for u, v in zip(x, y)):
+                return False
+    return True
+
+
+def medir(nombre, df, carpeta, repeticiones):
+    base = os.path.join(carpeta, f"{nombre}.csv")
+    rutas = {f: escribir_tabla(df, base, formato=f) for f in ("csv", "parquet", "arrow")}
+
+    t_csv, de_csv = cronometrar(lambda: pd.read_csv(rutas["csv"]), repeticiones)
+    fila = {"tabla": nombre, "filas": len(df), "columnas": df.shape[1], "csv_ms": t_csv * 1000}
+    correcto = True
+    for clave, formato, mmap in (("parquet", "parquet", False), ("arrow", "arrow", False), ("arrow_mmap", "arrow", True)):
+        t, leido = cronometrar(lambda: leer_tabla(base, formato=formato, mmap=mmap), repeticiones)
+        fila[f"{clave}_ms"] = t * 1000
+        correcto &= iguales(de_csv, leido)
+    for formato, ruta in rutas.items():
+        fila[f"{formato}_kb"] = os.path.getsize(ruta) / 1024
+    fila["iguales"] = correcto
+    return fila
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--datos", default="data_interfaz")
+    parser.add_argument("--escala", type=int, default=50)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    filas = []
+    with tempfile.TemporaryDirectory() as carpeta:
+        for nombre in TABLAS:
+            ruta = ruta_existente(os.path.join(args.datos, f"{nombre}.csv"), formato="csv")
+            if not os.path.exists(ruta):
+                continue
+            filas.append(medir(nombre, leer_tabla(ruta), carpeta, args.repeticiones))
+        filas.append(medir(f"sintetica_x{args.escala}", tabla_sintetica(args.escala), carpeta, args.repeticiones))
+
+    tabla = pd.DataFrame(filas)
+    pd.set_option("display.width", 200)
+    print(tabla.to_string(index=False, float_format=lambda x: f"{x:.2f}"))
+
+    for clave in ("parquet", "arrow", "arrow_mmap"):
+        print(f"Total {clave}: {tabla[f'{clave}_ms'].sum():.1f} ms "
+              f"(x{tabla['csv_ms'].sum() / tabla[f'{clave}_ms'].sum():.1f} frente a CSV)")
+    if not tabla["iguales"].all():
+        print("⚠️ Diferencias en:", ", ".join(tabla.loc[~tabla["iguales"], "tabla"]))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
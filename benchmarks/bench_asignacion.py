@@ -0,0 +1,87 @@
+"""
+Benchmark de la asignación de anuncios a municipios por coordenadas.
+
+Genera puntos aleatorios en la caja de la Comunidad de Madrid (una parte cae
+fuera de todos los polígonos) y mide:
+
+- indice_nuevo:  leer muni2024.shp, reproyectar y construir el STRtree y la malla
+- indice_cache:  cargar el índice cacheado en disco
+- asignar:       IndiceMunicipios.asignar (malla + contains_xy en frontera)
+- sjoin:         geopandas.sjoin(predicate="within") como referencia
+
+y comprueba que la asignación coincide con sjoin en los puntos de la muestra.
+
+Uso:
+    python benchmarks/bench_asignacion.py [--puntos 1000000 3000000] [--muestra-sjoin 1000000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from asignacion_espacial import FUERA_DE_MADRID, SHAPEFILE, cargar_indice  # noqa: E402
+
+
+def cronometrar(funcion):
+    inicio = time.perf_counter()
+    resultado = funcion()
+    return time.perf_counter() - inicio, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--puntos", nargs="*", type=int, default=[1_000_000, 3_000_000])
+    parser.add_argument("--muestra-sjoin", type=int, default=1_000_000,
+                        help="puntos con los que se compara contra geopandas.sjoin")
+    args = parser.parse_args()
+
+    import geopandas as gpd
+    import shapely
+
+    shp = os.path.join(RAIZ, SHAPEFILE)
+    with tempfile.TemporaryDirectory() as carpeta:
+        cache = os.path.join(carpeta, "indice.pkl")
+        t_nuevo, _ = cronometrar(lambda: cargar_indice(shp, cache))
+        t_cache, indice = cronometrar(lambda: cargar_indice(shp, cache))
+    print(f"índice nuevo: {t_nuevo * 1000:.0f} ms   desde caché: {t_cache * 1000:.0f} ms")
+
+    municipios = gpd.read_file(shp).to_crs("EPSG:4326")
+    municipios["codigo_ine"] = 28000 + municipios["CMUN"].astype(int)
+    xmin, ymin, xmax, ymax = municipios.total_bounds
+
+    correcto = True
+    for n in args.puntos:
+        rng = np.random.default_rng(n)
+        lon = rng.uniform(xmin, xmax, n)
+        lat = rng.uniform(ymin, ymax, n)
+        t_asignar, codigos = cronometrar(lambda: indice.asignar(lon, lat))
+        fuera = int((codigos == FUERA_DE_MADRID).sum())
+        linea = (f"{n:>9} puntos  asignar {t_asignar:6.2f}s ({n / t_asignar / 1e6:.2f} M puntos/s)  "
+                 f"{fuera} fuera de todos los municipios")
+
+        m = min(n, args.muestra_sjoin)
+        if m:
+            puntos = gpd.GeoDataFrame(geometry=shapely.points(lon[:m], lat[:m]), crs="EPSG:4326")
+            t_sjoin, unidos = cronometrar(
+                lambda: gpd.sjoin(puntos, municipios[["codigo_ine", "geometry"]], predicate="within")
+            )
+            esperado = np.full(m, FUERA_DE_MADRID, dtype=np.int32)
+            unidos = unidos[~unidos.index.duplicated()]
+            esperado[unidos.index.to_numpy()] = unidos["codigo_ine"].to_numpy()
+            iguales = np.array_equal(esperado, codigos[:m])
+            correcto &= iguales
+            linea += f"  sjoin ({m}) {t_sjoin:6.2f}s  iguales: {iguales}"
+        print(linea, flush=True)
+
+    if not correcto:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Benchmark del crawler de Idealista contra el servidor simulado.
+
+Arranca mock_idealista en un hilo (latencia, límite de peticiones con 429 y
+tokens que caducan) y mide:
+
+- secuencial:  un municipio cada vez, como el script anterior (sin su sleep de 1s)
+- concurrente: --concurrencia municipios a la vez con el mismo limitador
+
+y después prueba la reanudación: corta una descarga tras --corte páginas,
+la relanza y comprueba que cada CSV tiene exactamente los anuncios que sirve
+el servidor, sin repetidos ni huecos. Por último repite la descarga completa
+(checkpoint borrado) y comprueba que el almacén de anuncios no escribe nada:
+el servidor devuelve lo mismo, así que no hay nuevos ni cambiados.
+
+Uso:
+    python benchmarks/bench_crawler.py [--concurrencia 8] [--ritmo 40] [--corte 25]
+"""
+import argparse
+import asyncio
+import csv
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(RAIZ, "script-idealista"))
+
+from crawler_idealista import Config, cargar_municipios, rastrear, slugify  # noqa: E402
+from mock_idealista import arrancar  # noqa: E402
+
+
+def config_para(url, carpeta, **opciones):
+    return Config(api_url=url, client_id="x", client_secret="x",
+                  salida=Path(carpeta) / "csv", checkpoint=Path(carpeta) / "progreso.json",
+                  almacen=Path(carpeta) / "anuncios.sqlite",
+                  backoff_base=0.05, **opciones)
+
+
+def comprobar(estado, municipios, config):
+    """Municipios cuyo CSV no coincide con lo que sirve el servidor."""
+    malos = []
+    for municipio, lat, lon in municipios:
+        esperados = set()
+        for pagina in range(1, config.max_paginas + 1):
+            elems = estado.anuncios_pagina(f"{lat},{lon}", pagina, config.max_items)["elementList"]
+            esperados.update(e["propertyCode"] for e in elems)
+            if len(elems) < config.max_items:
+                break
+        ruta = config.salida / f"{slugify(municipio)}.csv"
+        codigos = []
+        if ruta.exists():
+            with open(ruta, encoding="utf-8", newline="") as f:
+                codigos = [fila["propertyCode"] for fila in csv.DictReader(f)]
+        if len(codigos) != len(set(codigos)) or set(codigos) != esperados:
+            malos.append(municipio)
+    return malos
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrencia", type=int, default=8)
+    parser.add_argument("--ritmo", type=float, default=40.0, help="peticiones/s del limitador del cliente")
+    parser.add_argument("--ritmo-servidor", type=float, default=40.0)
+    parser.add_argument("--latencia", type=float, default=0.05)
+    parser.add_argument("--expira", type=float, default=2.0, help="validez del token en el servidor")
+    parser.add_argument("--corte", type=int, default=25, help="páginas antes de cortar la primera pasada")
+    parser.add_argument("--municipios", type=int, default=60)
+    args = parser.parse_args()
+
+    municipios = cargar_municipios(os.path.join(RAIZ, "external_data", "municipios_madrid.csv"))[:args.municipios]
+    servidor, estado, url = arrancar(ritmo=args.ritmo_servidor, rafaga=5, expira=args.expira,
+                                     latencia=args.latencia)
+    correcto = True
+    try:
+        for nombre, concurrencia in (("secuencial", 1), ("concurrente", args.concurrencia)):
+            with tempfile.TemporaryDirectory() as carpeta:
+                config = config_para(url, carpeta, ritmo=args.ritmo, rafaga=5, concurrencia=concurrencia)
+                stats = asyncio.run(rastrear(municipios, config))
+                malos = comprobar(estado, municipios, config)
+                correcto &= not malos and not stats["fallidos"]
+                print(f"{nombre:12s} {stats['segundos']:6.2f}s  {stats['paginas'] / stats['segundos']:6.1f} páginas/s  "
+                      f"{stats['anuncios']} anuncios  {stats['limitadas']} x 429  "
+                      f"{stats['renovaciones_token']} tokens  {'OK' if not malos else f'{len(malos)} mal'}")
+
+        with tempfile.TemporaryDirectory() as carpeta:
+            config = config_para(url, carpeta, ritmo=args.ritmo, rafaga=5, concurrencia=args.concurrencia)
+            primera = asyncio.run(rastrear(municipios, config, limite_paginas=args.corte))
+            segunda = asyncio.run(rastrear(municipios, config))
+            malos = comprobar(estado, municipios, config)
+            correcto &= not malos
+            print(f"reanudación  corte tras {primera['paginas']} páginas, {segunda['paginas']} al reanudar, "
+                  f"{segunda['municipios']} municipios pendientes: {'OK' if not malos else ', '.join(malos)}")
+
+            config.checkpoint.unlink()
+            tercera = asyncio.run(rastrear(municipios, config))
+            delta_ok = tercera["nuevos"] == 0 and tercera["cambiados"] == 0
+            correcto &= delta_ok
+            print(f"incremental  {tercera['paginas']} páginas repetidas: {tercera['nuevos']} nuevos, "
+                  f"{tercera['cambiados']} cambiados en el almacén (de {primera['nuevos'] + segunda['nuevos']}): "
+                  f"{'OK' if delta_ok else 'MAL'}")
+    finally:
+        servidor.shutdown()
+
+    print(f"Servidor: {estado.contadores}")
+    if not correcto:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Benchmark del lector compartido frente al camino de los notebooks.
+
+Para cada CSV con formato INE bajo data/ compara:
+- notebook: read_csv como texto + parse_es_number / normalize_nombre con apply por celda
+- leer_ine sin caché (todos los años y solo los pedidos con --anios)
+- leer_ine con caché (segunda lectura)
+
+y comprueba que los valores coinciden.
+
+Uso:
+    python benchmarks/bench_lector_ine.py [--anios 2022 2023] [--repeticiones 3]
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lector_ine import leer_ine, limpiar_cache, normalize_nombre, parse_es_number  # noqa: E402
+
+
+def es_formato_ine(ruta):
+    try:
+        with open(ruta, encoding="utf-8-sig") as f:
+            return any(linea.startswith("Serie;") for _, linea in zip(range(5), f))
+    except UnicodeDecodeError:
+        return False
+
+
+def lectura_notebook(ruta):
+    """Réplica de lo que hacen las celdas de los notebooks."""
+    with open(ruta, encoding="utf-8-sig") as f:
+        salto = next(i for i, linea in enumerate(f) if linea.startswith("Serie;"))
+    df = pd.read_csv(ruta, sep=";", dtype=str, skiprows=salto, encoding="utf-8-sig", index_col=False)
+    # Fuera la columna vacía final (las cabeceras "Serie;;;" dejan id/Nombre sin nombre)
+    df = df.iloc[:, [i for i, c in enumerate(df.columns) if i < 3 or not c.startswith("Unnamed")]]
+    df.columns = ["Serie", "id", "Nombre"] + [c.replace("(P)", "").strip() for c in df.columns[3:]]
+    df = df[df["Serie"].fillna("").str.startswith("Municipio")].copy()
+    for c in df.columns[3:]:
+        df[c] = df[c].apply(parse_es_number)
+    df["Nombre"] = df["Nombre"].apply(normalize_nombre)
+    return df
+
+
+def cronometrar(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos), resultado
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--datos", default="data")
+    parser.add_argument("--anios", nargs="*", default=None)
+    parser.add_argument("--repeticiones", type=int, default=3)
+    args = parser.parse_args()
+
+    rutas = sorted(r for r in glob.glob(os.path.join(args.datos, "**", "*.csv"), recursive=True) if es_formato_ine(r))
+    print(f"{len(rutas)} ficheros con formato INE en {args.datos}/\n")
+
+    filas = []
+    for ruta in rutas:
+        t_nb, viejo = cronometrar(lambda: lectura_notebook(ruta), args.repeticiones)
+
+        def sin_cache():
+            limpiar_cache()
+            return leer_ine(ruta, cache=False)
+
+        t_nuevo, nuevo = cronometrar(sin_cache, args.repeticiones)
+        t_anios, _ = cronometrar(lambda: leer_ine(ruta, anios=args.anios, cache=False), args.repeticiones)
+        leer_ine(ruta)
+        t_cache, _ = cronometrar(lambda: leer_ine(ruta), args.repeticiones)
+
+        # Mismos valores (float32 frente a float64: tolerancia relativa)
+        anios = [c for c in nuevo.columns if c not in ("id", "Nombre")]
+        iguales = (
+            len(viejo) == len(nuevo)
+            and list(viejo["Nombre"]) == list(nuevo["Nombre"])
+            and np.allclose(
+                viejo[anios].to_numpy(dtype=np.float64),
+                nuevo[anios].to_numpy(dtype=np.float64),
+                rtol=1e-6, equal_nan=True,
+            )
+        )
+
+        filas.append({
+            "fichero": os.path.relpath(ruta, args.datos),
+            "celdas": len(nuevo) * len(anios),
+            "notebook_ms": t_nb * 1000,
+            "leer_ine_ms": t_nuevo * 1000,
+            "anios_ms": t_anios * 1000,
+            "cache_ms": t_cache * 1000,
+            "iguales": iguales,
+        })
+
+    tabla = pd.DataFrame(filas)
+    pd.set_option("display.width", 160)
+    print(tabla.to_string(index=False, float_format=lambda x: f"{x:.2f}"))
+
+    total_nb = tabla["notebook_ms"].sum()
+    total_nuevo = tabla["leer_ine_ms"].sum()
+    print(f"\nTotal notebook: {total_nb:.1f} ms | leer_ine: {total_nuevo:.1f} ms "
+          f"(x{total_nb / total_nuevo:.1f}) | con caché: {tabla['cache_ms'].sum():.1f} ms")
+    if not tabla["iguales"].all():
+        print("⚠️ Diferencias en:", ", ".join(tabla.loc[~tabla["iguales"], "fichero"]))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Benchmark de la normalización final: bucles del notebook frente a normalizacion.py.
+
+Genera tablas sintéticas con las columnas de clusterAtractividadJuntos
+(10k-100k municipios por año, con huecos y clústeres) y mide:
+
+- notebook: réplica de las celdas de normalizacion_final_2024.ipynb
+  (groupby('Nombre') en bucle, bucle por grupo y bloque, apply por fila)
+- motor:    normalizacion.preparar + normalizar, un año
+- motor_3:  los tres años juntos en una sola pasada
+
+y comprueba que valores e intervalos coinciden con los del notebook.
+
+Uso:
+    python benchmarks/bench_normalizacion.py [--tamanos 10000 30000 100000] [--max-notebook 10000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from normalizacion import CONFIG, normalizar, preparar  # noqa: E402
+
+# Sin exclusiones: los nombres sintéticos no están en la tabla de municipios
+CONFIG_BENCH = {**CONFIG, "excluidos": []}
+
+
+def tabla_sintetica(municipios, semilla=0):
+    rng = np.random.default_rng(semilla)
+    columnas = [c for b in CONFIG["bloques"].values() for c in b["mayor_mejor"] + b["menor_mejor"]]
+    df = pd.DataFrame(rng.gamma(2.0, 10.0, size=(municipios, len(columnas))), columns=columnas)
+    df = df.mask(rng.random(df.shape) < 0.05)
+    df.insert(0, "grupo", rng.integers(1, 5, municipios).astype(float))
+    df.loc[rng.random(municipios) < 0.02, "grupo"] = np.nan
+    df.insert(0, "Nombre", [f"Municipio {i:06d}" for i in rng.permutation(municipios)])
+    df.insert(0, "codigo_ine", np.arange(municipios) + 1_000_000)
+    return df
+
+
+# =========================
+# RÉPLICA DEL NOTEBOOK
+# =========================
+def normalizacion_notebook(df, config=CONFIG_BENCH):
+    blocks = {n: b["mayor_mejor"] + b["menor_mejor"] for n, b in config["bloques"].items()}
+    df = df.copy()
+    df["grupo"] = df["grupo"].fillna(1)
+    df = df.drop_duplicates(subset=["Nombre"], keep="first")
+    for b in config["bloques"].values():
+        for col in b["menor_mejor"]:
+            if col in df.columns:
+                df[col] = 100 - df[col]
+
+    results = []
+    for municipio, group in df.groupby("Nombre"):
+        municipio_result = {"Nombre": municipio, "grupo": group["grupo"].iloc[0]}
+        for block_name, columns in blocks.items():
+            block_columns = [col for col in columns if col in df.columns and col != "grupo"]
+            block_data = group[block_columns]
+            municipio_result[block_name] = [block_data.min().min(), block_data.mean().mean()]
+        results.append(municipio_result)
+    intervalos_df = pd.DataFrame(results)
+
+    valores_unicos_df = pd.DataFrame(index=df.index)
+    for group in df["grupo"].unique():
+        group_data = df[df["grupo"] == group]
+        for block, indicators in blocks.items():
+            relevant_columns = [col for col in indicators if col in group_data.columns]
+            mean_values = group_data[relevant_columns].mean(axis=1)
+            block_min = group_data[relevant_columns].min().min()
+            block_max = group_data[relevant_columns].max().max()
+            valores_unicos_df.loc[group_data.index, block] = mean_values / (block_max - block_min)
+    valores_unicos_df["grupo"] = df["grupo"]
+    valores_unicos_df["Nombre"] = df["Nombre"]
+    valores_unicos_df = valores_unicos_df[["Nombre", "grupo"] + list(valores_unicos_df.columns[:-2])]
+
+    # add_total_interval (alineado por nombre: el notebook lo asignaba por posición)
+    filtered_df = valores_unicos_df.drop(columns=["Nombre", "grupo"])
+    total = filtered_df.apply(lambda row: [row.min(), row.mean()], axis=1)
+    intervalos_df["total"] = total.set_axis(valores_unicos_df["Nombre"]).loc[intervalos_df["Nombre"]].values
+
+    valores_unicos_df["mean_per_row"] = valores_unicos_df.drop(["Nombre", "grupo"], axis=1).mean(axis=1)
+    columns_of_interest = valores_unicos_df.drop(columns=["Nombre", "grupo", "mean_per_row"]).columns
+    group_min = valores_unicos_df.groupby("grupo")[columns_of_interest].transform("min")
+    group_max = valores_unicos_df.groupby("grupo")[columns_of_interest].transform("max")
+    valores_unicos_df["total"] = valores_unicos_df["mean_per_row"] / (group_max.max(axis=1) - group_min.min(axis=1))
+    return valores_unicos_df, intervalos_df
+
+
+def motor(tablas):
+    df = pd.concat(tablas, names=["anio", "fila"])
+    return normalizar(preparar(df, CONFIG_BENCH), CONFIG_BENCH)
+
+
+# =========================
+# COMPARACIÓN
+# =========================
+def iguales(notebook, valores, intervalos):
+    v_nb, i_nb = notebook
+    valores = valores.droplevel("anio").drop(columns="codigo_ine")
+    intervalos = (intervalos.droplevel("anio").drop(columns="codigo_ine")
+                  .sort_values("Nombre", kind="stable").reset_index(drop=True))
+    if not valores.columns.equals(v_nb.columns) or not valores.index.equals(v_nb.index):
+        return False
+    numericas = valores.columns.drop("Nombre")
+    if not np.allclose(valores[numericas].to_numpy(float), v_nb[numericas].to_numpy(float), equal_nan=True):
+        return False
+    if list(intervalos["Nombre"]) != list(i_nb["Nombre"]):
+        return False
+    for columna in intervalos.columns.drop(["Nombre", "grupo"]):
+        a = np.array(intervalos[columna].tolist(), dtype=float)
+        b = np.array(i_nb[columna].tolist(), dtype=float)
+        if not np.allclose(a, b, equal_nan=True):
+            return False
+    return True
+
+
+def cronometrar(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos), resultado
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tamanos", nargs="*", type=int, default=[10_000, 30_000, 100_000])
+    parser.add_argument("--max-notebook", type=int, default=10_000,
+                        help="tamaño máximo en el que se ejecuta la réplica del notebook")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    args = parser.parse_args()
+
+    filas = []
+    for n in args.tamanos:
+        tablas = {anio: tabla_sintetica(n, semilla=i) for i, anio in enumerate(("2023", "2024", "2025"))}
+        t_motor, (valores, intervalos) = cronometrar(lambda: motor({"2024": tablas["2024"]}), args.repeticiones)
+        t_motor3, _ = cronometrar(lambda: motor(tablas), args.repeticiones)
+        fila = {"municipios": n, "motor_ms": t_motor * 1000, "motor_3_anios_ms": t_motor3 * 1000}
+
+        if n <= args.max_notebook:
+            t_nb, notebook = cronometrar(lambda: normalizacion_notebook(tablas["2024"]), 1)
+            fila.update(notebook_ms=t_nb * 1000, aceleracion=t_nb / t_motor,
+                        iguales=iguales(notebook, valores, intervalos))
+        filas.append(fila)
+        print(f"{n} municipios hechos", flush=True)
+
+    tabla = pd.DataFrame(filas)
+    pd.set_option("display.width", 160)
+    print(tabla.to_string(index=False, float_format=lambda x: f"{x:.1f}"))
+    if "iguales" in tabla and not tabla["iguales"].dropna().astype(bool).all():
+        print("⚠️ El motor no coincide con el notebook")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
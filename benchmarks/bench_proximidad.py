@@ -0,0 +1,98 @@
+"""
+Benchmark del índice de proximidad entre municipios (proximidad.py).
+
+Mide construcción, memoria y latencia de las consultas "a menos de X km" y
+"k más cercanos" con:
+
+- los municipios reales (static/municipios_madrid.geojson): filas ordenadas
+- municipios sintéticos a escala de España (~8000 centroides en una caja de
+  1000 x 800 km): KD-tree de scipy y, sin él, distancias con numpy
+
+y comprueba los resultados contra el cálculo directo de todas las distancias.
+
+Uso:
+    python benchmarks/bench_proximidad.py [--sinteticos 8131] [--radio 25] [--k 10]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from proximidad import GEOJSON, IndiceProximidad  # noqa: E402
+
+
+def por_consulta(funcion, origenes):
+    """Microsegundos por consulta (mejor de tres pasadas)."""
+    mejor = float("inf")
+    for _ in range(3):
+        inicio = time.perf_counter()
+        for origen in origenes:
+            funcion(origen)
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor / len(origenes) * 1e6
+
+
+def comprobar(indice, origenes, radio, k):
+    """Radio y kNN iguales al cálculo directo (misma precisión float32)."""
+    for origen in origenes:
+        i = indice.indice(origen)
+        distancias = np.sqrt(((indice.puntos - indice.puntos[i]) ** 2).sum(axis=1))
+        if set(indice.radio(origen, radio)[0].tolist()) != set(np.flatnonzero(distancias <= radio).tolist()):
+            return False
+        _, dist_k = indice.vecinos(origen, k)
+        if not np.allclose(dist_k, np.sort(distancias)[:k], atol=1e-3):
+            return False
+    return True
+
+
+def medir(nombre, indice, radio, k, consultas=2000):
+    rng = np.random.default_rng(0)
+    origenes = indice.codigos[rng.integers(0, len(indice.codigos), consultas)].tolist()
+    bytes_ = indice.puntos.nbytes + sum(a.nbytes for a in (indice.orden, indice.distancias) if a is not None)
+    t_radio = por_consulta(lambda o: indice.radio(o, radio), origenes)
+    t_vecinos = por_consulta(lambda o: indice.vecinos(o, k), origenes)
+    medio = np.mean([len(indice.radio(o, radio)[0]) for o in origenes[:200]])
+    correcto = comprobar(indice, origenes[:200], radio, k)
+    print(f"{nombre:34s} {len(indice.codigos):>6} municipios {bytes_ / 1024:9.0f} KB  "
+          f"radio {radio:g} km {t_radio:7.1f} µs ({medio:.0f} de media)  "
+          f"k={k} {t_vecinos:7.1f} µs  correcto: {correcto}", flush=True)
+    return correcto
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sinteticos", type=int, default=8131, help="municipios sintéticos (España: 8131)")
+    parser.add_argument("--radio", type=float, default=25.0)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    correcto = True
+
+    inicio = time.perf_counter()
+    reales = IndiceProximidad.desde_geojson(os.path.join(RAIZ, GEOJSON))
+    print(f"índice real construido en {(time.perf_counter() - inicio) * 1000:.0f} ms")
+    correcto &= medir("Comunidad de Madrid (filas)", reales, args.radio, args.k)
+
+    rng = np.random.default_rng(1)
+    n = args.sinteticos
+    x, y = rng.uniform(0, 1000, n), rng.uniform(0, 800, n)
+    codigos = np.arange(1, n + 1)
+    inicio = time.perf_counter()
+    sinteticos = IndiceProximidad(codigos, codigos.astype(str), x, y)
+    print(f"índice sintético construido en {(time.perf_counter() - inicio) * 1000:.0f} ms")
+    if sinteticos.arbol is not None:
+        correcto &= medir("España sintética (KD-tree)", sinteticos, args.radio, args.k)
+    sinteticos.arbol = None
+    correcto &= medir("España sintética (numpy)", sinteticos, args.radio, args.k)
+
+    if not correcto:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Benchmark de los resúmenes fusionables de vivienda (resumenes_vivienda.py).
+
+Genera anuncios sintéticos (precios log-normales, tamaños, habitaciones y
+baños enteros) repartidos entre --municipios municipios y mide:
+
+- recalculo:   groupby de pandas sobre toda la historia (media, desviación,
+               mediana y p90), que es lo que se hace si no hay resúmenes
+- incremental: actualizar los resúmenes solo con el último lote
+- consulta:    mediana y p90 de un municipio desde el histograma
+
+y comprueba que media y desviación coinciden con pandas, que los cuantiles
+están dentro del error relativo del sketch (frente al cuantil 'lower', que
+es un valor observado) y que fusionar los resúmenes de dos mitades da lo
+mismo que procesarlo todo de una vez.
+
+Uso:
+    python benchmarks/bench_resumenes.py [--historia 1000000] [--lote 10000] [--municipios 180]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from resumenes_vivienda import ERROR_RELATIVO, ResumenesVivienda  # noqa: E402
+
+
+def anuncios_sinteticos(n, municipios, semilla=0):
+    rng = np.random.default_rng(semilla)
+    codigo = 28001 + rng.integers(0, municipios, n)
+    # Cada municipio con su nivel de precios
+    nivel = np.exp(rng.normal(12.3, 0.4, municipios))[codigo - 28001]
+    tamano = rng.gamma(6.0, 15.0, n).round()
+    df = pd.DataFrame({
+        "codigo_ine": codigo,
+        "precio": (nivel * rng.lognormal(0, 0.5, n)).round(-3),
+        "tamano_m2": np.where(rng.random(n) < 0.05, np.nan, tamano),
+        "habitaciones": rng.integers(0, 7, n).astype(float),
+        "banos": rng.integers(1, 4, n).astype(float),
+    })
+    return df
+
+
+def recalculo(df):
+    df = df.assign(precio_m2=df["precio"] / df["tamano_m2"])
+    g = df.groupby("codigo_ine")
+    return {
+        v: g[v].agg(["count", "mean", "std", lambda x: x.quantile(0.5, interpolation="lower"),
+                     lambda x: x.quantile(0.9, interpolation="lower")])
+        for v in ("precio", "precio_m2", "habitaciones", "banos")
+    }
+
+
+def cronometrar(funcion, repeticiones=3):
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor, resultado
+
+
+def comprobar(resumenes, exacto):
+    """Errores máximos (relativos) de media, desviación y cuantiles frente a pandas."""
+    tabla = resumenes.tabla().set_index("codigo_ine")
+    errores = {}
+    for variable, esperado in exacto.items():
+        esperado.columns = ["n", "media", "desviacion", "mediana", "p90"]
+        for estadistico in ("media", "desviacion", "mediana", "p90"):
+            calculado = tabla.loc[esperado.index, f"{variable}_{estadistico}"]
+            relativo = ((calculado - esperado[estadistico]).abs() / esperado[estadistico].abs()).max()
+            errores[(variable, estadistico)] = relativo
+        if not (tabla.loc[esperado.index, f"{variable}_n"] == esperado["n"]).all():
+            errores[(variable, "n")] = float("inf")
+    return errores
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--historia", type=int, default=1_000_000, help="anuncios ya resumidos")
+    parser.add_argument("--lote", type=int, default=10_000, help="anuncios nuevos de una descarga")
+    parser.add_argument("--municipios", type=int, default=180)
+    args = parser.parse_args()
+
+    historia = anuncios_sinteticos(args.historia, args.municipios)
+    lote = anuncios_sinteticos(args.lote, args.municipios, semilla=1)
+    todo = pd.concat([historia, lote], ignore_index=True)
+
+    # Resúmenes de la historia, en dos mitades fusionadas
+    mitad = len(historia) // 2
+    resumenes = ResumenesVivienda()
+    resumenes.actualizar(historia.iloc[:mitad])
+    otra = ResumenesVivienda()
+    otra.actualizar(historia.iloc[mitad:])
+    resumenes.fusionar(otra)
+
+    t_recalculo, exacto = cronometrar(lambda: recalculo(todo), 1)
+
+    def incremental():
+        copia = ResumenesVivienda.desde_arrays({k: v.copy() for k, v in resumenes.a_arrays().items()})
+        copia.actualizar(lote)
+        return copia
+
+    t_incremental, actualizados = cronometrar(incremental)
+
+    codigos = actualizados.codigos
+    inicio = time.perf_counter()
+    for codigo in codigos:
+        actualizados.cuantiles(codigo, "precio", (0.5, 0.9))
+    t_consulta = (time.perf_counter() - inicio) / len(codigos)
+
+    errores = comprobar(actualizados, exacto)
+    exactos_ok = all(errores[(v, e)] < 1e-9 for v in exacto for e in ("media", "desviacion"))
+    cuantiles_ok = all(errores[(v, e)] <= ERROR_RELATIVO + 1e-9 for v in exacto for e in ("mediana", "p90"))
+    conteos_ok = not any(k[1] == "n" for k in errores)
+
+    print(f"{len(todo)} anuncios ({args.lote} nuevos) en {args.municipios} municipios")
+    print(f"recalculo completo (pandas):  {t_recalculo * 1000:9.1f} ms")
+    print(f"actualización incremental:    {t_incremental * 1000:9.1f} ms  (x{t_recalculo / t_incremental:.0f})")
+    print(f"consulta mediana + p90:       {t_consulta * 1e6:9.1f} µs por municipio")
+    for (variable, estadistico), error in sorted(errores.items()):
+        print(f"  {variable:13s} {estadistico:11s} error relativo máx. {error:.2e}")
+    print(f"media/desviación exactas: {exactos_ok}  cuantiles dentro de {ERROR_RELATIVO:.0%}: {cuantiles_ok}  "
+          f"conteos: {conteos_ok}")
+    if not (exactos_ok and cuantiles_ok and conteos_ok):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Prueba de carga de servidor.py con distinto número de trabajadores.
+
+Para cada valor de --trabajadores arranca `python servidor.py` en un puerto
+libre, lanza --clientes procesos que piden rutas durante --segundos y mide
+peticiones por segundo, latencias (p50/p99) y la memoria de cada trabajador
+leída de /proc/<pid>/smaps_rollup:
+
+- privada: páginas que el trabajador ha copiado o creado (lo que cuesta
+  cada trabajador de más)
+- compartida: páginas heredadas del proceso principal que siguen sin copiar
+
+Los clientes corren en la misma máquina y consumen CPU, así que la escala
+medida es una cota inferior; con un solo núcleo no puede haber escala.
+Solo Linux (fork y /proc).
+
+Uso:
+    python benchmarks/bench_servidor.py [--trabajadores 1 2 4] [--clientes 8] [--segundos 10]
+"""
+import argparse
+import http.client
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.parse
+
+import numpy as np
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def peticiones(codigos, nombres):
+    """Mezcla de rutas ligeras y pesadas (figuras con caché)."""
+    formulario = {"Content-Type": "application/x-www-form-urlencoded"}
+    return [
+        ("GET", "/", None, {}),
+        ("GET", f"/api/similares?municipio={codigos[0]}&k=5", None, {}),
+        ("GET", f"/api/proximidad?municipio={codigos[1]}&radio_km=20", None, {}),
+        ("POST", "/estudio_municipio", urllib.parse.urlencode({"municipio": nombres[0]}), formulario),
+        ("POST", "/recomendador", urllib.parse.urlencode({"cluster": "media", "educacion": "4"}), formulario),
+    ]
+
+
+def cliente(puerto, lista, segundos, cola):
+    latencias, errores = [], 0
+    fin = time.perf_counter() + segundos
+    i = os.getpid()
+    while time.perf_counter() < fin:
+        metodo, ruta, cuerpo, cabeceras = lista[i % len(lista)]
+        i += 1
+        inicio = time.perf_counter()
+        try:
+            conexion = http.client.HTTPConnection("127.0.0.1", puerto, timeout=30)
+            conexion.request(metodo, ruta, body=cuerpo, headers=cabeceras)
+            respuesta = conexion.getresponse()
+            respuesta.read()
+            conexion.close()
+            if respuesta.status != 200:
+                errores += 1
+        except OSError:
+            errores += 1
+        latencias.append(time.perf_counter() - inicio)
+    cola.put((latencias, errores))
+
+
+def memoria(pid):
+    """{campo: kB} de smaps_rollup (Rss, Pss, Private_*, Shared_*)."""
+    valores = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for linea in f:
+            partes = linea.split()
+            if len(partes) == 3 and partes[2] == "kB":
+                valores[partes[0].rstrip(":")] = int(partes[1])
+    return valores
+
+
+def trabajadores_de(pid):
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return [int(p) for p in f.read().split()]
+
+
+def esperar(puerto, limite=120):
+    fin = time.time() + limite
+    while time.time() < fin:
+        try:
+            conexion = http.client.HTTPConnection("127.0.0.1", puerto, timeout=5)
+            conexion.request("GET", "/")
+            if conexion.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("El servidor no ha arrancado")
+
+
+def medir(n, clientes, segundos, lista):
+    puerto = puerto_libre()
+    proceso = subprocess.Popen(
+        [sys.executable, "servidor.py", "--trabajadores", str(n), "--puerto", str(puerto)],
+        cwd=RAIZ, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        esperar(puerto)
+        # Calentamiento: cada trabajador construye sus figuras
+        for metodo, ruta, cuerpo, cabeceras in lista * n * 2:
+            conexion = http.client.HTTPConnection("127.0.0.1", puerto, timeout=30)
+            conexion.request(metodo, ruta, body=cuerpo, headers=cabeceras)
+            conexion.getresponse().read()
+
+        cola = multiprocessing.Queue()
+        procesos = [
+            multiprocessing.Process(target=cliente, args=(puerto, lista, segundos, cola)) for _ in range(clientes)
+        ]
+        inicio = time.perf_counter()
+        for p in procesos:
+            p.start()
+        resultados = [cola.get() for _ in procesos]
+        duracion = time.perf_counter() - inicio
+        for p in procesos:
+            p.join()
+
+        principal = memoria(proceso.pid)
+        hijos = [memoria(pid) for pid in trabajadores_de(proceso.pid)]
+    finally:
+        proceso.terminate()
+        proceso.wait()
+
+    latencias = np.concatenate([r[0] for r in resultados]) * 1000
+    return {
+        "peticiones_s": len(latencias) / duracion,
+        "p50_ms": np.percentile(latencias, 50),
+        "p99_ms": np.percentile(latencias, 99),
+        "errores": sum(r[1] for r in resultados),
+        "principal_mb": principal["Rss"] / 1024,
+        "privada_mb": np.mean([h["Private_Clean"] + h["Private_Dirty"] for h in hijos]) / 1024,
+        "compartida_mb": np.mean([h["Shared_Clean"] + h["Shared_Dirty"] for h in hijos]) / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--trabajadores", nargs="*", type=int, default=[1, 2, 4])
+    parser.add_argument("--clientes", type=int, default=8)
+    parser.add_argument("--segundos", type=float, default=10)
+    args = parser.parse_args()
+
+    sys.path.insert(0, RAIZ)
+    os.chdir(RAIZ)
+    from snapshot import cargar_snapshot
+
+    df = cargar_snapshot()["valores"].dropna(subset=["Nombre", "codigo_ine"])
+    lista = peticiones(df["codigo_ine"].astype(int).tolist(), df["Nombre"].tolist())
+
+    print(f"{os.cpu_count()} CPU, {args.clientes} clientes, {args.segundos:.0f} s por medida")
+    print(f"{'trabajadores':>12} {'pet/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errores':>8} "
+          f"{'principal MB':>13} {'privada MB':>11} {'compartida MB':>14}")
+    base = None
+    for n in args.trabajadores:
+        r = medir(n, args.clientes, args.segundos, lista)
+        base = base or r["peticiones_s"]
+        print(f"{n:>12} {r['peticiones_s']:>8.1f} {r['p50_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['errores']:>8} "
+              f"{r['principal_mb']:>13.0f} {r['privada_mb']:>11.1f} {r['compartida_mb']:>14.1f}"
+              f"   x{r['peticiones_s'] / base:.2f}")
+
+
+if __name__ == "__main__":
+    main()
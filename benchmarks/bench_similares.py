@@ -0,0 +1,96 @@
+"""
+Benchmark del índice de municipios parecidos (similares.py).
+
+Genera una tabla sintética de --municipios municipios x --anios años con las
+cinco dimensiones y tres clústeres, y mide construcción y latencia de
+IndiceSimilares.vecinos (todos, mismo clúster y con pesos). Cada resultado
+se comprueba contra un cálculo directo con pandas sobre todas las filas.
+
+Uso:
+    python benchmarks/bench_similares.py [--municipios 8131] [--anios 10] [--k 5]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from similares import DIMENSIONES, IndiceSimilares  # noqa: E402
+
+
+def tabla_sintetica(municipios, anios, semilla=0):
+    rng = np.random.default_rng(semilla)
+    base = rng.uniform(0, 3, (municipios, len(DIMENSIONES)))
+    partes = []
+    for anio in range(2024 - anios + 1, 2025):
+        df = pd.DataFrame(np.clip(base + rng.normal(0, 0.1, base.shape), 0, 3), columns=DIMENSIONES)
+        df["codigo_ine"] = np.arange(1, municipios + 1)
+        df["Nombre"] = df["codigo_ine"].astype(str)
+        df["grupo"] = (df["codigo_ine"] % 3 + 1).astype(float)
+        df["anio"] = anio
+        partes.append(df)
+    return pd.concat(partes, ignore_index=True).sample(frac=1, random_state=semilla)
+
+
+def directo(df, codigo, k, mismo_grupo, pesos):
+    """Los k más parecidos recorriendo la tabla con pandas (referencia)."""
+    normalizada = (df[DIMENSIONES] - df[DIMENSIONES].min()) / (df[DIMENSIONES].max() - df[DIMENSIONES].min())
+    anio = df["anio"].max()
+    fila = df[(df["codigo_ine"] == codigo) & (df["anio"] == anio)].index[0]
+    candidatos = (df["anio"] == anio) & (df.index != fila)
+    if mismo_grupo:
+        candidatos &= df["grupo"] == df.loc[fila, "grupo"]
+    w = np.array([pesos.get(d, 1.0) for d in DIMENSIONES])
+    w = w / w.sum()
+    d2 = ((normalizada[candidatos] - normalizada.loc[fila]) ** 2 * w).sum(axis=1)
+    return df.loc[d2.nsmallest(k).index, "codigo_ine"].tolist()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--municipios", type=int, default=8131)
+    parser.add_argument("--anios", type=int, default=10)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--consultas", type=int, default=2000)
+    args = parser.parse_args()
+
+    df = tabla_sintetica(args.municipios, args.anios)
+    inicio = time.perf_counter()
+    indice = IndiceSimilares(df)
+    print(f"{len(df)} filas ({args.municipios} municipios x {args.anios} años): "
+          f"índice en {(time.perf_counter() - inicio) * 1000:.0f} ms, matriz {indice.matriz.nbytes / 1024:.0f} KB")
+
+    rng = np.random.default_rng(1)
+    codigos = rng.integers(1, args.municipios + 1, args.consultas).tolist()
+    casos = {
+        "todos": {"mismo_grupo": False, "pesos": {}},
+        "mismo clúster": {"mismo_grupo": True, "pesos": {}},
+        "con pesos": {"mismo_grupo": False, "pesos": {"educacion": 3, "housing": 2, "salud": 0}},
+    }
+    correcto = True
+    for nombre, opciones in casos.items():
+        mejor = float("inf")
+        for _ in range(3):
+            inicio = time.perf_counter()
+            for codigo in codigos:
+                indice.vecinos(codigo, args.k, **opciones)
+            mejor = min(mejor, time.perf_counter() - inicio)
+
+        iguales = all(
+            indice.codigos[indice.vecinos(c, args.k, **opciones)[0]].tolist()
+            == directo(df, c, args.k, opciones["mismo_grupo"], opciones["pesos"])
+            for c in codigos[:20]
+        )
+        correcto &= iguales
+        print(f"  {nombre:14s} {mejor / len(codigos) * 1e6:7.1f} µs por consulta  iguales a pandas: {iguales}")
+
+    if not correcto:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
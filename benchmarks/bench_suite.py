@@ -0,0 +1,309 @@
+"""
+Suite de benchmarks de las etapas del pipeline y las rutas de la app.
+
+Para cada tamaño (--tamanos, número de municipios) genera un árbol sintético
+con benchmarks/datos_sinteticos.py en una carpeta temporal y, dentro de ella:
+
+1. ejecuta las etapas en el propio proceso, cada una en un proceso nuevo
+   para medir su pico de memoria por separado: lector_ine (CSV ancho INE),
+   join (procesar_anio de cada año), normalizacion, geometrias
+   (geometrias-municipios.py) y snapshot
+2. arranca app.py sobre ese snapshot y lanza --peticiones peticiones a
+   estudio_cluster, estudio_municipio, recomendador, /api/figuras,
+   /api/recomendador, /api/similares y /api/proximidad con el cliente de
+   pruebas de Flask. La
+   caché de figuras se desactiva salvo con --con-cache, así que se mide el
+   coste real de construir cada figura
+
+Por etapa se guardan segundos, filas/s y pico de memoria; por ruta,
+percentiles de latencia (p50, p90, p99), peticiones/s y el pico de memoria
+del proceso de la app. El resultado se compara con la línea base
+(benchmarks/linea_base.json): las métricas que empeoran más de --tolerancia
+se marcan como regresión. Si no hay línea base (o con --guardar-base) se
+guarda la de esta ejecución.
+
+Uso:
+    python benchmarks/bench_suite.py [--tamanos 1000 10000] [--peticiones 50]
+    python benchmarks/bench_suite.py --tamanos 100000 --etapas join normalizacion
+    python benchmarks/bench_suite.py --guardar-base
+"""
+import argparse
+import contextlib
+import glob
+import io
+import json
+import multiprocessing
+import os
+import platform
+import runpy
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if RAIZ not in sys.path:
+    sys.path.insert(0, RAIZ)
+
+LINEA_BASE = os.path.join(RAIZ, "benchmarks", "linea_base.json")
+ETAPAS = ["lector_ine", "join", "normalizacion", "geometrias", "snapshot", "rutas"]
+
+# Métricas comparadas con la línea base y si más es peor
+METRICAS = {"segundos": True, "p50_ms": True, "p90_ms": True, "p99_ms": True, "pico_mb": True,
+            "por_segundo": False}
+
+
+def pico_mb():
+    """Pico de memoria residente del proceso en MB (None en Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    escala = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / escala
+
+
+# =========================
+# ETAPAS (dentro de la carpeta sintética)
+# =========================
+def etapa_lector_ine():
+    from lector_ine import leer_ine
+
+    df = leer_ine(os.path.join("data", "ine", "indicador_sintetico.csv"), cache=False)
+    return {"filas": len(df)}
+
+
+def etapa_join():
+    from join import ANIOS, procesar_anio
+
+    filas = 0
+    for anio in ANIOS:
+        archivos = glob.glob(os.path.join("data_interfaz", anio, "*.csv"))
+        resultado = procesar_anio(anio, archivos, "data_interfaz/clusterAtractividadJuntos",
+                                  "external_data/municipios_con_cluster_limpio.csv")
+        filas += resultado["filas"]
+    return {"filas": filas}
+
+
+def etapa_normalizacion():
+    from normalizacion import CONFIG, exportar, normalizar_anios
+
+    # Los excluidos son municipios reales que no están en los datos sintéticos
+    valores, intervalos = normalizar_anios(config={**CONFIG, "excluidos": []})
+    exportar(valores, intervalos)
+    return {"filas": len(valores)}
+
+
+def etapa_geometrias():
+    variables = runpy.run_path(os.path.join(RAIZ, "geometrias-municipios.py"), run_name="__main__")
+    return {"filas": len(variables["gdf"]), "vertices": sum(n["vertices"] for n in variables["manifiesto"])}
+
+
+def etapa_snapshot():
+    from snapshot import construir_snapshot
+
+    snapshot = construir_snapshot()
+    return {"filas": len(snapshot["valores"])}
+
+
+def _perfil(rng):
+    return {
+        "cluster": str(rng.choice(["poca", "media", "mucha"])),
+        **{d: str(rng.choice([1, 3, 5])) for d in ("educacion", "salud", "transporte", "economia", "housing", "ocio")},
+        "entorno": str(rng.choice(["urbano", "mixto", "natural"])),
+    }
+
+
+def etapa_rutas(peticiones=50, con_cache=False, semilla=0):
+    """Latencia de cada ruta con el cliente de pruebas de Flask."""
+    if not con_cache:
+        os.environ["CACHE_FIGURAS_MAX"] = "0"
+    inicio = time.perf_counter()
+    import app as modulo
+
+    cliente = modulo.crear_app().test_client()
+    arranque = time.perf_counter() - inicio
+    rng = np.random.default_rng(semilla)
+    df = modulo.df.dropna(subset=["Nombre", "grupo"])
+    nombres = df["Nombre"].to_numpy()
+    codigos = df["codigo_ine"].dropna().astype(int).to_numpy()
+    clusters = sorted(str(c) for c in df["grupo"].unique())
+
+    rutas = {
+        "estudio_cluster": lambda: cliente.post("/estudio_cluster", data={"cluster": str(rng.choice(clusters))}),
+        "estudio_municipio": lambda: cliente.post("/estudio_municipio", data={
+            "municipio": str(rng.choice(nombres)), "comparar": str(rng.choice(["todos", "cluster"]))}),
+        "recomendador": lambda: cliente.post("/recomendador", data=_perfil(rng)),
+        "figura_cluster": lambda: cliente.get(f"/api/figuras/cluster?cluster={rng.choice(clusters)}"),
+        "figura_municipio": lambda: cliente.get("/api/figuras/municipio", query_string={
+            "municipio": str(rng.choice(nombres)), "comparar": str(rng.choice(["todos", "cluster"]))}),
+        "api_recomendador_100": lambda: cliente.post("/api/recomendador", json={
+            "perfiles": [_perfil(rng) for _ in range(100)], "k": 5}),
+        "api_similares": lambda: cliente.get(f"/api/similares?municipio={rng.choice(codigos)}&k=5"),
+        "api_proximidad": lambda: cliente.get(f"/api/proximidad?municipio={rng.choice(codigos)}&radio_km=20"),
+    }
+
+    resultados = {"arranque_app": {"segundos": arranque}}
+    for nombre, peticion in rutas.items():
+        peticion()  # calentamiento (imports perezosos, plantillas)
+        latencias, errores = [], 0
+        for _ in range(peticiones):
+            t = time.perf_counter()
+            respuesta = peticion()
+            latencias.append(time.perf_counter() - t)
+            errores += respuesta.status_code != 200
+        ms = np.array(latencias) * 1000
+        resultados[nombre] = {
+            "p50_ms": float(np.percentile(ms, 50)),
+            "p90_ms": float(np.percentile(ms, 90)),
+            "p99_ms": float(np.percentile(ms, 99)),
+            "por_segundo": float(len(ms) / ms.sum() * 1000),
+            "errores": int(errores),
+        }
+    return resultados
+
+
+# Módulos que se importan antes de cronometrar cada etapa
+MODULOS = {
+    "lector_ine": ["lector_ine"],
+    "join": ["join"],
+    "normalizacion": ["normalizacion", "municipios"],
+    "geometrias": ["geopandas", "topologia"],
+    "snapshot": ["snapshot"],
+    "rutas": ["flask", "plotly.express"],
+}
+
+FUNCIONES = {
+    "lector_ine": etapa_lector_ine,
+    "join": etapa_join,
+    "normalizacion": etapa_normalizacion,
+    "geometrias": etapa_geometrias,
+    "snapshot": etapa_snapshot,
+    "rutas": etapa_rutas,
+}
+
+
+def _ejecutar(carpeta, etapa, parametros):
+    """Se ejecuta en un proceso nuevo: la etapa dentro de la carpeta sintética."""
+    import importlib
+
+    os.chdir(carpeta)
+    for modulo in MODULOS[etapa]:
+        importlib.import_module(modulo)
+    salida = io.StringIO()
+    inicio = time.perf_counter()
+    with contextlib.redirect_stdout(salida):
+        resultado = FUNCIONES[etapa](**parametros)
+    segundos = time.perf_counter() - inicio
+    if etapa == "rutas":
+        for metricas in resultado.values():
+            metricas["pico_mb"] = pico_mb()
+        return resultado
+    if resultado.get("filas"):
+        resultado["por_segundo"] = resultado["filas"] / segundos
+    return {etapa: {**resultado, "segundos": segundos, "pico_mb": pico_mb()}}
+
+
+def en_proceso_nuevo(carpeta, etapa, parametros=None):
+    contexto = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=contexto) as pool:
+        return pool.submit(_ejecutar, carpeta, etapa, parametros or {}).result()
+
+
+# =========================
+# COMPARACIÓN CON LA LÍNEA BASE
+# =========================
+def comparar(resultados, base, tolerancia):
+    """Filas (tamaño, nombre, métrica, actual, base, cambio, regresión)."""
+    filas = []
+    for tamano, medidas in resultados.items():
+        for nombre, metricas in medidas.items():
+            for metrica, mas_es_peor in METRICAS.items():
+                actual = metricas.get(metrica)
+                previo = base.get(tamano, {}).get(nombre, {}).get(metrica)
+                if actual is None:
+                    continue
+                if not previo:
+                    filas.append((tamano, nombre, metrica, actual, None, None, False))
+                    continue
+                cambio = actual / previo - 1
+                regresion = cambio > tolerancia if mas_es_peor else cambio < -tolerancia / (1 + tolerancia)
+                filas.append((tamano, nombre, metrica, actual, previo, cambio, regresion))
+    return filas
+
+
+def imprimir(filas):
+    for tamano, nombre, metrica, actual, previo, cambio, regresion in filas:
+        linea = f"{tamano:>7} {nombre:22s} {metrica:12s} {actual:12.2f}"
+        if previo is not None:
+            linea += f"  base {previo:12.2f}  {cambio:+7.1%}"
+            if regresion:
+                linea += "  ⚠️ regresión"
+        print(linea)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks de etapas y rutas con datos sintéticos")
+    parser.add_argument("--tamanos", nargs="*", type=int, default=[1000, 10000])
+    parser.add_argument("--etapas", nargs="*", default=ETAPAS, choices=ETAPAS)
+    parser.add_argument("--peticiones", type=int, default=50, help="peticiones por ruta")
+    parser.add_argument("--con-cache", action="store_true", help="mantener la caché de figuras")
+    parser.add_argument("--base", default=LINEA_BASE)
+    parser.add_argument("--guardar-base", action="store_true")
+    parser.add_argument("--tolerancia", type=float, default=0.25, help="empeoramiento permitido (0.25 = 25%%)")
+    parser.add_argument("--estricto", action="store_true", help="salir con error si hay regresiones")
+    args = parser.parse_args()
+
+    from datos_sinteticos import escribir_arbol
+
+    resultados = {}
+    for tamano in args.tamanos:
+        medidas = {}
+        with tempfile.TemporaryDirectory(prefix=f"bench_{tamano}_") as carpeta:
+            inicio = time.perf_counter()
+            escribir_arbol(carpeta, tamano, geometrias="geometrias" in args.etapas)
+            print(f"\n{tamano} municipios sintéticos generados en {time.perf_counter() - inicio:.1f}s", flush=True)
+
+            for etapa in args.etapas:
+                parametros = {"peticiones": args.peticiones, "con_cache": args.con_cache} if etapa == "rutas" else {}
+                try:
+                    medido = en_proceso_nuevo(carpeta, etapa, parametros)
+                except Exception as e:
+                    print(f"  ❌ {etapa}: {type(e).__name__}: {e}")
+                    break
+                medidas.update(medido)
+                for nombre, m in medido.items():
+                    resumen = ", ".join(f"{k} {v:.2f}" if isinstance(v, float) else f"{k} {v}" for k, v in m.items())
+                    print(f"  {nombre:22s} {resumen}", flush=True)
+        resultados[str(tamano)] = medidas
+
+    base = {}
+    if os.path.exists(args.base):
+        with open(args.base, encoding="utf-8") as f:
+            base = json.load(f).get("tamanos", {})
+
+    print("\nComparación con la línea base" if base else "\nSin línea base previa")
+    filas = comparar(resultados, base, args.tolerancia)
+    imprimir(filas)
+    regresiones = [f for f in filas if f[-1]]
+
+    if args.guardar_base or not base:
+        guardada = {**base, **resultados}
+        with open(args.base, "w", encoding="utf-8") as f:
+            json.dump({
+                "entorno": {"python": platform.python_version(), "maquina": platform.machine(),
+                            "cpus": os.cpu_count(), "fecha": time.strftime("%Y-%m-%d")},
+                "tamanos": guardada,
+            }, f, indent=2, sort_keys=True)
+        print(f"Línea base guardada en {args.base}")
+
+    if regresiones:
+        print(f"⚠️ {len(regresiones)} métricas empeoran más de un {args.tolerancia:.0%}")
+        if args.estricto:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""
+Generador de datos sintéticos con la forma de los del proyecto.
+
+Crea, para un número configurable de municipios (1k, 10k, 100k...), un árbol
+con la misma estructura que el repositorio para poder ejecutar las etapas y
+la app fuera de la Comunidad de Madrid:
+
+- external_data/dimension_municipios.csv: nombre oficial y variantes (con el
+  artículo delante, en mayúsculas, con guiones bajos como los de Idealista)
+- external_data/municipios_con_cluster_limpio.csv: Nombre y grupo
+- data/ine/*.csv: CSV anchos con formato INE (cabecera de metadatos,
+  'Serie;id;Nombre;<años>;', miles con punto, decimales con coma, '-' en
+  los huecos y filas que no son municipios)
+- data_interfaz/<año>/<bloque>.csv: indicadores de cada bloque de
+  normalizacion.CONFIG, la entrada de join.py, con los nombres en variantes
+- data_interfaz/valores.csv: tabla de servicio (la sobrescribe normalizacion.py)
+- data/muni2024/muni2024.shp: polígonos de Voronoi en EPSG:25830 que
+  comparten frontera (~40 km² por municipio)
+
+Uso:
+    python benchmarks/datos_sinteticos.py --municipios 10000 --destino /tmp/sintetico
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if RAIZ not in sys.path:
+    sys.path.insert(0, RAIZ)
+
+from municipios import clave_municipio  # noqa: E402
+from normalizacion import CONFIG  # noqa: E402
+
+ANIOS = ["2023", "2024", "2025"]
+DIMENSIONES = ["educacion", "salud", "transporte", "economia", "housing"]
+
+# Códigos de 6 cifras: no chocan con los INE reales y el resolutor los acepta tal cual
+PRIMER_CODIGO = 100_000
+KM2_POR_MUNICIPIO = 40
+
+PREFIJOS = ["Villa", "Torre", "Fuente", "Navas", "Valde", "Cerro", "San Martín", "Santa María", "Castillo", "Puebla"]
+SUFIJOS = ["del Río", "de la Sierra", "de Arriba", "del Campo", "de Henares", "del Monte", "de Abajo", "Nueva",
+           "de los Caballeros", "del Valle"]
+ARTICULOS = ["La", "El", "Los", "Las"]
+
+
+# =========================
+# MUNICIPIOS
+# =========================
+def municipios(n, semilla=0):
+    """DataFrame codigo_ine, Nombre (oficial, con el artículo al final), grupo y población."""
+    rng = np.random.default_rng(semilla)
+    prefijo = rng.choice(PREFIJOS, n)
+    sufijo = rng.choice(SUFIJOS, n)
+    articulo = np.where(rng.random(n) < 0.1, rng.choice(ARTICULOS, n), "")
+    nombres = [
+        f"{p} {s} {i}" + (f" ({a})" if a else "")
+        for i, (p, s, a) in enumerate(zip(prefijo, sufijo, articulo))
+    ]
+    # Población log-normal; el clúster sale de ella (mayoría de municipios pequeños)
+    poblacion = np.exp(rng.normal(8, 1.6, n)).round()
+    grupo = np.select([poblacion < 5_000, poblacion < 50_000], [1.0, 2.0], 3.0)
+    return pd.DataFrame({
+        "codigo_ine": PRIMER_CODIGO + np.arange(n),
+        "Nombre": nombres,
+        "grupo": grupo,
+        "poblacion": poblacion,
+    })
+
+
+def variante_ine(nombre):
+    """'Torre del Río 7 (La)' -> 'La Torre del Río 7' (como en algunos CSV)."""
+    if nombre.endswith(")") and " (" in nombre:
+        base, articulo = nombre[:-1].rsplit(" (", 1)
+        return f"{articulo} {base}"
+    return nombre
+
+
+def variante_idealista(nombre):
+    """'Torre del Río 7 (La)' -> 'Torre_del_Rio_7_La' (nombres de fichero del crawler)."""
+    import unicodedata
+
+    sin_tildes = unicodedata.normalize("NFKD", nombre).encode("ascii", "ignore").decode()
+    return sin_tildes.replace("(", "").replace(")", "").replace(" ", "_")
+
+
+def dimension_municipios(muni):
+    """Tabla de dimensión con la forma de external_data/dimension_municipios.csv."""
+    filas = []
+    for codigo, nombre in zip(muni["codigo_ine"], muni["Nombre"]):
+        for variante, fuente in ((nombre, "shapefile"), (variante_ine(nombre), "ine"),
+                                 (variante_idealista(nombre), "idealista")):
+            filas.append((codigo, nombre, variante, fuente))
+    dimension = pd.DataFrame(filas, columns=["codigo_ine", "nombre", "variante", "fuente"])
+    dimension["clave"] = dimension["variante"].map(clave_municipio)
+    return dimension.drop_duplicates(["codigo_ine", "clave"])
+
+
+def nombres_mezclados(muni, rng, fraccion=0.3):
+    """Nombres como vienen en los CSV de origen: una parte en la variante INE o Idealista."""
+    nombres = muni["Nombre"].to_numpy(dtype=object).copy()
+    cambiar = np.flatnonzero(rng.random(len(nombres)) < fraccion)
+    for i in cambiar:
+        nombres[i] = variante_ine(nombres[i]) if i % 2 else variante_idealista(nombres[i])
+    return nombres
+
+
+# =========================
+# TABLAS
+# =========================
+def csv_ine(muni, anios=range(2006, 2026), semilla=0):
+    """Texto de un CSV ancho con formato INE (el que lee lector_ine.leer_ine)."""
+    rng = np.random.default_rng(semilla)
+    anios = [str(a) for a in anios]
+    base = muni["poblacion"].to_numpy()[:, None] * rng.uniform(0.02, 0.1, (len(muni), 1))
+    valores = base * np.cumprod(rng.normal(1.0, 0.05, (len(muni), len(anios))), axis=1)
+    huecos = rng.random(valores.shape) < 0.02
+
+    def numero(v):
+        # 1234.5 -> '1.234,50'
+        return f"{v:,.2f}".replace(",", " ").replace(".", ",").replace(" ", ".")
+
+    lineas = [
+        "Indicador sintético por municipio;;;",
+        "Fuente: generador de benchmarks;;;",
+        "Serie;id;Nombre;" + ";".join(anios) + ";",
+        "Provincia;28;Total provincial;" + ";".join(numero(v) for v in valores.sum(axis=0)) + ";",
+    ]
+    for fila, (codigo, nombre) in enumerate(zip(muni["codigo_ine"], muni["Nombre"])):
+        celdas = ["-" if huecos[fila, j] else numero(valores[fila, j]) for j in range(len(anios))]
+        lineas.append(f"Municipios;{codigo};{nombre};" + ";".join(celdas) + ";")
+    lineas.append("Notas: datos sintéticos;;;")
+    return "\n".join(lineas) + "\n"
+
+
+def tablas_bloques(muni, anio, semilla=0):
+    """{bloque: DataFrame Nombre + indicadores} de un año, como las salidas de los notebooks."""
+    rng = np.random.default_rng((semilla, int(anio)))
+    tablas = {}
+    for bloque, b in CONFIG["bloques"].items():
+        columnas = b["mayor_mejor"] + b["menor_mejor"]
+        datos = rng.gamma(2.0, 10.0, (len(muni), len(columnas)))
+        df = pd.DataFrame(datos, columns=columnas).mask(rng.random(datos.shape) < 0.03)
+        df.insert(0, "Nombre", nombres_mezclados(muni, rng))
+        tablas[bloque] = df
+    return tablas
+
+
+def tabla_valores(muni, semilla=0):
+    """valores.csv de servicio: cinco dimensiones, mean_per_row y total."""
+    rng = np.random.default_rng(semilla)
+    valores = pd.DataFrame(rng.uniform(0.3, 3.0, (len(muni), len(DIMENSIONES))), columns=DIMENSIONES)
+    valores.insert(0, "grupo", muni["grupo"].to_numpy())
+    valores.insert(0, "Nombre", muni["Nombre"].to_numpy())
+    valores["mean_per_row"] = valores[DIMENSIONES].mean(axis=1)
+    valores["total"] = valores["mean_per_row"] / 3
+    return valores
+
+
+def poligonos(muni, semilla=0):
+    """GeoDataFrame de Voronoi (EPSG:25830) con CMUN, DESCR y codigo_ine, sin huecos entre vecinos."""
+    import geopandas as gpd
+    import shapely
+
+    rng = np.random.default_rng(semilla)
+    n = len(muni)
+    lado = np.sqrt(n * KM2_POR_MUNICIPIO) * 1000
+    # Centrado en la Comunidad de Madrid (UTM 30N)
+    x0, y0 = 440_000 - lado / 2, 4_475_000 - lado / 2
+    puntos = shapely.points(x0 + rng.uniform(0, lado, n), y0 + rng.uniform(0, lado, n))
+    caja = shapely.box(x0, y0, x0 + lado, y0 + lado)
+
+    celdas = shapely.get_parts(shapely.voronoi_polygons(shapely.multipoints(puntos), extend_to=caja))
+    celdas = shapely.intersection(celdas, caja)
+    # voronoi_polygons no conserva el orden: cada celda con el punto que contiene
+    arbol = shapely.STRtree(celdas)
+    indice_punto, indice_celda = arbol.query(puntos, predicate="within")
+    orden = np.empty(n, dtype=np.int64)
+    orden[indice_punto] = indice_celda
+
+    return gpd.GeoDataFrame({
+        "CMUN": (muni["codigo_ine"] - 28000).astype(str).to_numpy(),
+        "DESCR": muni["Nombre"].to_numpy(),
+        "ETIQUETA": muni["Nombre"].to_numpy(),
+        "codigo_ine": muni["codigo_ine"].to_numpy(),
+    }, geometry=celdas[orden], crs="EPSG:25830")
+
+
+# =========================
+# ÁRBOL COMPLETO
+# =========================
+def escribir_arbol(destino, n, anios=ANIOS, semilla=0, geometrias=True):
+    """Escribe el árbol sintético en `destino` y devuelve la tabla de municipios."""
+    muni = municipios(n, semilla)
+
+    def ruta(*partes):
+        r = os.path.join(destino, *partes)
+        os.makedirs(os.path.dirname(r), exist_ok=True)
+        return r
+
+    dimension_municipios(muni).to_csv(ruta("external_data", "dimension_municipios.csv"), index=False)
+    muni[["Nombre", "grupo"]].to_csv(ruta("external_data", "municipios_con_cluster_limpio.csv"), index=False)
+
+    with open(ruta("data", "ine", "indicador_sintetico.csv"), "w", encoding="utf-8-sig") as f:
+        f.write(csv_ine(muni, semilla=semilla))
+
+    for anio in anios:
+        for bloque, df in tablas_bloques(muni, anio, semilla).items():
+            df.to_csv(ruta("data_interfaz", anio, f"{bloque}.csv"), index=False)
+
+    tabla_valores(muni, semilla).to_csv(ruta("data_interfaz", "valores.csv"))
+    # Carpeta de salida de geometrias-municipios.py y snapshot.py
+    os.makedirs(os.path.join(destino, "static", "geometrias"), exist_ok=True)
+
+    if geometrias:
+        poligonos(muni, semilla).to_file(ruta("data", "muni2024", "muni2024.shp"))
+    return muni
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Árbol de datos sintéticos para benchmarks")
+    parser.add_argument("--municipios", type=int, default=1000)
+    parser.add_argument("--destino", required=True)
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--sin-geometrias", action="store_true")
+    args = parser.parse_args()
+
+    muni = escribir_arbol(args.destino, args.municipios, semilla=args.semilla, geometrias=not args.sin_geometrias)
+    print(f"{len(muni)} municipios sintéticos en {args.destino}")
@@ -0,0 +1,145 @@
+"""
+Bloques temáticos (economía, educación, sanidad, vivienda, transporte) como
+módulos importables, ejecutados en paralelo.
+
+Cada notebook *_final.ipynb es código Python sin magias: sus celdas de código
+se compilan y ejecutan en orden dentro de un módulo (cargar_modulo), sin
+arrancar un kernel de Jupyter. Los bloques son independientes (cada uno lee
+data/<carpeta> y external_data/) y se ejecutan a la vez en un pool de
+procesos:
+
+- un proceso nuevo por bloque (spawn, max_tasks_per_child=1): ningún estado
+  pasa de un bloque a otro y la memoria se libera al terminar
+- la salida de cada bloque va a data_interfaz/logs/<bloque>.log
+- un bloque que falla no detiene a los demás; el resumen indica cuál, con la
+  traza, y el proceso termina con error
+
+Las entradas y salidas de cada bloque se declaran aquí y pipeline.py las usa
+para decidir qué bloques rehacer.
+
+Uso:
+    python bloques_tematicos.py                          # los cinco, en paralelo
+    python bloques_tematicos.py --bloques economy_final housing_final
+    python bloques_tematicos.py --procesos 1             # uno detrás de otro
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+import types
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+LOGS_DIR = os.path.join("data_interfaz", "logs")
+
+# nombre del notebook -> carpeta de data/ y data_interfaz/ y entradas extra
+BLOQUES = {
+    "economy_final": ("economia", ["external_data/poblacion_total.csv", "external_data/municipios_cluster.csv"]),
+    "education_final": ("educacion", ["external_data/lau_id_nombre.csv", "external_data/educacion/**/*"]),
+    "health_final": ("sanidad", ["external_data/poblacion_total.csv", "external_data/lau_id_nombre.csv",
+                                 "external_data/sanidad/**/*"]),
+    "housing_final": ("vivienda", ["external_data/poblacion_total.csv", "external_data/dimension_municipios.csv",
+                                   "municipios.py", "anuncios.py", "resumenes_vivienda.py"]),
+    "transport_final": ("transporte", ["external_data/poblacion_total.csv"]),
+}
+
+
+def entradas(nombre):
+    carpeta, extra = BLOQUES[nombre]
+    return [f"data/{carpeta}/**/*", "external_data/municipios_con_cluster.csv"] + extra
+
+
+def salidas(nombre):
+    """Patrón de las tablas del bloque, sin extensión (pueden ser de cualquier formato de almacen.py)."""
+    return [f"data_interfaz/{BLOQUES[nombre][0]}/**/*"]
+
+
+# =========================
+# NOTEBOOK -> MÓDULO
+# =========================
+def celdas(ruta):
+    """Código de cada celda de código del notebook."""
+    with open(ruta, encoding="utf-8") as f:
+        notebook = json.load(f)
+    return ["".join(c["source"]) for c in notebook["cells"] if c["cell_type"] == "code"]
+
+
+def cargar_modulo(nombre, ruta=None):
+    """Ejecuta las celdas del notebook `nombre` dentro de un módulo nuevo y lo devuelve."""
+    ruta = ruta or f"{nombre}.ipynb"
+    modulo = types.ModuleType(f"bloque_{nombre}")
+    modulo.__file__ = os.path.abspath(ruta)
+    for n, codigo in enumerate(celdas(ruta), start=1):
+        # El nombre de fichero con la celda hace legibles las trazas
+        exec(compile(codigo, f"{ruta}[celda {n}]", "exec"), modulo.__dict__)
+    return modulo
+
+
+def ejecutar_bloque(nombre, logs=LOGS_DIR):
+    """Ejecuta un bloque con su salida en logs/<nombre>.log. Nunca lanza: devuelve el resultado."""
+    os.makedirs(logs, exist_ok=True)
+    log = os.path.join(logs, f"{nombre}.log")
+    inicio = time.perf_counter()
+    error = None
+    # Sin ventanas de matplotlib en los procesos del pool
+    os.environ.setdefault("MPLBACKEND", "Agg")
+    with open(log, "w", encoding="utf-8") as f, contextlib.redirect_stdout(f), contextlib.redirect_stderr(f):
+        try:
+            cargar_modulo(nombre)
+        except BaseException:
+            error = traceback.format_exc()
+            f.write(error)
+    return {"nombre": nombre, "ok": error is None, "segundos": round(time.perf_counter() - inicio, 2),
+            "log": log, "error": error}
+
+
+# =========================
+# POOL
+# =========================
+def ejecutar_bloques(nombres=None, procesos=None, logs=LOGS_DIR, avisar=print):
+    """
+    Ejecuta los bloques en paralelo (un proceso por bloque) y devuelve
+    {nombre: resultado} con ok, segundos, log y error.
+    """
+    nombres = list(nombres or BLOQUES)
+    procesos = min(procesos or os.cpu_count() or 1, len(nombres))
+    inicio = time.perf_counter()
+    resultados = {}
+
+    contexto = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=procesos, mp_context=contexto, max_tasks_per_child=1) as pool:
+        futuros = {pool.submit(ejecutar_bloque, nombre, logs): nombre for nombre in nombres}
+        for futuro in as_completed(futuros):
+            nombre = futuros[futuro]
+            try:
+                resultado = futuro.result()
+            except BrokenProcessPool:
+                # El proceso murió sin devolver nada (memoria, señal...)
+                resultado = {"nombre": nombre, "ok": False, "segundos": None,
+                             "log": os.path.join(logs, f"{nombre}.log"), "error": "el proceso terminó de forma abrupta"}
+            resultados[nombre] = resultado
+            estado = "✔" if resultado["ok"] else "❌"
+            avisar(f"  {estado} {nombre}: {resultado['segundos']}s (log en {resultado['log']})")
+
+    total = time.perf_counter() - inicio
+    suma = sum(r["segundos"] or 0 for r in resultados.values())
+    avisar(f"Bloques temáticos en {total:.2f}s con {procesos} procesos (suma de bloques {suma:.2f}s)")
+    return {nombre: resultados[nombre] for nombre in nombres}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bloques temáticos en paralelo")
+    parser.add_argument("--bloques", nargs="*", default=list(BLOQUES), choices=list(BLOQUES))
+    parser.add_argument("--procesos", type=int, default=None, help="por defecto, uno por CPU")
+    args = parser.parse_args()
+
+    resultados = ejecutar_bloques(args.bloques, args.procesos)
+    fallidos = [r for r in resultados.values() if not r["ok"]]
+    for r in fallidos:
+        print(f"\n❌ {r['nombre']}:\n{r['error']}")
+    if fallidos:
+        sys.exit(1)
@@ -0,0 +1,65 @@
+"""
+Caché LRU acotada de figuras Plotly ya serializadas.
+
+Las figuras de estudio_cluster y estudio_municipio solo dependen de un
+parámetro (clúster o municipio) y de la versión del snapshot, así que se
+guardan ya convertidas a JSON y una petición repetida no toca Plotly.
+"""
+import threading
+from collections import OrderedDict
+
+
+class CacheFiguras:
+    def __init__(self, version, max_entradas=512):
+        self.version = version
+        self.max_entradas = max_entradas
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsiones = 0
+
+    def _clave(self, ruta, parametros):
+        return (ruta, tuple(parametros), self.version)
+
+    def obtener(self, ruta, parametros, construir):
+        """
+        Devuelve la figura cacheada o la construye con `construir()`.
+
+        `construir` debe devolver el JSON ya serializado (o una tupla de JSON).
+        """
+        clave = self._clave(ruta, parametros)
+        with self._lock:
+            if clave in self._entradas:
+                self._entradas.move_to_end(clave)
+                self.aciertos += 1
+                return self._entradas[clave]
+            self.fallos += 1
+
+        # Se construye fuera del lock: dos peticiones simultáneas pueden
+        # construir la misma figura, pero ninguna bloquea a las demás
+        valor = construir()
+
+        with self._lock:
+            self._entradas[clave] = valor
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+                self.expulsiones += 1
+        return valor
+
+    def precalentar(self, tareas):
+        """Construye de antemano una lista de (ruta, parametros, construir)."""
+        for ruta, parametros, construir in tareas:
+            self.obtener(ruta, parametros, construir)
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "version": self.version,
+                "entradas": len(self._entradas),
+                "max_entradas": self.max_entradas,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "expulsiones": self.expulsiones,
+            }
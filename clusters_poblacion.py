@@ -0,0 +1,246 @@
+"""
+Clústeres de población (grupo 1.0 / 2.0 / 3.0 = poca / media / mucha
+población) calculados a partir de external_data/poblacion_total.csv.
+
+Sustituyen a la columna `grupo` mantenida a mano en
+external_data/municipios_con_cluster_limpio.csv. Para cada año de join.py:
+
+- k-means óptimo en una dimensión (programación dinámica sobre la población
+  ordenada, como Ckmeans.1d.dp): da el mínimo global de la suma de
+  cuadrados, sin semillas ni reinicios, así que dos ejecuciones con la misma
+  población dan los mismos grupos
+- la población se agrupa en escala de raíz cuarta (ESCALAS), la que más se
+  parece a los grupos del fichero manual; "log" y "lineal" quedan como
+  alternativas
+- si un año no tiene población se usa la del año anterior más cercano
+
+Es incremental por año: el estado guarda la huella de la población de cada
+año y sus grupos, y solo se recalculan los años cuya población ha cambiado.
+cambios.csv lista los municipios que han cambiado de grupo respecto a la
+ejecución anterior (o, la primera vez, respecto al fichero manual). Como el
+fichero de cada año solo cambia si cambia algún grupo, join.py y
+normalizacion.py solo se rehacen entonces, y normalizacion.py recalcula
+solo los (año, grupo) afectados.
+
+Salidas en data_interfaz/clusters/:
+    grupos_<año>.csv   Nombre, grupo (la tabla de municipios de join.py)
+    cambios.csv        anio, codigo_ine, Nombre, poblacion, grupo_anterior, grupo
+    estado.json        parámetros y, por año, huella, resumen de cada grupo y grupos
+
+Uso:
+    python clusters_poblacion.py [--k 3] [--escala raiz_cuarta] [--reconstruir]
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from lector_ine import POBLACION_CSV, leer_poblacion
+
+ANIOS = ["2023", "2024", "2025"]
+CLUSTERS_DIR = os.path.join("data_interfaz", "clusters")
+GRUPOS = os.path.join(CLUSTERS_DIR, "grupos_{anio}.csv")
+CAMBIOS = os.path.join(CLUSTERS_DIR, "cambios.csv")
+ESTADO = os.path.join(CLUSTERS_DIR, "estado.json")
+# Grupos mantenidos a mano hasta ahora (referencia de la primera ejecución)
+GRUPOS_MANUALES = os.path.join("external_data", "municipios_con_cluster_limpio.csv")
+
+K = 3
+ESCALA = "raiz_cuarta"
+ESCALAS = {
+    "raiz_cuarta": lambda x: np.power(x, 0.25),
+    "log": np.log1p,
+    "lineal": lambda x: x,
+}
+# Cambia cuando cambia el cálculo; un estado de otra versión se reconstruye
+VERSION_ESTADO = 1
+
+
+# =========================
+# K-MEANS ÓPTIMO EN 1D
+# =========================
+def cortes_optimos(x, k):
+    """
+    Cortes del k-means óptimo de `x` (ordenado de menor a mayor): el grupo g
+    son x[cortes[g]:cortes[g + 1]].
+
+    coste[i, j] es la suma de cuadrados del tramo x[i:j] (con sumas
+    acumuladas) y cada grupo añadido es un mínimo por columnas de una
+    matriz: O(k·n²) operaciones de numpy y una matriz de (n+1)², que para los
+    179 municipios de Madrid es inmediato.
+    """
+    n = len(x)
+    if n < k:
+        raise ValueError(f"No se pueden formar {k} grupos con {n} municipios")
+    suma = np.concatenate([[0.0], np.cumsum(x)])
+    suma2 = np.concatenate([[0.0], np.cumsum(x * x)])
+    i = np.arange(n + 1)[:, None]
+    j = np.arange(n + 1)[None, :]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        coste = suma2[j] - suma2[i] - (suma[j] - suma[i]) ** 2 / (j - i)
+    # Sin grupos vacíos
+    coste[np.broadcast_to(j <= i, coste.shape)] = np.inf
+
+    columnas = np.arange(n + 1)
+    total = coste[0]
+    inicios = []
+    for _ in range(1, k):
+        candidatos = total[:, None] + coste
+        mejor = np.argmin(candidatos, axis=0)
+        inicios.append(mejor)
+        total = candidatos[mejor, columnas]
+
+    cortes = [n]
+    for mejor in reversed(inicios):
+        cortes.append(int(mejor[cortes[-1]]))
+    return [0] + cortes[::-1]
+
+
+def agrupar(poblacion, k=K, escala=ESCALA):
+    """Grupo (1.0 ... k, de menos a más población) de cada código INE de la serie."""
+    poblacion = poblacion.dropna().sort_values(kind="stable")
+    cortes = cortes_optimos(ESCALAS[escala](poblacion.to_numpy(dtype=np.float64)), k)
+    grupos = np.repeat(np.arange(1, k + 1, dtype=np.float64), np.diff(cortes))
+    return pd.Series(grupos, index=poblacion.index, name="grupo").sort_index()
+
+
+# =========================
+# INCREMENTAL POR AÑO
+# =========================
+def huella(poblacion, k, escala):
+    poblacion = poblacion.dropna().sort_index()
+    h = hashlib.sha256(f"{VERSION_ESTADO}:{k}:{escala}\n".encode())
+    h.update(poblacion.index.to_numpy(dtype=np.int64).tobytes())
+    h.update(poblacion.to_numpy(dtype=np.float64).tobytes())
+    return h.hexdigest()[:16]
+
+
+def columna_anio(anio, disponibles):
+    """Año de población para `anio`: el mismo o el anterior más cercano (o el primero)."""
+    anteriores = [a for a in disponibles if a <= anio]
+    return max(anteriores) if anteriores else min(disponibles)
+
+
+def cargar_estado(ruta=ESTADO):
+    try:
+        with open(ruta, encoding="utf-8") as f:
+            estado = json.load(f)
+    except FileNotFoundError:
+        return {}
+    return estado if estado.get("version") == VERSION_ESTADO else {}
+
+
+def grupos_manuales(resolver, ruta=GRUPOS_MANUALES):
+    """Grupos del fichero manual por código INE (vacío si no existe)."""
+    if not os.path.exists(ruta):
+        return pd.Series(dtype=np.float64)
+    manual = pd.read_csv(ruta)
+    codigos = resolver.resolver_serie(manual["Nombre"], fuente=ruta)
+    grupos = pd.Series(manual["grupo"].to_numpy(dtype=np.float64), index=codigos)
+    grupos = grupos[grupos.index.notna() & ~grupos.index.duplicated()]
+    grupos.index = grupos.index.astype(np.int32)
+    return grupos
+
+
+def calcular(anios=ANIOS, k=K, escala=ESCALA, estado=None, ruta_poblacion=POBLACION_CSV):
+    """
+    ({año: grupos}, estado nuevo, recalculados). Los años cuya población
+    tiene la misma huella que en `estado` reutilizan sus grupos.
+    """
+    estado = estado or {}
+    previos = estado.get("anios", {})
+    poblacion = leer_poblacion(ruta_poblacion)
+    disponibles = [c for c in poblacion.columns if c.isdigit()]
+
+    resultado, nuevo, recalculados = {}, {}, []
+    for anio in anios:
+        origen = columna_anio(anio, disponibles)
+        serie = poblacion[origen]
+        marca = huella(serie, k, escala)
+        previo = previos.get(anio)
+        if previo and previo["huella"] == marca:
+            grupos = pd.Series(previo["grupos"], dtype=np.float64, name="grupo")
+            grupos.index = grupos.index.astype(np.int32)
+        else:
+            grupos = agrupar(serie, k, escala)
+            recalculados.append(anio)
+        grupos.index.name = "codigo_ine"
+        resultado[anio] = grupos.sort_index()
+
+        por_grupo = serie.groupby(grupos).agg(["size", "min", "max"])
+        nuevo[anio] = {
+            "poblacion": origen,
+            "huella": marca,
+            "grupos_resumen": {
+                str(g): {"municipios": int(f["size"]), "min": float(f["min"]), "max": float(f["max"])}
+                for g, f in por_grupo.iterrows()
+            },
+            "grupos": {str(c): float(g) for c, g in resultado[anio].items()},
+        }
+    return resultado, {"version": VERSION_ESTADO, "k": k, "escala": escala, "anios": nuevo}, recalculados
+
+
+def cambios(resultado, nuevo, estado, referencia, poblacion):
+    """Municipios cuyo grupo difiere del estado anterior (o de `referencia` si no lo hay)."""
+    previos = estado.get("anios", {})
+    filas = []
+    for anio, grupos in resultado.items():
+        if anio in previos:
+            anterior = pd.Series(previos[anio]["grupos"], dtype=np.float64)
+            anterior.index = anterior.index.astype(np.int32)
+        else:
+            anterior = referencia
+        anterior = anterior.reindex(grupos.index)
+        distintos = grupos.index[anterior.to_numpy() != grupos.to_numpy()]
+        origen = nuevo["anios"][anio]["poblacion"]
+        for codigo in distintos:
+            filas.append((anio, int(codigo), poblacion.at[codigo, "Nombre"], poblacion.at[codigo, origen],
+                          anterior[codigo], grupos[codigo]))
+    return pd.DataFrame(filas, columns=["anio", "codigo_ine", "Nombre", "poblacion", "grupo_anterior", "grupo"])
+
+
+# =========================
+# EXPORTACIÓN
+# =========================
+def escribir_grupos(resultado, resolver, plantilla=GRUPOS):
+    """Una tabla Nombre, grupo por año (con el nombre oficial, como join.py)."""
+    os.makedirs(os.path.dirname(plantilla), exist_ok=True)
+    for anio, grupos in resultado.items():
+        tabla = pd.DataFrame({"Nombre": grupos.index.map(resolver.nombre), "grupo": grupos.to_numpy()})
+        tabla.dropna(subset=["Nombre"]).to_csv(plantilla.format(anio=anio), index=False)
+
+
+if __name__ == "__main__":
+    from municipios import resolutor
+
+    parser = argparse.ArgumentParser(description="Clústeres de población por año")
+    parser.add_argument("--anios", nargs="*", default=ANIOS)
+    parser.add_argument("--k", type=int, default=K)
+    parser.add_argument("--escala", default=ESCALA, choices=list(ESCALAS))
+    parser.add_argument("--reconstruir", action="store_true", help="ignora el estado guardado")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    resolver = resolutor()
+    estado = {} if args.reconstruir else cargar_estado()
+    # Con otros parámetros los grupos anteriores no sirven, pero sí para comparar
+    reutilizable = estado if (estado.get("k"), estado.get("escala")) == (args.k, args.escala) else {}
+    resultado, nuevo, recalculados = calcular(args.anios, args.k, args.escala, reutilizable)
+
+    diferencias = cambios(resultado, nuevo, estado, grupos_manuales(resolver), leer_poblacion())
+    escribir_grupos(resultado, resolver)
+    diferencias.to_csv(CAMBIOS, index=False)
+    with open(ESTADO, "w", encoding="utf-8") as f:
+        json.dump(nuevo, f, ensure_ascii=False, indent=1)
+
+    for anio, datos in nuevo["anios"].items():
+        resumen = ", ".join(f"{g}: {r['municipios']} ({r['min']:.0f}-{r['max']:.0f})"
+                            for g, r in datos["grupos_resumen"].items())
+        origen = "" if datos["poblacion"] == anio else f" con población de {datos['poblacion']}"
+        print(f"{anio}{origen}: {resumen}")
+    print(f"Clústeres de {len(resultado)} años en {time.perf_counter() - inicio:.2f}s "
+          f"({len(recalculados)} recalculados); {len(diferencias)} cambios de grupo en {CAMBIOS}")
@@ -0,0 +1,360 @@
+"""
+Entrega de respuestas comprimidas y validadas con ETag.
+
+Las respuestas grandes (GeoJSON de los mapas, figuras Plotly, ficheros de
+static/) se sirven:
+
+- comprimidas según Accept-Encoding: brotli si el cliente lo acepta y está
+  instalado el paquete `brotli` (opcional), si no gzip y si no tal cual
+- con un ETag fuerte por representación ("<etiqueta>-gzip", "<etiqueta>-br")
+  y Vary: Accept-Encoding
+- con un 304 sin cuerpo si el navegador ya tiene esa representación
+  (If-None-Match)
+
+Las variantes de lo que no cambia entre peticiones se comprimen una sola vez,
+al nivel máximo:
+
+- ficheros de static/: `python entrega.py` (etapa `compresion` del pipeline)
+  escribe <ruta>.gz y <ruta>.br en data_interfaz/estaticos/ y un manifiesto
+  con el hash de cada fichero, que es su ETag. url_for('static') añade
+  ?v=<hash> y con ese parámetro la respuesta se cachea un año (immutable):
+  en una visita repetida el navegador ni siquiera pregunta. Las imágenes
+  (jpeg, png) ya van comprimidas y solo ganan el ETag y la caché
+- geometrías por clúster y nivel: snapshot.py las guarda ya comprimidas y su
+  ETag sale de la versión del snapshot
+- figuras: se comprimen al entrar en la caché de figuras
+
+El resto de respuestas HTML y JSON se comprimen al vuelo, y las GET llevan
+un ETag calculado del cuerpo (ver registrar).
+
+Uso:
+    python entrega.py                # variantes comprimidas de static/
+    python entrega.py --reconstruir  # aunque no hayan cambiado
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import threading
+import time
+
+from flask import Response, abort, request, send_file
+from werkzeug.security import safe_join
+
+ESTATICOS_DIR = "static"
+COMPRIMIDOS_DIR = os.path.join("data_interfaz", "estaticos")
+MANIFIESTO = os.path.join(COMPRIMIDOS_DIR, "manifiesto.json")
+
+# Extensiones que merece la pena comprimir (jpeg y png ya están comprimidos)
+COMPRIMIBLES = {".css", ".js", ".json", ".geojson", ".topojson", ".svg", ".html", ".txt"}
+TIPOS_AL_VUELO = {"text/html", "application/json"}
+EXTENSIONES = {"br": ".br", "gzip": ".gz"}
+# Por debajo de esto la compresión no compensa
+TAMANO_MINIMO = 1024
+UN_ANIO = 365 * 24 * 3600
+
+
+# =========================
+# COMPRESIÓN
+# =========================
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def codificaciones():
+    """Codificaciones disponibles, de más a menos preferida."""
+    return ("br", "gzip") if _brotli() else ("gzip",)
+
+
+def comprimir(datos, codificacion, maximo=True):
+    """Nivel máximo para lo que se comprime una vez; medio para lo que va al vuelo."""
+    if codificacion == "gzip":
+        # mtime=0: la misma entrada da siempre los mismos bytes
+        return gzip.compress(datos, compresslevel=9 if maximo else 6, mtime=0)
+    return _brotli().compress(datos, quality=11 if maximo else 5)
+
+
+def variantes(datos, maximo=True):
+    """{codificación: bytes} de las variantes que ocupan menos que el original."""
+    if len(datos) < TAMANO_MINIMO:
+        return {}
+    resultado = {}
+    for codificacion in codificaciones():
+        comprimido = comprimir(datos, codificacion, maximo)
+        if len(comprimido) < len(datos):
+            resultado[codificacion] = comprimido
+    return resultado
+
+
+def huella(datos):
+    return hashlib.blake2b(datos, digest_size=8).hexdigest()
+
+
+def _huella_fichero(ruta):
+    h = hashlib.blake2b(digest_size=8)
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+# =========================
+# NEGOCIACIÓN Y RESPUESTAS
+# =========================
+def negociar(disponibles):
+    """Codificación que prefiere el cliente entre las disponibles (None: sin comprimir)."""
+    mejor, calidad = None, 0
+    for codificacion in ("br", "gzip"):
+        if codificacion in disponibles:
+            q = request.accept_encodings.quality(codificacion)
+            if q > calidad:
+                mejor, calidad = codificacion, q
+    return mejor
+
+
+def _validadores(respuesta, etag, inmutable=False):
+    respuesta.set_etag(etag)
+    respuesta.vary.add("Accept-Encoding")
+    if inmutable:
+        # send_file pone no-cache sin max_age
+        respuesta.cache_control.no_cache = None
+        respuesta.cache_control.public = True
+        respuesta.cache_control.max_age = UN_ANIO
+        respuesta.cache_control.immutable = True
+    elif not respuesta.headers.get("Cache-Control"):
+        # Se puede guardar, pero se revalida siempre (304 si no ha cambiado)
+        respuesta.cache_control.no_cache = True
+    return respuesta
+
+
+def responder(cuerpo, etiqueta, comprimidos=None, mimetype="application/json", cabeceras=None):
+    """
+    Respuesta con la representación que acepta el cliente, ETag fuerte
+    `<etiqueta>[-<codificación>]` y 304 si ya la tiene. `comprimidos` son las
+    variantes ya preparadas ({codificación: bytes}).
+    """
+    comprimidos = comprimidos or {}
+    codificacion = negociar(comprimidos)
+    etag = f"{etiqueta}-{codificacion}" if codificacion else etiqueta
+    if request.if_none_match.contains(etag):
+        respuesta = Response(status=304)
+    else:
+        respuesta = Response(comprimidos[codificacion] if codificacion else cuerpo, mimetype=mimetype)
+        if codificacion:
+            respuesta.content_encoding = codificacion
+    respuesta.headers.extend(cabeceras or {})
+    return _validadores(respuesta, etag)
+
+
+def paquete(cuerpo, version):
+    """(cuerpo, etiqueta, variantes) listo para responder(); es lo que guarda la caché de figuras."""
+    return cuerpo, f"{version}-{huella(cuerpo)}", variantes(cuerpo, maximo=False)
+
+
+def comprimir_respuesta(respuesta):
+    """
+    after_request: compresión al vuelo y ETag del cuerpo para las respuestas
+    HTML y JSON que no los traen ya (las de responder() y static sí).
+    """
+    if (respuesta.status_code != 200 or respuesta.direct_passthrough or respuesta.is_streamed
+            or respuesta.mimetype not in TIPOS_AL_VUELO
+            or "ETag" in respuesta.headers or "Content-Encoding" in respuesta.headers):
+        return respuesta
+
+    cuerpo = respuesta.get_data()
+    codificacion = negociar(codificaciones()) if len(cuerpo) >= TAMANO_MINIMO else None
+    if codificacion:
+        comprimido = comprimir(cuerpo, codificacion, maximo=False)
+        if len(comprimido) < len(cuerpo):
+            respuesta.set_data(comprimido)
+            respuesta.content_encoding = codificacion
+        else:
+            codificacion = None
+    respuesta.vary.add("Accept-Encoding")
+
+    # Solo las GET se pueden revalidar
+    if request.method in ("GET", "HEAD"):
+        etag = huella(cuerpo) + (f"-{codificacion}" if codificacion else "")
+        if request.if_none_match.contains(etag):
+            respuesta.status_code = 304
+            respuesta.set_data(b"")
+            respuesta.headers.pop("Content-Encoding", None)
+        _validadores(respuesta, etag)
+    return respuesta
+
+
+# =========================
+# FICHEROS ESTÁTICOS
+# =========================
+def cargar_manifiesto(ruta=MANIFIESTO):
+    try:
+        with open(ruta, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+class Estaticos:
+    """Ficheros de static/ con sus variantes comprimidas, ETag por hash y 304."""
+
+    def __init__(self, carpeta=ESTATICOS_DIR, comprimidos=COMPRIMIDOS_DIR):
+        self.carpeta = carpeta
+        self.comprimidos = comprimidos
+        self.manifiesto = {}
+        # Hash de los ficheros que no están en el manifiesto (o han cambiado)
+        self._huellas = {}
+        self._lock = threading.Lock()
+
+    def cargar(self, manifiesto=MANIFIESTO):
+        self.manifiesto = cargar_manifiesto(manifiesto)
+        return self
+
+    def ficha(self, nombre):
+        """(ruta, hash, codificaciones preparadas) del fichero; None si no existe."""
+        ruta = safe_join(self.carpeta, nombre)
+        if ruta is None or not os.path.isfile(ruta):
+            return None
+        estado = os.stat(ruta)
+        firma = [estado.st_size, estado.st_mtime_ns]
+        entrada = self.manifiesto.get(nombre)
+        if entrada and entrada["firma"] == firma:
+            return ruta, entrada["hash"], entrada["variantes"]
+
+        # Firma distinta: se compara el contenido (un checkout, una copia o un
+        # touch cambian la fecha, no el fichero). Si ha cambiado de verdad
+        # después de `python entrega.py`, se sirve sin variantes
+        with self._lock:
+            guardado = self._huellas.get(nombre)
+        if guardado is None or guardado[0] != firma:
+            guardado = (firma, _huella_fichero(ruta))
+            with self._lock:
+                self._huellas[nombre] = guardado
+        if entrada and entrada["hash"] == guardado[1]:
+            return ruta, entrada["hash"], entrada["variantes"]
+        return ruta, guardado[1], []
+
+    def version(self, nombre):
+        ficha = self.ficha(nombre)
+        return ficha[1] if ficha else None
+
+    def responder(self, filename):
+        ficha = self.ficha(filename)
+        if ficha is None:
+            abort(404)
+        ruta, hash_fichero, disponibles = ficha
+
+        codificacion = negociar(disponibles)
+        if codificacion:
+            comprimido = os.path.join(self.comprimidos, filename + EXTENSIONES[codificacion])
+            if os.path.isfile(comprimido):
+                ruta = comprimido
+            else:
+                codificacion = None
+        etag = f"{hash_fichero}-{codificacion}" if codificacion else hash_fichero
+
+        # send_file resuelve If-None-Match (304) y los rangos
+        respuesta = send_file(
+            os.path.abspath(ruta),
+            mimetype=mimetypes.guess_type(filename)[0] or "application/octet-stream",
+            etag=etag, conditional=True, max_age=None,
+        )
+        if codificacion and respuesta.status_code != 304:
+            respuesta.content_encoding = codificacion
+        return _validadores(respuesta, etag, inmutable=request.args.get("v") == hash_fichero)
+
+
+def registrar(app, estaticos):
+    """Ruta /static con variantes y versión en la URL, y compresión al vuelo del resto."""
+    app.add_url_rule("/static/<path:filename>", endpoint="static", view_func=estaticos.responder)
+
+    @app.url_defaults
+    def version_estatico(endpoint, valores):
+        if endpoint == "static" and "v" not in valores:
+            version = estaticos.version(valores.get("filename", ""))
+            if version:
+                valores["v"] = version
+
+    app.after_request(comprimir_respuesta)
+
+
+# =========================
+# CONSTRUCCIÓN DE VARIANTES
+# =========================
+def construir(carpeta=ESTATICOS_DIR, destino=COMPRIMIDOS_DIR, manifiesto=MANIFIESTO, reconstruir=False,
+              avisar=print):
+    """
+    Comprime los ficheros de `carpeta` que hayan cambiado desde la última vez
+    (por contenido; el tamaño y la fecha solo evitan releerlos) y escribe el
+    manifiesto {ruta: firma, hash, variantes}.
+    """
+    previo = {} if reconstruir else cargar_manifiesto(manifiesto)
+    nuevo = {}
+    procesados = originales = finales = 0
+    for raiz, _, ficheros in os.walk(carpeta):
+        for fichero in sorted(ficheros):
+            ruta = os.path.join(raiz, fichero)
+            nombre = os.path.relpath(ruta, carpeta).replace(os.sep, "/")
+            estado = os.stat(ruta)
+            firma = [estado.st_size, estado.st_mtime_ns]
+            entrada = previo.get(nombre)
+            listas = entrada and all(
+                os.path.isfile(os.path.join(destino, nombre + EXTENSIONES[c])) for c in entrada["variantes"]
+            )
+            if listas and entrada["firma"] != firma:
+                # Misma fecha y tamaño o, si no, mismo contenido: solo se actualiza la firma
+                listas = _huella_fichero(ruta) == entrada["hash"]
+                if listas:
+                    entrada = {**entrada, "firma": firma}
+            if not listas:
+                with open(ruta, "rb") as f:
+                    datos = f.read()
+                comprimibles = variantes(datos) if os.path.splitext(fichero)[1].lower() in COMPRIMIBLES else {}
+                if comprimibles:
+                    os.makedirs(os.path.dirname(os.path.join(destino, nombre)), exist_ok=True)
+                for codificacion, contenido in comprimibles.items():
+                    tmp = os.path.join(destino, nombre + EXTENSIONES[codificacion] + ".tmp")
+                    with open(tmp, "wb") as f:
+                        f.write(contenido)
+                    os.replace(tmp, os.path.join(destino, nombre + EXTENSIONES[codificacion]))
+                entrada = {
+                    "firma": firma,
+                    "hash": huella(datos),
+                    "variantes": sorted(comprimibles),
+                    "tamanos": {c: len(v) for c, v in comprimibles.items()},
+                }
+                procesados += 1
+            nuevo[nombre] = entrada
+            originales += firma[0]
+            finales += min([firma[0]] + list(entrada["tamanos"].values()))
+
+    # Variantes de ficheros que ya no existen
+    for nombre, entrada in previo.items():
+        if nombre not in nuevo:
+            for codificacion in entrada["variantes"]:
+                sobrante = os.path.join(destino, nombre + EXTENSIONES[codificacion])
+                if os.path.exists(sobrante):
+                    os.remove(sobrante)
+
+    os.makedirs(destino, exist_ok=True)
+    with open(manifiesto, "w", encoding="utf-8") as f:
+        json.dump(nuevo, f, indent=1, sort_keys=True)
+    avisar(f"{len(nuevo)} ficheros en {carpeta} ({procesados} procesados ahora, "
+           f"codificaciones: {', '.join(codificaciones())}): "
+           f"{originales / 1e6:.1f} MB -> {finales / 1e6:.1f} MB con la mejor variante")
+    return nuevo
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Variantes comprimidas de los ficheros estáticos")
+    parser.add_argument("--reconstruir", action="store_true", help="comprime todo aunque no haya cambiado")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    construir(reconstruir=args.reconstruir)
+    print(f"En {time.perf_counter() - inicio:.2f}s")
@@ -0,0 +1,51 @@
+"""
+Resúmenes de caja (boxplot) precalculados por snapshot.
+
+En lugar de enviar al navegador la columna completa de cada dimensión, se
+calculan una vez q1, mediana, q3, bigotes y n, globalmente y por clúster.
+El boxplot se dibuja a partir de estos cinco números, así que el tamaño de
+la página no crece con el número de municipios.
+"""
+import numpy as np
+
+DIMENSIONES = ["educacion", "salud", "transporte", "economia", "housing"]
+
+
+def resumen_caja(valores):
+    """Cinco números de Tukey (bigotes a 1.5 IQR) con cuartiles lineales, como Plotly."""
+    valores = np.asarray(valores, dtype=np.float64)
+    valores = valores[~np.isnan(valores)]
+    if valores.size == 0:
+        return None
+
+    q1, mediana, q3 = np.percentile(valores, [25, 50, 75])
+    iqr = q3 - q1
+    # Los bigotes llegan al dato más extremo dentro de 1.5 IQR
+    bigote_inf = valores[valores >= q1 - 1.5 * iqr].min()
+    bigote_sup = valores[valores <= q3 + 1.5 * iqr].max()
+
+    return {
+        "q1": float(q1),
+        "mediana": float(mediana),
+        "q3": float(q3),
+        "bigote_inf": float(bigote_inf),
+        "bigote_sup": float(bigote_sup),
+        "n": int(valores.size),
+    }
+
+
+def calcular_estadisticas(df, dimensiones=DIMENSIONES, columna_grupo="grupo"):
+    """
+    {"global": {dim: resumen}, "por_cluster": {"1.0": {dim: resumen}, ...}}
+
+    Las claves de clúster son cadenas, igual que en CLUSTER_LABELS.
+    """
+    estadisticas = {
+        "global": {dim: resumen_caja(df[dim]) for dim in dimensiones},
+        "por_cluster": {},
+    }
+    for grupo, df_grupo in df.dropna(subset=[columna_grupo]).groupby(columna_grupo):
+        estadisticas["por_cluster"][str(grupo)] = {
+            dim: resumen_caja(df_grupo[dim]) for dim in dimensiones
+        }
+    return estadisticas
@@ -1,8 +1,18 @@
+import json
+import os
+import time
+
 import geopandas as gpd
 
+from topologia import (NIVELES, conservar_municipios, construir_topologia, geometria_geojson, simplificar_arcos,
+                       topojson)
+
 # Ruta al shapefile
 shp_path = "data/muni2024/muni2024.shp"
 
+# Carpeta de salida de los niveles simplificados
+GEOMETRIAS_DIR = "static/geometrias"
+
 # Cargar shapefile
 gdf = gpd.read_file(shp_path)
 
@@ -13,5 +23,64 @@ print(gdf.columns)
 # Si se llama distinto, renómbrala
 gdf = gdf.rename(columns={"CODIGO": "codigo"})  # ajusta si se llama distinto
 
+# Código INE entero (28 + CMUN): es la clave de unión con los indicadores
+# y el featureidkey de los mapas
+gdf["codigo_ine"] = 28000 + gdf["CMUN"].astype(int)
+
 # Exportar a GeoJSON
 gdf.to_file("static/municipios_madrid.geojson", driver="GeoJSON")
+
+# =========================
+# NIVELES SIMPLIFICADOS (TOPOLOGÍA COMPARTIDA)
+# =========================
+inicio = time.perf_counter()
+os.makedirs(GEOMETRIAS_DIR, exist_ok=True)
+
+arcos, poligonos_topo = construir_topologia(gdf.geometry)
+print(f"Topología: {len(arcos)} arcos compartidos para {len(gdf)} municipios")
+
+propiedades = gdf.drop(columns="geometry").to_dict(orient="records")
+manifiesto = []
+anteriores = []
+
+# Del nivel más fino al más simplificado: si un municipio diminuto colapsa en
+# un nivel grueso, sus arcos (y los de la frontera con sus vecinos) se toman
+# del nivel anterior, tanto en el GeoJSON como en el TopoJSON
+for nivel in sorted(NIVELES, key=lambda n: n["tolerancia_m"]):
+    arcos_nivel = simplificar_arcos(arcos, nivel["tolerancia_m"], nivel["decimales"], gdf.crs)
+    arcos_nivel, conservados = conservar_municipios(arcos_nivel, anteriores, poligonos_topo, nivel["decimales"])
+    if conservados:
+        print(f"  Nivel {nivel['nivel']}: {len(conservados)} municipios con arcos del nivel anterior")
+    anteriores.append(arcos_nivel)
+
+    features = [
+        {"type": "Feature", "properties": props, "geometry": geometria_geojson(arcos_nivel, geom_topo)}
+        for geom_topo, props in zip(poligonos_topo, propiedades)
+    ]
+
+    geojson_path = os.path.join(GEOMETRIAS_DIR, f"municipios_n{nivel['nivel']}.geojson")
+    topojson_path = os.path.join(GEOMETRIAS_DIR, f"municipios_n{nivel['nivel']}.topojson")
+
+    with open(geojson_path, "w", encoding="utf-8") as f:
+        json.dump({"type": "FeatureCollection", "features": features}, f, ensure_ascii=False, separators=(",", ":"))
+    with open(topojson_path, "w", encoding="utf-8") as f:
+        json.dump(topojson(arcos_nivel, poligonos_topo, propiedades, nivel["decimales"]), f,
+                  ensure_ascii=False, separators=(",", ":"))
+
+    manifiesto.append({
+        **nivel,
+        "geojson": os.path.basename(geojson_path),
+        "topojson": os.path.basename(topojson_path),
+        "vertices": int(sum(len(a) for a in arcos_nivel)),
+        "bytes_geojson": os.path.getsize(geojson_path),
+        "bytes_topojson": os.path.getsize(topojson_path),
+    })
+    print(f"  Nivel {nivel['nivel']} (tolerancia {nivel['tolerancia_m']} m): "
+          f"{manifiesto[-1]['vertices']} vértices, "
+          f"GeoJSON {manifiesto[-1]['bytes_geojson'] / 1024:.0f} KB, "
+          f"TopoJSON {manifiesto[-1]['bytes_topojson'] / 1024:.0f} KB")
+
+with open(os.path.join(GEOMETRIAS_DIR, "niveles.json"), "w", encoding="utf-8") as f:
+    json.dump(sorted(manifiesto, key=lambda n: n["nivel"]), f, indent=2)
+
+print(f"Niveles de geometría generados en {GEOMETRIAS_DIR} ({time.perf_counter() - inicio:.2f}s)")
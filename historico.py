@@ -0,0 +1,269 @@
+"""
+Cubo histórico de indicadores: municipio × indicador × año.
+
+Los CSV de origen traen décadas de historia (renta_bruta 2015-2023,
+paradas_bus 1993-2023...), pero los notebooks se quedan con un año antes de
+join.py. Esta etapa lo guarda todo en un array denso float32 con NaN en los
+huecos (la máscara de datos presentes es ~isnan):
+
+- cada CSV con formato INE de data/<bloque>/ es un indicador "<bloque>/<fichero>"
+- la población de external_data/poblacion_total.csv es "poblacion/total"
+- si existe data_interfaz/valores_anuales (normalizacion.py), el valor de cada
+  dimensión y el total son "puntuacion/<dimension>"
+
+Se escribe en data_interfaz/historico/ como .npy (valores y los índices de
+códigos y años) más un JSON con los indicadores y los nombres. Al cargarlo el
+array se mapea en memoria. El orden es (municipio, indicador, año), así que
+la serie de un municipio en un indicador es un tramo contiguo y el ranking de
+un indicador en todos los años es una sola vista (municipios, años).
+
+Uso:
+    python historico.py
+    python historico.py --serie 28079 transporte/paradas_bus
+"""
+import argparse
+import glob
+import json
+import os
+import time
+
+import numpy as np
+
+from almacen import leer_tabla, ruta_existente
+from lector_ine import POBLACION_CSV, leer_ine, leer_poblacion
+
+CUBO_DIR = os.path.join("data_interfaz", "historico")
+BLOQUES_DATOS = ["economia", "educacion", "sanidad", "transporte", "vivienda"]
+VALORES_ANUALES = os.path.join("data_interfaz", "valores_anuales.csv")
+DIMENSIONES = ["educacion", "salud", "transporte", "economia", "housing", "total"]
+
+
+# =========================
+# CONSTRUCCIÓN
+# =========================
+def _series_ine(carpeta="data"):
+    """{indicador: DataFrame código INE × años} de los CSV con formato INE."""
+    series = {}
+    for bloque in BLOQUES_DATOS:
+        for ruta in sorted(glob.glob(os.path.join(carpeta, bloque, "*.csv"))):
+            indicador = f"{bloque}/{os.path.splitext(os.path.basename(ruta))[0]}"
+            try:
+                df = leer_ine(ruta)
+            except (ValueError, UnicodeDecodeError):
+                # Listados de centros y otros ficheros que no son series por municipio
+                print(f"  · {ruta}: no tiene formato INE, se omite")
+                continue
+            df = df[df.index.notna()]
+            series[indicador] = df[~df.index.duplicated()]
+    return series
+
+
+def _poblacion(ruta=POBLACION_CSV):
+    if not os.path.exists(ruta):
+        return {}
+    return {"poblacion/total": leer_poblacion(ruta).drop(columns="key")}
+
+
+def _puntuaciones(ruta=VALORES_ANUALES):
+    """Valor de cada dimensión por año (salida de normalizacion.py), si existe."""
+    origen = ruta_existente(ruta)
+    if not os.path.exists(origen):
+        return {}
+    df = leer_tabla(origen).dropna(subset=["codigo_ine"])
+    df["codigo_ine"] = df["codigo_ine"].astype(int)
+    df["anio"] = df["anio"].astype(str)
+    series = {}
+    for dimension in DIMENSIONES:
+        if dimension in df:
+            ancho = df.pivot_table(index="codigo_ine", columns="anio", values=dimension, aggfunc="first")
+            nombres = df.drop_duplicates("codigo_ine").set_index("codigo_ine")["Nombre"]
+            ancho.insert(0, "Nombre", nombres.reindex(ancho.index))
+            series[f"puntuacion/{dimension}"] = ancho
+    return series
+
+
+def construir_cubo(series):
+    """
+    (valores, códigos, años, indicadores, nombres) a partir de
+    {indicador: DataFrame indexado por código con Nombre y una columna por año}.
+    """
+    indicadores = sorted(series)
+    columnas_anio = {i: [c for c in df.columns if str(c).isdigit()] for i, df in series.items()}
+    codigos = np.array(sorted(set().union(*(df.index.astype(int) for df in series.values()))), dtype=np.int32)
+    anios = np.array(sorted({int(c) for cols in columnas_anio.values() for c in cols}), dtype=np.int16)
+
+    valores = np.full((len(codigos), len(indicadores), len(anios)), np.nan, dtype=np.float32)
+    nombres = {}
+    for j, indicador in enumerate(indicadores):
+        df = series[indicador]
+        filas = np.searchsorted(codigos, df.index.astype(int).to_numpy())
+        cols = np.searchsorted(anios, [int(c) for c in columnas_anio[indicador]])
+        valores[filas[:, None], j, cols[None, :]] = df[columnas_anio[indicador]].to_numpy(dtype=np.float32)
+        if "Nombre" in df:
+            for codigo, nombre in zip(df.index.astype(int), df["Nombre"]):
+                if isinstance(nombre, str):
+                    nombres.setdefault(int(codigo), nombre)
+    return valores, codigos, anios, indicadores, nombres
+
+
+def guardar_cubo(valores, codigos, anios, indicadores, nombres, carpeta=CUBO_DIR):
+    os.makedirs(carpeta, exist_ok=True)
+    for nombre, array in (("valores", valores), ("codigos", codigos), ("anios", anios)):
+        tmp = os.path.join(carpeta, f"{nombre}.tmp.npy")
+        np.save(tmp, array)
+        os.replace(tmp, os.path.join(carpeta, f"{nombre}.npy"))
+    indice = {
+        "indicadores": indicadores,
+        "nombres": {str(c): nombres.get(int(c)) for c in codigos},
+    }
+    with open(os.path.join(carpeta, "indice.json"), "w", encoding="utf-8") as f:
+        json.dump(indice, f, ensure_ascii=False)
+
+
+# =========================
+# CONSULTAS
+# =========================
+class CuboHistorico:
+    """Cubo mapeado en memoria con consultas por municipio e indicador."""
+
+    def __init__(self, valores, codigos, anios, indicadores, nombres):
+        self.valores = valores
+        self.codigos = np.asarray(codigos, dtype=np.int32)
+        self.anios = np.asarray(anios, dtype=np.int16)
+        self.indicadores = list(indicadores)
+        self.nombres = nombres
+        self.fila = {int(c): i for i, c in enumerate(self.codigos)}
+        self.columna = {ind: j for j, ind in enumerate(self.indicadores)}
+        self._catalogo = None
+
+    @classmethod
+    def cargar(cls, carpeta=CUBO_DIR, mmap=True):
+        """Carga el cubo de `carpeta` (FileNotFoundError si no se ha construido)."""
+        with open(os.path.join(carpeta, "indice.json"), encoding="utf-8") as f:
+            indice = json.load(f)
+        return cls(
+            np.load(os.path.join(carpeta, "valores.npy"), mmap_mode="r" if mmap else None),
+            np.load(os.path.join(carpeta, "codigos.npy")),
+            np.load(os.path.join(carpeta, "anios.npy")),
+            indice["indicadores"],
+            {int(c): n for c, n in indice["nombres"].items()},
+        )
+
+    def _posicion(self, codigo, indicador):
+        try:
+            i = self.fila[int(codigo)]
+        except (KeyError, TypeError, ValueError):
+            raise KeyError(f"Municipio sin histórico: {codigo}") from None
+        if indicador not in self.columna:
+            raise KeyError(f"Indicador desconocido: {indicador}")
+        return i, self.columna[indicador]
+
+    def catalogo(self):
+        """Indicadores con el primer y último año con datos y el número de municipios."""
+        if self._catalogo is not None:
+            return self._catalogo
+        presentes = ~np.isnan(self.valores)
+        por_anio = presentes.any(axis=0)
+        resultado = []
+        for j, indicador in enumerate(self.indicadores):
+            anios = self.anios[por_anio[j]]
+            resultado.append({
+                "indicador": indicador,
+                "desde": int(anios[0]) if len(anios) else None,
+                "hasta": int(anios[-1]) if len(anios) else None,
+                "municipios": int(presentes[:, j, :].any(axis=1).sum()),
+            })
+        self._catalogo = resultado
+        return resultado
+
+    def serie(self, codigo, indicador):
+        """
+        Serie de un municipio en un indicador, solo los años con dato:
+        (años, valores, variación con el año anterior con dato, puesto en cada año).
+        """
+        i, j = self._posicion(codigo, indicador)
+        valores = np.asarray(self.valores[i, j])
+        con_dato = ~np.isnan(valores)
+        anios, valores = self.anios[con_dato], valores[con_dato]
+        variacion = np.diff(valores, prepend=np.nan)
+        return anios, valores, variacion, self.puestos(indicador, i)[con_dato]
+
+    def puestos(self, indicador, fila):
+        """Puesto (1 = valor más alto) de la fila en cada año; 0 sin dato."""
+        columna = self.valores[:, self.columna[indicador]]
+        propios = columna[fila]
+        # NaN > x es False: los municipios sin dato no cuentan
+        return np.where(np.isnan(propios), 0, (columna > propios).sum(axis=0) + 1)
+
+    def cambios_ranking(self, indicador, desde, hasta, k=10):
+        """
+        Municipios que más puestos suben (y bajan) en un indicador entre dos años.
+        Devuelve (códigos, puesto_desde, puesto_hasta) ordenados por subida.
+        """
+        if k < 1:
+            raise ValueError(f"k debe ser al menos 1: {k}")
+        if indicador not in self.columna:
+            raise KeyError(f"Indicador desconocido: {indicador}")
+        for anio in (desde, hasta):
+            if anio not in self.anios:
+                raise KeyError(f"Año sin datos: {anio}")
+        columnas = np.searchsorted(self.anios, [desde, hasta])
+
+        bloque = np.asarray(self.valores[:, self.columna[indicador]][:, columnas])
+        # Puesto en cada año entre todos los municipios con dato, como en
+        # puestos(): 1 + los que tienen un valor mayor (los empates comparten puesto)
+        puestos = np.empty(bloque.shape, dtype=np.int32)
+        for c in range(2):
+            descendente = np.sort(-bloque[~np.isnan(bloque[:, c]), c])
+            puestos[:, c] = np.searchsorted(descendente, -bloque[:, c], side="left") + 1
+        validos = ~np.isnan(bloque).any(axis=1)
+        puestos = puestos[validos]
+
+        subida = puestos[:, 0] - puestos[:, 1]
+        orden = np.argsort(-subida, kind="stable")
+        seleccion = np.concatenate([orden[:k], orden[-k:][::-1]]) if len(orden) > 2 * k else orden
+        seleccion = seleccion[np.argsort(-subida[seleccion], kind="stable")]
+        return self.codigos[validos][seleccion], puestos[seleccion, 0], puestos[seleccion, 1]
+
+    def registros_serie(self, anios, valores, variacion, puestos):
+        return [
+            {
+                "anio": int(a),
+                "valor": float(v),
+                "variacion": None if np.isnan(d) else round(float(d), 4),
+                "variacion_pct": None if np.isnan(d) or v - d == 0 else round(float(d / (v - d) * 100), 2),
+                "puesto": int(p),
+            }
+            for a, v, d, p in zip(anios, valores, variacion, puestos)
+        ]
+
+    def registros_ranking(self, codigos, puesto_desde, puesto_hasta):
+        return [
+            {
+                "codigo_ine": int(c),
+                "Nombre": self.nombres.get(int(c)),
+                "puesto_desde": int(d),
+                "puesto_hasta": int(h),
+                "cambio": int(d - h),
+            }
+            for c, d, h in zip(codigos, puesto_desde, puesto_hasta)
+        ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cubo histórico municipio × indicador × año")
+    parser.add_argument("--serie", nargs=2, metavar=("CODIGO", "INDICADOR"), help="consulta en lugar de construir")
+    args = parser.parse_args()
+
+    if args.serie:
+        cubo = CuboHistorico.cargar()
+        print(json.dumps(cubo.registros_serie(*cubo.serie(*args.serie)), ensure_ascii=False, indent=2))
+    else:
+        inicio = time.perf_counter()
+        series = {**_series_ine(), **_poblacion(), **_puntuaciones()}
+        valores, codigos, anios, indicadores, nombres = construir_cubo(series)
+        guardar_cubo(valores, codigos, anios, indicadores, nombres)
+        presentes = np.count_nonzero(~np.isnan(valores))
+        print(f"Cubo {valores.shape} ({len(codigos)} municipios, {len(indicadores)} indicadores, "
+              f"{anios[0]}-{anios[-1]}) en {CUBO_DIR}: {valores.nbytes / 1e6:.1f} MB, "
+              f"{presentes / valores.size:.0%} con dato, {time.perf_counter() - inicio:.2f}s")
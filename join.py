@@ -1,15 +1,137 @@
-import pandas as pd
-import glob
 import os
-from collections import defaultdict
+import pandas as pd
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from almacen import buscar_tablas, escribir_tabla, leer_tabla
+from municipios import resolutor
+
+# Nombres que no se pudieron llevar a código INE durante la unión
+INFORME_NO_RESUELTOS = "data_interfaz/municipios_no_resueltos_join.csv"
+
+ANIOS = ["2023", "2024", "2025"]
+
+# Grupo de población de cada municipio por año (clusters_poblacion.py) y, si
+# no se ha generado, el fichero mantenido a mano
+GRUPOS = "data_interfaz/clusters/grupos_{anio}.csv"
+GRUPOS_MANUALES = "external_data/municipios_con_cluster_limpio.csv"
+
+
+class ConflictoColumnas(ValueError):
+    """Dos ficheros del mismo año traen la misma columna con valores distintos."""
+
+
+def _leer_tabla(file):
+    inicio = time.perf_counter()
+    try:
+        df = leer_tabla(file)
+    except Exception as e:
+        print(f"Error leyendo {file}: {e}")
+        df = None
+    return file, df, time.perf_counter() - inicio
+
+
+def con_codigo(df, fuente, resolver):
+    """Indexa por código INE; las filas sin código se descartan (y quedan en el informe)."""
+    codigos = resolver.resolver_serie(df["Nombre"], fuente=fuente)
+    df = df.drop(columns="Nombre").set_index(pd.Index(codigos, name="codigo_ine"))
+    sin_codigo = df.index.isna()
+    if sin_codigo.any():
+        print(f"⚠️ {fuente}: {int(sin_codigo.sum())} filas sin código INE (ver {INFORME_NO_RESUELTOS})")
+        df = df[~sin_codigo]
+    duplicados = df.index.duplicated()
+    if duplicados.any():
+        print(f"⚠️ {fuente}: {int(duplicados.sum())} municipios repetidos, se conserva la primera fila")
+        df = df[~duplicados]
+    return df
+
 
-def combinar_csvs_por_anio(base_folder, output_prefix, municipios_path):
-    # Buscar todos los archivos CSV recursivamente
-    csv_files = glob.glob(os.path.join(base_folder, "**", "*.csv"), recursive=True)
+def comprobar_conflictos(dataframes):
+    """
+    Columnas de indicador que aparecen en más de un fichero.
+
+    Si los valores coinciden se conserva una sola copia; si no, es un
+    conflicto y se para (antes el merge generaba columnas _x/_y en silencio).
+    """
+    vistas = {}
+    conflictos = []
+    limpios = []
+    for file, df in dataframes:
+        repetidas = []
+        for columna in df.columns:
+            if columna not in vistas:
+                vistas[columna] = (file, df[columna])
+                continue
+            origen, serie = vistas[columna]
+            comunes = serie.index.intersection(df.index)
+            if serie.loc[comunes].equals(df.loc[comunes, columna]):
+                print(f"ℹ️ '{columna}' repetida en {file} con los mismos valores que en {origen}")
+                repetidas.append(columna)
+            else:
+                conflictos.append(f"'{columna}': {origen} / {file}")
+        limpios.append(df.drop(columns=repetidas))
+    if conflictos:
+        raise ConflictoColumnas("Columnas con valores distintos en varios ficheros: " + "; ".join(conflictos))
+    return limpios
+
+
+def procesar_anio(anio, archivos, output_prefix, municipios_path, max_hilos=8):
+    """Une los CSV de un año (se ejecuta en un proceso por año)."""
+    inicio = time.perf_counter()
+    resolver = resolutor()
+    # El resolutor es por proceso y un proceso puede atender varios años
+    previos = Counter(resolver.no_resueltos)
+
+    # 1️⃣ Carga concurrente (lectura y parseo en hilos)
+    archivos = sorted(archivos)
+    with ThreadPoolExecutor(max_workers=max_hilos) as pool:
+        leidos = list(pool.map(_leer_tabla, archivos))
+    tiempos = {file: segundos for file, _, segundos in leidos}
+    leidos = [(file, df) for file, df, _ in leidos if df is not None]
+    if not leidos:
+        raise ValueError(f"No se pudieron cargar CSVs para el año {anio}")
+
+    # 2️⃣ Índice por código INE y detección de columnas repetidas
+    dataframes = comprobar_conflictos(
+        [(file, con_codigo(df, file, resolver)) for file, df in leidos]
+    )
+
+    # 3️⃣ Una sola alineación por índice en lugar de merges encadenados
+    df_final = pd.concat(dataframes, axis=1, join="outer").sort_index()
+
+    # Agregar la tabla de municipios (grupo) del año por código INE y el nombre oficial
+    municipios_path = municipios_path.format(anio=anio)
+    if not os.path.exists(municipios_path):
+        print(f"⚠️ No existe {municipios_path} (python clusters_poblacion.py); se usa {GRUPOS_MANUALES}")
+        municipios_path = GRUPOS_MANUALES
+    municipios_df = con_codigo(pd.read_csv(municipios_path), municipios_path, resolver)
+    df_final = df_final.join(municipios_df, how="left", rsuffix="_municipios")
+    df_final.insert(0, "Nombre", df_final.index.map(resolver.nombre))
+
+    # Guardar resultado
+    output_file = escribir_tabla(df_final.reset_index(), f"{output_prefix}_{anio}.csv")
+
+    return {
+        "anio": anio,
+        "output_file": output_file,
+        "tiempos": tiempos,
+        "filas": len(df_final),
+        "columnas": df_final.shape[1],
+        "memoria": int(df_final.memory_usage(deep=True).sum()),
+        "segundos": time.perf_counter() - inicio,
+        "no_resueltos": dict(resolver.no_resueltos - previos),
+    }
+
+
+def combinar_csvs_por_anio(base_folder, output_prefix, municipios_path, max_procesos=None):
+    """Devuelve False si algún año no se pudo combinar."""
+    # Buscar todas las tablas recursivamente (CSV o el formato de FORMATO_INTERMEDIOS)
+    csv_files = buscar_tablas(base_folder)
 
     if not csv_files:
         print(f"No se encontraron CSVs en {base_folder}")
-        return
+        return False
 
     print(f"Encontrados {len(csv_files)} archivos CSV en total")
 
@@ -17,52 +139,52 @@ def combinar_csvs_por_anio(base_folder, output_prefix, municipios_path):
     archivos_por_anio = defaultdict(list)
     for file in csv_files:
         partes = file.replace("\\", "/").split("/")
-        anio = next((p for p in partes if p in ["2023", "2024", "2025"]), None)
+        anio = next((p for p in partes if p in ANIOS), None)
         if anio:
             archivos_por_anio[anio].append(file)
 
-    # Cargar municipios.csv una vez
-    try:
-        municipios_df = pd.read_csv(municipios_path)
-        municipios_df["Nombre"] = municipios_df["Nombre"].astype(str).str.strip()
-        print(f"municipios.csv cargado con {len(municipios_df)} filas")
-    except Exception as e:
-        print(f"❌ Error cargando {municipios_path}: {e}")
-        return
-
-    # Procesar por año
-    for anio, archivos in archivos_por_anio.items():
-        print(f"\nProcesando año {anio} con {len(archivos)} archivos...")
+    if not archivos_por_anio:
+        print(f"Ningún CSV de {base_folder} está en una carpeta de año ({', '.join(ANIOS)})")
+        return False
 
-        dataframes = []
-        for file in archivos:
+    # Procesar cada año en su propio proceso
+    no_resueltos = Counter()
+    correcto = True
+    max_procesos = max_procesos or len(archivos_por_anio)
+    with ProcessPoolExecutor(max_workers=max_procesos) as pool:
+        futuros = {
+            anio: pool.submit(procesar_anio, anio, archivos, output_prefix, municipios_path)
+            for anio, archivos in sorted(archivos_por_anio.items())
+        }
+        for anio, futuro in futuros.items():
             try:
-                df = pd.read_csv(file)
-                df["Nombre"] = df["Nombre"].astype(str).str.strip()
-                dataframes.append(df)
+                resultado = futuro.result()
             except Exception as e:
-                print(f"Error leyendo {file}: {e}")
-
-        if not dataframes:
-            print(f"No se pudieron cargar CSVs para el año {anio}")
-            continue
+                print(f"❌ Error procesando el año {anio}: {e}")
+                correcto = False
+                continue
 
-        # Merge por "Nombre"
-        df_final = dataframes[0]
-        for df in dataframes[1:]:
-            df_final = pd.merge(df_final, df, on="Nombre", how="outer")
+            print(f"\nAño {anio}: {len(resultado['tiempos'])} archivos ({resultado['segundos']:.2f}s)")
+            for file, segundos in resultado["tiempos"].items():
+                print(f"  {segundos * 1000:7.1f} ms  {file}")
+            print(f"  {resultado['filas']} municipios x {resultado['columnas']} columnas, "
+                  f"{resultado['memoria'] / 1024:.0f} KB en memoria")
+            print(f"Archivo combinado + municipios para {anio} guardado en: {resultado['output_file']}")
+            no_resueltos.update(resultado["no_resueltos"])
 
-        # Agregar municipios.csv por "Nombre"
-        df_final = pd.merge(df_final, municipios_df, on="Nombre", how="left")
+    pd.DataFrame(
+        [(n, f, veces) for (n, f), veces in sorted(no_resueltos.items())],
+        columns=["variante", "fuente", "apariciones"],
+    ).to_csv(INFORME_NO_RESUELTOS, index=False)
+    return correcto
 
-        # Guardar resultado
-        output_file = f"{output_prefix}_{anio}.csv"
-        df_final.to_csv(output_file, index=False)
-        print(f"Archivo combinado + municipios para {anio} guardado en: {output_file}")
 
 # USO
-combinar_csvs_por_anio(
-    base_folder="data_interfaz",
-    output_prefix="data_interfaz/clusterAtractividadJuntos",
-    municipios_path="external_data/municipios_con_cluster_limpio.csv"
-)
+if __name__ == "__main__":
+    correcto = combinar_csvs_por_anio(
+        base_folder="data_interfaz",
+        output_prefix="data_interfaz/clusterAtractividadJuntos",
+        municipios_path=GRUPOS
+    )
+    if not correcto:
+        raise SystemExit(1)
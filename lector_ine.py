@@ -0,0 +1,272 @@
+"""
+Lector compartido de los CSV estadísticos con formato INE / Comunidad de Madrid.
+
+Formato habitual (separador ";", números "1.234,00", "-" como dato ausente):
+
+    Serie;id;Nombre;2015;2016;...;2023;
+    Municipios;0014;Acebeda (La);-;954.216,00;...
+
+Algunos ficheros llevan además una línea de título antes de la cabecera,
+filas de "Comunidad de Madrid" / "Zonas Estadísticas" y notas al final, y
+años provisionales como "2024(P)". `leer_ine` lo resuelve todo en la lectura
+(el parser de pandas convierte los números directamente, sin `apply` por
+celda) y devuelve un DataFrame tipado indexado por código INE.
+
+También reúne los helpers que los notebooks copiaban en cada celda
+(`parse_es_number`, `normalize_nombre`, `canon_key`) junto a sus versiones
+vectorizadas.
+"""
+import os
+import re
+import unicodedata
+from functools import lru_cache
+
+import pandas as pd
+
+POBLACION_CSV = "external_data/poblacion_total.csv"
+
+# Código de provincia de Madrid para pasar del id de 4 cifras (CMUN + dígito
+# de control) al código INE de 5 cifras
+CODIGO_PROVINCIA = 28
+
+ARTICULOS = {"La", "El", "Los", "Las"}
+
+# Caché en memoria de ficheros ya parseados: (ruta, mtime, tamaño, opciones) -> DataFrame
+_cache = {}
+
+
+# =========================
+# HELPERS ESCALARES (compatibles con los notebooks)
+# =========================
+def parse_es_number(x):
+    """Convierte '4.868' -> 4868, '26.226,00' -> 26226.0, etc."""
+    if pd.isna(x):
+        return None
+    s = str(x).strip()
+    if s == "" or s.lower() == "nan":
+        return None
+    s = s.replace(".", "").replace(",", ".")
+    try:
+        return float(s)
+    except ValueError:
+        return None
+
+
+def normalize_nombre(nombre):
+    """
+    - Quita código INE al inicio: '28001 Acebeda, La' -> 'Acebeda, La'
+    - Convierte 'X, La/El/Los/Las' -> 'X (La/El/Los/Las)' para casar con pensionistas/cluster
+    """
+    if pd.isna(nombre):
+        return nombre
+    s = str(nombre).strip()
+    s = re.sub(r"^\d+\s+", "", s)  # quita INE
+
+    if ", " in s and "(" not in s and ")" not in s:
+        parts = s.split(", ")
+        if len(parts) == 2 and parts[1] in ARTICULOS:
+            s = f"{parts[0].strip()} ({parts[1].strip()})"
+
+    s = re.sub(r"\s+", " ", s)
+    return s
+
+
+def canon_key(nombre):
+    """Clave canónica para casar nombres aunque haya tildes, comas, espacios, etc."""
+    s = normalize_nombre(nombre)
+    if pd.isna(s):
+        return s
+    s = unicodedata.normalize("NFKD", s)
+    s = "".join(c for c in s if not unicodedata.combining(c))  # quita tildes
+    s = s.lower()
+    s = re.sub(r"[^a-z0-9]+", "", s)  # deja solo alfanumérico
+    return s
+
+
+# =========================
+# VERSIONES PARA SERIES / DATAFRAMES
+# =========================
+def parsear_numeros_es(datos):
+    """parse_es_number sobre una Series o DataFrame entero, sin apply por celda."""
+    if isinstance(datos, pd.DataFrame):
+        return datos.apply(parsear_numeros_es)
+    s = datos.astype("string").str.strip()
+    s = s.str.replace(".", "", regex=False).str.replace(",", ".", regex=False)
+    return pd.to_numeric(s, errors="coerce").astype("float64")
+
+
+@lru_cache(maxsize=None)
+def _normalize_memo(nombre):
+    return normalize_nombre(nombre)
+
+
+@lru_cache(maxsize=None)
+def _canon_memo(nombre):
+    return canon_key(nombre)
+
+
+def normalizar_nombres(serie):
+    """
+    normalize_nombre sobre una Series.
+
+    Los mismos ~180 nombres se repiten en todos los ficheros, así que se
+    memoiza por valor: tras la primera lectura cada nombre es una consulta
+    a diccionario (más rápido que encadenar .str.replace para 180 filas).
+    """
+    return serie.map(lambda n: n if pd.isna(n) else _normalize_memo(n))
+
+
+def claves_canonicas(serie):
+    """canon_key sobre una Series, memoizado igual que normalizar_nombres."""
+    return serie.map(lambda n: n if pd.isna(n) else _canon_memo(n))
+
+
+def _codigo(id_):
+    id_ = id_.strip()
+    if not id_.isdigit():
+        return None
+    if len(id_) == 4:
+        return CODIGO_PROVINCIA * 1000 + int(id_[:3])
+    return int(id_)
+
+
+def codigo_ine(ids):
+    """
+    id de los CSV -> código INE entero.
+
+    '0014' (CMUN + dígito de control) -> 28001; '28001' se deja tal cual.
+    """
+    codigos = [None if pd.isna(i) else _codigo(str(i)) for i in ids]
+    return pd.array(codigos, dtype="Int32")
+
+
+# =========================
+# LECTURA
+# =========================
+def _cabecera(ruta, encoding):
+    """(filas a saltar, nombres de columna) leyendo solo las primeras líneas."""
+    with open(ruta, encoding=encoding) as f:
+        for salto, linea in enumerate(f):
+            campos = linea.rstrip("\r\n").split(";")
+            if campos[0].strip() == "Serie":
+                return salto, campos
+            if salto > 5:
+                break
+    raise ValueError(f"{ruta} no tiene una cabecera 'Serie;id;Nombre;...'")
+
+
+def _anio(columna):
+    m = re.match(r"^\s*(\d{4})", columna)
+    return m.group(1) if m else None
+
+
+def leer_ine(ruta, anios=None, dtype="float32", solo_municipios=True, cache=True, encoding="utf-8-sig"):
+    """
+    Lee un CSV estadístico ancho y devuelve un DataFrame indexado por código INE.
+
+    Columnas: `id` (tal cual viene), `Nombre` (normalizado con normalize_nombre)
+    y una columna por año ("2023", ...) con tipo `dtype`. Si se pasa `anios`
+    solo se parsean esos años.
+    """
+    estado = os.stat(ruta)
+    anios_clave = None if anios is None else tuple(sorted(str(a) for a in anios))
+    clave = (os.path.abspath(ruta), estado.st_mtime_ns, estado.st_size, anios_clave, dtype, solo_municipios)
+    if cache and clave in _cache:
+        return _cache[clave].copy()
+
+    salto, campos = _cabecera(ruta, encoding)
+
+    # Posiciones a leer: las tres primeras y los años pedidos
+    usar = [0, 1, 2]
+    nombres = ["Serie", "id", "Nombre"]
+    for pos, campo in enumerate(campos[3:], start=3):
+        anio = _anio(campo)
+        if anio and (anios_clave is None or anio in anios_clave):
+            usar.append(pos)
+            nombres.append(anio)
+
+    df = pd.read_csv(
+        ruta,
+        sep=";",
+        skiprows=salto + 1,
+        header=None,
+        usecols=usar,
+        names=None,
+        dtype={0: str, 1: str, 2: str},
+        thousands=".",
+        decimal=",",
+        na_values=["-", ""],
+        encoding=encoding,
+        engine="c",
+    )
+    df = df[sorted(df.columns)]
+    df.columns = nombres
+
+    if solo_municipios:
+        df = df[df["Serie"].fillna("").str.startswith("Municipio")]
+
+    anio_cols = nombres[3:]
+    # Si alguna nota al pie ha dejado una columna como texto, el parser no la
+    # convirtió: se parsea aquí sobre las filas ya filtradas
+    texto = [c for c in anio_cols if df[c].dtype == object]
+    valores = df[anio_cols]
+    if texto:
+        valores = valores.assign(**parsear_numeros_es(valores[texto]))
+
+    # Un solo bloque tipado en lugar de convertir columna a columna
+    resultado = pd.DataFrame(
+        valores.to_numpy(dtype=dtype),
+        columns=anio_cols,
+        index=pd.Index(codigo_ine(df["id"]), name="codigo_ine"),
+    )
+    resultado.insert(0, "id", df["id"].to_numpy())
+    resultado.insert(1, "Nombre", normalizar_nombres(df["Nombre"]).to_numpy())
+    df = resultado
+
+    if cache:
+        _cache[clave] = df
+        return df.copy()
+    return df
+
+
+def leer_poblacion(ruta=POBLACION_CSV, anios=None, sexo="Total", dtype="float32", cache=True):
+    """
+    Población (formato largo Municipios;Sexo;Periodo;Total) en ancho por código INE.
+
+    Columnas: `Nombre`, `key` (canon_key) y una por año ("2024", ...).
+    """
+    estado = os.stat(ruta)
+    anios_clave = None if anios is None else tuple(sorted(str(a) for a in anios))
+    clave = (os.path.abspath(ruta), estado.st_mtime_ns, estado.st_size, anios_clave, sexo, dtype)
+    if cache and clave in _cache:
+        return _cache[clave].copy()
+
+    pobl = pd.read_csv(ruta, sep=";", dtype={"Municipios": str, "Sexo": str, "Periodo": str},
+                       thousands=".", decimal=",", encoding="utf-8-sig")
+    pobl = pobl[pobl["Sexo"].str.strip() == sexo]
+    if anios_clave is not None:
+        pobl = pobl[pobl["Periodo"].str.strip().isin(anios_clave)]
+
+    # Solo municipios (código de 5 cifras), fuera el total provincial "28 Madrid"
+    partes = pobl["Municipios"].str.extract(r"^\s*(\d+)\s+(.*)$")
+    pobl, partes = pobl[partes[0].str.len() == 5], partes[partes[0].str.len() == 5]
+    pobl = pobl.assign(
+        codigo_ine=pd.to_numeric(partes[0]).astype("int32"),
+        Periodo=pobl["Periodo"].str.strip(),
+        Total=pd.to_numeric(pobl["Total"], errors="coerce"),
+    )
+
+    ancho = pobl.pivot_table(index="codigo_ine", columns="Periodo", values="Total", aggfunc="first").astype(dtype)
+    ancho.columns = [str(c) for c in ancho.columns]
+    nombres = pobl.drop_duplicates("codigo_ine").set_index("codigo_ine")["Municipios"]
+    ancho.insert(0, "Nombre", normalizar_nombres(nombres.reindex(ancho.index)))
+    ancho.insert(1, "key", claves_canonicas(ancho["Nombre"]))
+
+    if cache:
+        _cache[clave] = ancho
+        return ancho.copy()
+    return ancho
+
+
+def limpiar_cache():
+    _cache.clear()
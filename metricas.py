@@ -0,0 +1,358 @@
+"""
+Métricas de tiempo en formato Prometheus, sin dependencias ni colector externo.
+
+- histograma por ruta (`vivienda_peticion_segundos{ruta,metodo,estado}`)
+- histograma por fase dentro de una petición (`vivienda_fase_segundos{ruta,fase}`):
+  filtrar, puntuar, figura, serializar, render...
+- tiempos de las etapas del pipeline, leídos del manifiesto de pipeline.py
+- con varios procesos (servidor.py) cada trabajador vuelca sus series en
+  `directorio` una vez por segundo (si han cambiado) y /metrics suma las de
+  todos
+- perfilador por muestreo opcional para las peticiones lentas: con
+  PERFILAR_LENTAS_MS=<umbral> un hilo toma la pila de las peticiones en curso
+  cada PERFILAR_INTERVALO_MS y, si una tarda más que el umbral, escribe las
+  pilas más frecuentes en data_interfaz/perfiles/
+
+Uso en una ruta:
+
+    with fase("figura"):
+        fig = ...
+
+app.py llama a instrumentar(app), que añade los hooks y la ruta /metrics.
+"""
+import bisect
+import json
+import os
+import pickle
+import sys
+import threading
+import time
+from collections import Counter
+
+# Límites superiores de los buckets en segundos (+Inf va aparte)
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PREFIJO = "vivienda"
+MANIFIESTO_PIPELINE = os.path.join("data_interfaz", "manifiesto_pipeline.json")
+PERFILES_DIR = os.path.join("data_interfaz", "perfiles")
+
+AYUDA = {
+    "peticion_segundos": "Duración de las peticiones HTTP por ruta",
+    "fase_segundos": "Duración de cada fase dentro de una petición",
+    "perfiles_lentos_total": "Peticiones lentas perfiladas",
+}
+
+
+class Histograma:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.cuentas = [0] * (len(buckets) + 1)
+        self.suma = 0.0
+
+    def observar(self, valor):
+        self.cuentas[bisect.bisect_left(self.buckets, valor)] += 1
+        self.suma += valor
+
+    def sumar(self, otro):
+        self.cuentas = [a + b for a, b in zip(self.cuentas, otro.cuentas)]
+        self.suma += otro.suma
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _etiquetas(etiquetas):
+    if not etiquetas:
+        return ""
+    return "{" + ",".join(f'{k}="{_escapar(v)}"' for k, v in etiquetas) + "}"
+
+
+class Metricas:
+    """Histogramas y contadores en memoria, con exposición en texto Prometheus."""
+
+    def __init__(self, prefijo=PREFIJO, directorio=None, cada_s=1.0):
+        self.prefijo = prefijo
+        self._lock = threading.Lock()
+        self.histogramas = {}
+        self.contadores = {}
+        # Funciones que devuelven líneas ya formateadas (estado de otras piezas)
+        self.recolectores = []
+        # Varios procesos: carpeta compartida donde cada uno vuelca sus series
+        self.directorio = directorio
+        self.cada_s = cada_s
+        self._cambios = False
+
+    def observar(self, nombre, segundos, **etiquetas):
+        clave = tuple(sorted(etiquetas.items()))
+        with self._lock:
+            serie = self.histogramas.setdefault(nombre, {})
+            histograma = serie.get(clave)
+            if histograma is None:
+                histograma = serie[clave] = Histograma()
+            histograma.observar(segundos)
+            self._cambios = True
+
+    def incrementar(self, nombre, valor=1, **etiquetas):
+        clave = tuple(sorted(etiquetas.items()))
+        with self._lock:
+            serie = self.contadores.setdefault(nombre, {})
+            serie[clave] = serie.get(clave, 0) + valor
+            self._cambios = True
+
+    # =========================
+    # VARIOS PROCESOS
+    # =========================
+    def _ruta_volcado(self, pid=None):
+        return os.path.join(self.directorio, f"{pid or os.getpid()}.pkl")
+
+    def volcar(self, forzar=False):
+        """Escribe las series de este proceso en `directorio` si han cambiado."""
+        if self.directorio is None:
+            return
+        with self._lock:
+            if not (self._cambios or forzar):
+                return
+            estado = pickle.dumps((self.histogramas, self.contadores), protocol=pickle.HIGHEST_PROTOCOL)
+            self._cambios = False
+        ruta = self._ruta_volcado()
+        with open(ruta + ".tmp", "wb") as f:
+            f.write(estado)
+        os.replace(ruta + ".tmp", ruta)
+
+    def arrancar_volcado(self):
+        """Hilo que vuelca las series cada `cada_s` (se llama en cada trabajador tras el fork)."""
+        def bucle():
+            while True:
+                time.sleep(self.cada_s)
+                self.volcar()
+
+        threading.Thread(target=bucle, name="volcado-metricas", daemon=True).start()
+
+    def _series(self):
+        """Series de este proceso más las volcadas por los demás (incluidos los ya terminados)."""
+        with self._lock:
+            histogramas = {n: {c: _copia(h) for c, h in s.items()} for n, s in self.histogramas.items()}
+            contadores = {n: dict(s) for n, s in self.contadores.items()}
+        if self.directorio is None:
+            return histogramas, contadores
+
+        propio = os.path.basename(self._ruta_volcado())
+        for fichero in os.listdir(self.directorio):
+            if not fichero.endswith(".pkl") or fichero == propio:
+                continue
+            try:
+                with open(os.path.join(self.directorio, fichero), "rb") as f:
+                    otros_h, otros_c = pickle.load(f)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                continue
+            for nombre, serie in otros_h.items():
+                destino = histogramas.setdefault(nombre, {})
+                for clave, h in serie.items():
+                    if clave in destino:
+                        destino[clave].sumar(h)
+                    else:
+                        destino[clave] = h
+            for nombre, serie in otros_c.items():
+                destino = contadores.setdefault(nombre, {})
+                for clave, valor in serie.items():
+                    destino[clave] = destino.get(clave, 0) + valor
+        return histogramas, contadores
+
+    def exponer(self):
+        """Texto en el formato de exposición de Prometheus (0.0.4)."""
+        lineas = []
+        histogramas, contadores = self._series()
+        for nombre, serie in sorted(histogramas.items()):
+            completo = f"{self.prefijo}_{nombre}"
+            lineas.append(f"# HELP {completo} {AYUDA.get(nombre, nombre)}")
+            lineas.append(f"# TYPE {completo} histogram")
+            for clave, h in sorted(serie.items()):
+                acumulado = 0
+                for limite, cuenta in zip(h.buckets + (float("inf"),), h.cuentas):
+                    acumulado += cuenta
+                    le = "+Inf" if limite == float("inf") else repr(limite)
+                    lineas.append(f"{completo}_bucket{_etiquetas(clave + (('le', le),))} {acumulado}")
+                lineas.append(f"{completo}_sum{_etiquetas(clave)} {h.suma:.6f}")
+                lineas.append(f"{completo}_count{_etiquetas(clave)} {acumulado}")
+        for nombre, serie in sorted(contadores.items()):
+            completo = f"{self.prefijo}_{nombre}"
+            lineas.append(f"# HELP {completo} {AYUDA.get(nombre, nombre)}")
+            lineas.append(f"# TYPE {completo} counter")
+            for clave, valor in sorted(serie.items()):
+                lineas.append(f"{completo}{_etiquetas(clave)} {valor}")
+        for recolector in self.recolectores:
+            lineas.extend(recolector())
+        return "\n".join(lineas) + "\n"
+
+
+def _copia(histograma):
+    copia = Histograma(histograma.buckets)
+    copia.sumar(histograma)
+    return copia
+
+
+METRICAS = Metricas()
+
+# Ruta de la petición en curso en cada hilo ("-" fuera de una petición)
+_contexto = threading.local()
+
+
+class fase:
+    """Context manager que mide una fase con nombre dentro de la petición en curso."""
+
+    __slots__ = ("nombre", "metricas", "inicio")
+
+    def __init__(self, nombre, metricas=METRICAS):
+        self.nombre = nombre
+        self.metricas = metricas
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metricas.observar(
+            "fase_segundos", time.perf_counter() - self.inicio,
+            ruta=getattr(_contexto, "ruta", "-"), fase=self.nombre,
+        )
+        return False
+
+
+# =========================
+# PERFILADOR DE PETICIONES LENTAS
+# =========================
+class PerfiladorLentas:
+    """
+    Muestrea la pila de los hilos con una petición en curso y guarda un
+    informe de las que superan el umbral.
+    """
+
+    def __init__(self, umbral_s, intervalo_s=0.005, carpeta=PERFILES_DIR, metricas=METRICAS, profundidad=40):
+        self.umbral_s = umbral_s
+        self.intervalo_s = intervalo_s
+        self.carpeta = carpeta
+        self.metricas = metricas
+        self.profundidad = profundidad
+        self._activas = {}
+        self._lock = threading.Lock()
+        self._hilo = None
+        self._pid = None
+
+    def _arrancar(self):
+        # Tras un fork (gunicorn) el hilo del proceso padre no existe
+        if self._hilo is None or self._pid != os.getpid() or not self._hilo.is_alive():
+            self._pid = os.getpid()
+            self._hilo = threading.Thread(target=self._muestrear, name="perfilador-lentas", daemon=True)
+            self._hilo.start()
+
+    def empezar(self):
+        with self._lock:
+            self._arrancar()
+            self._activas[threading.get_ident()] = Counter()
+
+    def terminar(self, ruta, segundos):
+        with self._lock:
+            muestras = self._activas.pop(threading.get_ident(), None)
+        if muestras is not None and segundos >= self.umbral_s:
+            self.metricas.incrementar("perfiles_lentos_total", ruta=ruta)
+            self._escribir(ruta, segundos, muestras)
+
+    def _muestrear(self):
+        while True:
+            time.sleep(self.intervalo_s)
+            with self._lock:
+                if not self._activas:
+                    continue
+                marcos = sys._current_frames()
+                for ident, muestras in self._activas.items():
+                    marco = marcos.get(ident)
+                    pila = []
+                    while marco is not None and len(pila) < self.profundidad:
+                        codigo = marco.f_code
+                        pila.append(f"{os.path.basename(codigo.co_filename)}:{codigo.co_name}:{marco.f_lineno}")
+                        marco = marco.f_back
+                    muestras[tuple(reversed(pila))] += 1
+
+    def _escribir(self, ruta, segundos, muestras, top=15):
+        os.makedirs(self.carpeta, exist_ok=True)
+        nombre = f"{time.strftime('%Y%m%d-%H%M%S')}_{ruta}_{int(segundos * 1000)}ms.txt"
+        total = sum(muestras.values())
+        with open(os.path.join(self.carpeta, nombre), "w", encoding="utf-8") as f:
+            f.write(f"{ruta}: {segundos * 1000:.0f} ms, {total} muestras cada {self.intervalo_s * 1000:.0f} ms\n")
+            for pila, n in muestras.most_common(top):
+                f.write(f"\n{n} ({n / total:.0%})\n")
+                f.writelines(f"  {marco}\n" for marco in pila)
+
+
+# =========================
+# PIPELINE
+# =========================
+def metricas_pipeline(ruta=MANIFIESTO_PIPELINE, prefijo=PREFIJO):
+    """Tiempos por etapa guardados por pipeline.py en su manifiesto."""
+    try:
+        with open(ruta, encoding="utf-8") as f:
+            etapas = json.load(f).get("etapas", {})
+    except (OSError, ValueError):
+        return []
+    series = [
+        ("pipeline_etapa_ultima_segundos", "gauge", "Duración de la última ejecución de cada etapa", "segundos"),
+        ("pipeline_etapa_segundos_total", "counter", "Tiempo acumulado de cada etapa", "segundos_total"),
+        ("pipeline_etapa_ejecuciones_total", "counter", "Ejecuciones de cada etapa", "ejecuciones"),
+    ]
+    lineas = []
+    for nombre, tipo, ayuda, campo in series:
+        lineas.append(f"# HELP {prefijo}_{nombre} {ayuda}")
+        lineas.append(f"# TYPE {prefijo}_{nombre} {tipo}")
+        for etapa, registro in sorted(etapas.items()):
+            if campo in registro:
+                lineas.append(f"{prefijo}_{nombre}{_etiquetas((('etapa', etapa),))} {registro[campo]}")
+    return lineas
+
+
+# =========================
+# FLASK
+# =========================
+def instrumentar(app, metricas=METRICAS, perfilador=None):
+    """Mide cada petición de `app` y añade la ruta /metrics."""
+    from flask import g, request
+
+    if perfilador is None and os.environ.get("PERFILAR_LENTAS_MS"):
+        perfilador = PerfiladorLentas(
+            float(os.environ["PERFILAR_LENTAS_MS"]) / 1000,
+            float(os.environ.get("PERFILAR_INTERVALO_MS", 5)) / 1000,
+        )
+
+    @app.before_request
+    def _empezar():
+        _contexto.ruta = request.endpoint or "sin_ruta"
+        g._inicio_peticion = time.perf_counter()
+        if perfilador is not None:
+            perfilador.empezar()
+
+    @app.after_request
+    def _estado(respuesta):
+        g._estado_peticion = respuesta.status_code
+        return respuesta
+
+    @app.teardown_request
+    def _terminar(exc):
+        inicio = g.pop("_inicio_peticion", None)
+        if inicio is None:
+            return
+        segundos = time.perf_counter() - inicio
+        ruta = _contexto.ruta
+        metricas.observar(
+            "peticion_segundos", segundos,
+            ruta=ruta, metodo=request.method, estado=g.pop("_estado_peticion", 500),
+        )
+        if perfilador is not None:
+            perfilador.terminar(ruta, segundos)
+        _contexto.ruta = "-"
+
+    @app.route("/metrics")
+    def metrics():
+        return app.response_class(metricas.exponer(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+    metricas.recolectores.append(metricas_pipeline)
+    return perfilador
@@ -0,0 +1,255 @@
+"""
+Motor vectorizado del recomendador de municipios.
+
+Al crearse precalcula, para cada clúster de población:
+
+- la matriz normalizada (min-max dentro del clúster) de las cinco dimensiones
+- los tres mejores municipios de cada dimensión (top-k parcial)
+
+Puntuar un perfil es un producto matriz-vector y elegir los tres municipios
+recomendados solo recorre esas listas precalculadas, así que un lote de miles
+de perfiles se resuelve sin volver a tocar el DataFrame.
+
+Con un índice de proximidad (proximidad.py) las respuestas pueden limitar la
+búsqueda a los municipios a menos de `radio_km` del lugar de trabajo
+(`trabajo`, código INE). En ese caso el top-k se calcula sobre los
+municipios permitidos en lugar de usar las listas precalculadas.
+"""
+import numpy as np
+
+DIMENSIONES = ["educacion", "salud", "transporte", "economia", "housing"]
+
+CLUSTER_POR_POBLACION = {"poca": 1, "media": 2, "mucha": 3}
+
+# Número de municipios recomendados por perfil
+N_RECOMENDADOS = 3
+
+
+def preferencias_desde_respuestas(respuestas):
+    """
+    Convierte las respuestas del test (formulario o JSON) en (cluster, pesos).
+
+    Aplica los mismos ajustes que el formulario: el entorno urbano suma a
+    transporte y economía, el natural a vivienda y salud, y el ocio reparte
+    la mitad de su valor entre transporte y economía.
+    """
+    cluster = CLUSTER_POR_POBLACION.get(respuestas.get("cluster", "media"), 2)
+
+    educacion = int(respuestas.get("educacion", 3))
+    salud = int(respuestas.get("salud", 3))
+    transporte = int(respuestas.get("transporte", 3))
+    economia = int(respuestas.get("economia", 3))
+    housing = int(respuestas.get("housing", 3))
+    ocio = int(respuestas.get("ocio", 3))
+    entorno = respuestas.get("entorno", "mixto")
+
+    if entorno == "urbano":
+        transporte += 1
+        economia += 1
+    elif entorno == "natural":
+        housing += 1
+        salud += 1
+
+    transporte += ocio // 2
+    economia += ocio // 2
+
+    preferencias = {
+        "educacion": educacion,
+        "salud": salud,
+        "transporte": transporte,
+        "economia": economia,
+        "housing": housing,
+    }
+    return cluster, preferencias
+
+
+def filtro_desde_respuestas(respuestas):
+    """(código INE del trabajo, radio en km) o None si no se ha pedido filtro."""
+    trabajo = respuestas.get("trabajo")
+    radio = respuestas.get("radio_km")
+    if trabajo in (None, "") or radio in (None, ""):
+        return None
+    radio = float(radio)
+    if not np.isfinite(radio) or radio < 0:
+        raise ValueError(f"radio_km debe ser un número no negativo: {radio}")
+    return int(trabajo), radio
+
+
+def top_k(matriz, k):
+    """Índices de las k filas mayores de cada columna, ordenadas (NaN al final)."""
+    k = min(k, matriz.shape[0])
+    valores = np.nan_to_num(matriz, nan=-np.inf)
+    top = np.argpartition(-valores, k - 1, axis=0)[:k]
+    orden = np.argsort(-np.take_along_axis(valores, top, axis=0), axis=0, kind="stable")
+    return np.take_along_axis(top, orden, axis=0)
+
+
+class MotorRecomendador:
+    def __init__(self, df, k_por_dimension=N_RECOMENDADOS, proximidad=None):
+        self.clusters = {}
+        self.proximidad = proximidad
+
+        df = df.dropna(subset=["grupo"])
+        for cluster, df_local in df.groupby(df["grupo"].astype(int)):
+            df_local = df_local.reset_index(drop=True)
+            valores = df_local[DIMENSIONES].to_numpy(dtype=np.float64)
+
+            # Normalización min-max por dimensión dentro del clúster
+            minimo = np.nanmin(valores, axis=0)
+            rango = np.nanmax(valores, axis=0) - minimo
+            normalizada = np.where(rango > 0, (valores - minimo) / np.where(rango > 0, rango, 1), 0.0)
+
+            # Top-k parcial por dimensión (argpartition + orden solo de esos k)
+            top = top_k(valores, k_por_dimension)
+
+            self.clusters[cluster] = {
+                "df": df_local,
+                "nombres": df_local["Nombre"].to_numpy(),
+                "codigos": df_local["codigo_ine"].to_numpy() if "codigo_ine" in df_local else None,
+                "valores": valores,
+                "normalizada": normalizada,
+                "top": top.T.copy(),  # (dimensión, k)
+            }
+
+    def _datos_cluster(self, cluster):
+        datos = self.clusters.get(int(cluster))
+        if datos is None:
+            raise ValueError(f"Clúster sin municipios: {cluster}")
+        return datos
+
+    def permitidos(self, respuestas):
+        """Códigos INE dentro del radio pedido en las respuestas (None = sin filtro)."""
+        filtro = filtro_desde_respuestas(respuestas)
+        if filtro is None:
+            return None
+        if self.proximidad is None:
+            raise ValueError("El filtro por distancia necesita el índice de proximidad")
+        trabajo, radio = filtro
+        try:
+            return self.proximidad.codigos_en_radio(trabajo, radio)
+        except KeyError as e:
+            raise ValueError(e.args[0]) from None
+
+    @staticmethod
+    def _mascara(datos, codigos):
+        """Filas del clúster cuyo código INE está en `codigos`."""
+        if codigos is None:
+            return None
+        if datos["codigos"] is None:
+            raise ValueError("El filtro por distancia necesita la columna codigo_ine")
+        return np.isin(datos["codigos"], np.fromiter(codigos, dtype=np.float64, count=len(codigos)))
+
+    @staticmethod
+    def _pesos(preferencias):
+        """Matriz (perfiles, dimensiones) de pesos normalizados a suma 1."""
+        pesos = np.asarray(preferencias, dtype=np.float64).reshape(-1, len(DIMENSIONES))
+        suma = pesos.sum(axis=1, keepdims=True)
+        return pesos / np.where(suma == 0, 1.0, suma)
+
+    def puntuar(self, cluster, preferencias):
+        """Índice personalizado de todos los municipios del clúster para un lote de perfiles."""
+        datos = self._datos_cluster(cluster)
+        return datos["normalizada"] @ self._pesos(preferencias).T  # (municipios, perfiles)
+
+    def seleccionar(self, cluster, preferencias, mascara=None):
+        """
+        Índices de los municipios recomendados para un perfil.
+
+        Se recorren las dimensiones de mayor a menor peso y en cada una se toma
+        el mejor municipio que no haya sido elegido ya. Con `mascara` solo
+        cuentan los municipios permitidos (pueden salir menos de tres).
+        """
+        datos = self._datos_cluster(cluster)
+        pesos = np.asarray(preferencias, dtype=np.float64)
+        orden_bloques = np.argsort(-pesos, kind="stable")
+
+        top = datos["top"]
+        if mascara is not None:
+            top = top_k(np.where(mascara[:, None], datos["valores"], np.nan), N_RECOMENDADOS).T
+
+        elegidos = []
+        ya_elegidos = set()
+        for bloque in orden_bloques:
+            for idx in top[bloque]:
+                if mascara is not None and not mascara[idx]:
+                    break
+                if idx not in ya_elegidos:
+                    elegidos.append((int(idx), DIMENSIONES[bloque]))
+                    ya_elegidos.add(idx)
+                    break
+
+            if len(elegidos) == N_RECOMENDADOS:
+                break
+        return elegidos
+
+    def recomendar(self, cluster, preferencias, codigos=None):
+        """
+        Recomendación de un perfil como lista de dicts (para las plantillas).
+        `codigos` limita la recomendación a esos municipios (códigos INE).
+        """
+        datos = self._datos_cluster(cluster)
+        pesos = [preferencias[d] for d in DIMENSIONES]
+        indice = self.puntuar(cluster, pesos)[:, 0]
+
+        municipios = []
+        for idx, bloque in self.seleccionar(cluster, pesos, self._mascara(datos, codigos)):
+            municipio = datos["df"].iloc[idx].to_dict()
+            municipio["indice_personalizado"] = float(indice[idx])
+            municipio["destaca_en"] = bloque
+            municipio["cluster"] = cluster
+            municipios.append(municipio)
+        return municipios
+
+    def recomendar_lote(self, perfiles, k=0):
+        """
+        Recomendaciones para muchos perfiles a la vez.
+
+        `perfiles` es una lista de respuestas del test. Los perfiles se agrupan
+        por clúster y cada grupo se puntúa con un único producto matricial. Si
+        `k` > 0 se devuelve además el top-k por índice personalizado. Un perfil
+        con `trabajo` y `radio_km` solo recibe municipios dentro de ese radio.
+        """
+        resultados = [None] * len(perfiles)
+        por_cluster = {}
+        for i, respuestas in enumerate(perfiles):
+            cluster, preferencias = preferencias_desde_respuestas(respuestas)
+            por_cluster.setdefault(cluster, []).append(
+                (i, [preferencias[d] for d in DIMENSIONES], self.permitidos(respuestas))
+            )
+
+        for cluster, grupo in por_cluster.items():
+            datos = self._datos_cluster(cluster)
+            nombres = datos["nombres"]
+            pesos = np.array([p for _, p, _ in grupo], dtype=np.float64)
+            indices = self.puntuar(cluster, pesos)  # (municipios, perfiles)
+
+            if k > 0:
+                top = top_k(indices, k)
+
+            for j, (i, p, codigos) in enumerate(grupo):
+                mascara = self._mascara(datos, codigos)
+                resultado = {
+                    "cluster": cluster,
+                    "preferencias": dict(zip(DIMENSIONES, p)),
+                    "recomendados": [
+                        {
+                            "Nombre": nombres[idx],
+                            "destaca_en": bloque,
+                            "indice_personalizado": round(float(indices[idx, j]), 6),
+                        }
+                        for idx, bloque in self.seleccionar(cluster, p, mascara)
+                    ],
+                }
+                if k > 0:
+                    if mascara is None:
+                        top_perfil = top[:, j]
+                    else:
+                        top_perfil = top_k(np.where(mascara, indices[:, j], np.nan)[:, None], k)[:, 0]
+                        top_perfil = top_perfil[mascara[top_perfil]]
+                    resultado["top"] = [
+                        {"Nombre": nombres[idx], "indice_personalizado": round(float(indices[idx, j]), 6)}
+                        for idx in top_perfil
+                    ]
+                resultados[i] = resultado
+
+        return resultados
@@ -0,0 +1,371 @@
+"""
+Tabla de dimensión de municipios: cualquier forma conocida del nombre -> código INE.
+
+Cada fuente escribe los municipios a su manera ("Acebeda (La)", "28001 Acebeda,
+La", "Álamo (El)" / "Alamo (El)", ficheros de Idealista como "alamedaValle").
+En vez de normalizar nombres en cada merge, se precalcula una tabla con todas
+las variantes conocidas y su código INE, y los cruces se hacen sobre el código.
+
+Fuentes de variantes:
+- nombres INE de los CSV estadísticos (id + Nombre)
+- external_data/lau_id_nombre.csv
+- etiquetas del shapefile muni2024 (CMUN)
+- nombres de external_data/municipios_madrid.csv y municipios_con_cluster.csv
+- nombres de fichero de los CSV de Idealista (data/vivienda/...)
+
+Uso:
+    python municipios.py   # regenera la tabla y el informe de no resueltos
+"""
+import glob
+import os
+import re
+from collections import Counter
+from functools import lru_cache
+
+import pandas as pd
+
+from lector_ine import CODIGO_PROVINCIA, canon_key, codigo_ine, leer_ine, normalize_nombre
+
+# Rutas
+DIMENSION_CSV = os.path.join("external_data", "dimension_municipios.csv")
+NO_RESUELTOS_CSV = os.path.join("external_data", "municipios_no_resueltos.csv")
+INE_CSV = [
+    os.path.join("data", bloque, "**", "*.csv")
+    for bloque in ("economia", "educacion", "sanidad", "transporte")
+] + [os.path.join("data", "vivienda", "*.csv")]
+LAU_CSV = os.path.join("external_data", "lau_id_nombre.csv")
+SHAPEFILE = os.path.join("data", "muni2024", "muni2024.shp")
+NOMBRES_CSV = [
+    (os.path.join("external_data", "municipios_madrid.csv"), "Municipio", ";"),
+    (os.path.join("external_data", "municipios_con_cluster.csv"), "Nombre", ","),
+]
+IDEALISTA_DIRS = [
+    os.path.join("data", "vivienda", "datos_filtrados"),
+    os.path.join("data", "vivienda", "datos_filtrados_1"),
+    os.path.join("data", "vivienda", "datos_filtrados_2"),
+    os.path.join("data", "vivienda", "datos_nuevos"),
+]
+
+# Variantes que no se deducen del nombre INE (sobre todo nombres de fichero
+# de Idealista): canon_key de la variante -> nombre INE
+ALIAS_MANUALES = {
+    "alamedavalle": "Alameda del Valle",
+    "aldeafresno": "Aldea del Fresno",
+    "becerrilsierra": "Becerril de la Sierra",
+    "belmontetajo": "Belmonte de Tajo",
+    "berzosalozoya": "Berzosa del Lozoya",
+    "breatajo": "Brea de Tajo",
+    "cabanillassierra": "Cabanillas de la Sierra",
+    "cadalsovidrios": "Cadalso de los Vidrios",
+    "camarmaesteruelas": "Camarma de Esteruelas",
+    "cerverabuitrago": "Cervera de Buitrago",
+    "colmenararroyo": "Colmenar del Arroyo",
+    "colmenaroreja": "Colmenar de Oreja",
+    "cubassagra": "Cubas de la Sagra",
+    "elalamo": "Alamo (El)",
+    "madarcosreferences": "Madarcos",
+    "montejosierrareferences": "Montejo de la Sierra",
+    "navarredondasomereferences": "Navarredonda y San Mamés",
+    "puentesviejassomereferences": "Puentes Viejas",
+    "elatazar": "Atazar (El)",
+    "elberrueco": "Berrueco (El)",
+    "elboalo": "Boalo (El)",
+    "elmolar": "Molar (El)",
+    "elvellon": "Vellón (El)",
+    "fresnedillasoliva": "Fresnedillas de la Oliva",
+    "fresnotorote": "Fresno de Torote",
+    "fuentesaz": "Fuente el Saz de Jarama",
+    "fuentiduenatajo": "Fuentidueña de Tajo",
+    "gargantamontes": "Garganta de los Montes",
+    "gargantillalozoya": "Gargantilla del Lozoya y Pinilla de Buitrago",
+    "guadalixsierra": "Guadalix de la Sierra",
+    "horcajosierra": "Horcajo de la Sierra-Aoslos",
+    "horcajuelosierra": "Horcajuelo de la Sierra",
+    "hoyomanzanares": "Hoyo de Manzanares",
+    "humanesmadrid": "Humanes de Madrid",
+    "lacabrera": "Cabrera (La)",
+    "lahiruela": "Hiruela (La)",
+    "lasernamonte": "Serna del Monte (La)",
+    "lasrozas": "Rozas de Madrid (Las)",
+    "losmolinos": "Molinos (Los)",
+    "lossantoshumosa": "Santos de la Humosa (Los)",
+    "loyozuela": "Lozoyuela-Navas-Sieteiglesias",
+    "manzanaresreal": "Manzanares el Real",
+    "mejoradacampo": "Mejorada del Campo",
+    "mirafloressierra": "Miraflores de la Sierra",
+    "moralejaenmedio": "Moraleja de Enmedio",
+    "moratatajuna": "Morata de Tajuña",
+    "navasrey": "Navas del Rey",
+    "olmedafuentes": "Olmeda de las Fuentes",
+    "pelayospresa": "Pelayos de la Presa",
+    "peralestajuna": "Perales de Tajuña",
+    "pezuelatorres": "Pezuela de las Torres",
+    "pinillavalle": "Pinilla del Valle",
+    "pozueloalarcon": "Pozuelo de Alarcón",
+    "pozuelorey": "Pozuelo del Rey",
+    "pradenarincon": "Prádena del Rincón",
+    "pueblasierra": "Puebla de la Sierra",
+    "robledillojara": "Robledillo de la Jara",
+    "robledochavela": "Robledo de Chavela",
+    "rozaspuertoreal": "Rozas de Puerto Real",
+    "sanagustinguadalix": "San Agustín del Guadalix",
+    "sanfernandohenares": "San Fernando de Henares",
+    "sanlorenzoescorial": "San Lorenzo de El Escorial",
+    "sanmartinvaldeiglesias": "San Martín de Valdeiglesias",
+    "sanmartinvega": "San Martín de la Vega",
+    "sansebastianreyes": "San Sebastián de los Reyes",
+    "santamariaalameda": "Santa María de la Alameda",
+    "serranillosvalle": "Serranillos del Valle",
+    "sevillanueva": "Sevilla la Nueva",
+    "sotoreal": "Soto del Real",
+    "talamancajarama": "Talamanca de Jarama",
+    "torrejonardoz": "Torrejón de Ardoz",
+    "torrejoncalzada": "Torrejón de la Calzada",
+    "torrejonvelasco": "Torrejón de Velasco",
+    "torremochajarama": "Torremocha de Jarama",
+    "torresalameda": "Torres de la Alameda",
+    "valdeolmosalapardo": "Valdeolmos-Alalpardo",
+    "valdetorresjarama": "Valdetorres de Jarama",
+    "valverdealcala": "Valverde de Alcalá",
+    "velillasanantonio": "Velilla de San Antonio",
+    "villamanriquetajo": "Villamanrique de Tajo",
+    "villanuevacanada": "Villanueva de la Cañada",
+    "villanuevapardillo": "Villanueva del Pardillo",
+    "villanuevaperales": "Villanueva de Perales",
+    "villaprado": "Villa del Prado",
+    "villarejosalvanes": "Villarejo de Salvanés",
+    "villarolmo": "Villar del Olmo",
+    "villaviciosaodon": "Villaviciosa de Odón",
+    "villaviejalozoya": "Villavieja del Lozoya",
+}
+
+
+def clave_municipio(nombre):
+    """
+    Clave de búsqueda: canon_key con el artículo siempre al final.
+
+    'Las Rozas de Madrid', 'Rozas de Madrid (Las)' y 'Rozas de Madrid, Las'
+    dan la misma clave.
+    """
+    s = normalize_nombre(nombre)
+    if pd.isna(s):
+        return None
+    m = re.match(r"^(El|La|Los|Las)\s+([^()]+)$", s, flags=re.I)
+    if m:
+        s = f"{m.group(2)} ({m.group(1)})"
+    return canon_key(s) or None
+
+
+# =========================
+# CONSTRUCCIÓN
+# =========================
+def _variantes_fichero(ruta, columna, sep):
+    nombres = pd.read_csv(ruta, sep=sep, encoding="utf-8-sig", usecols=[columna])[columna]
+    return nombres.dropna().astype(str).str.strip().unique()
+
+
+def _comprobar_ambiguas(dimension):
+    """Una clave no puede apuntar a dos municipios."""
+    ambiguas = dimension.groupby("clave")["codigo_ine"].nunique()
+    if (ambiguas > 1).any():
+        raise ValueError(f"Claves ambiguas en la tabla de municipios: {sorted(ambiguas[ambiguas > 1].index)}")
+
+
+def construir_dimension(destino=DIMENSION_CSV, informe=NO_RESUELTOS_CSV):
+    """
+    Genera la tabla (codigo_ine, nombre, variante, clave, fuente).
+
+    Las fuentes con código (INE, LAU, shapefile) fijan las claves; las que
+    solo traen nombre se resuelven contra ellas y lo que no casa va al informe.
+    """
+    # geopandas solo se necesita aquí, para leer los atributos del shapefile
+    import geopandas as gpd
+
+    filas = []
+
+    # 1️⃣ Fuentes con código. Los códigos válidos son los del shapefile
+    shp = gpd.read_file(SHAPEFILE, ignore_geometry=True)
+    codigos_shp = CODIGO_PROVINCIA * 1000 + shp["CMUN"].astype(int)
+    for columna in ("DESCR", "ETIQUETA"):
+        filas += [(int(c), n.strip(), "shapefile") for c, n in zip(codigos_shp, shp[columna])]
+    validos = set(int(c) for c in codigos_shp)
+
+    # Nombre oficial: el de los CSV estadísticos con id de 4 cifras
+    # ("Rozas de Madrid (Las)"); los de 5 cifras vienen de LAU y traen algún
+    # código cambiado (28691), así que sus filas con código desconocido se
+    # tratan como nombres sin código
+    oficiales = {}
+    sin_codigo = []
+    for patron in INE_CSV:
+        for ruta in sorted(glob.glob(patron, recursive=True)):
+            try:
+                ine = leer_ine(ruta, anios=[])
+            except (ValueError, UnicodeDecodeError):
+                continue  # no es un CSV con formato INE
+            for codigo, id_, nombre in zip(ine.index.astype(int), ine["id"], ine["Nombre"].str.strip()):
+                if codigo not in validos:
+                    sin_codigo.append(nombre)
+                    continue
+                filas.append((codigo, nombre, "ine"))
+                if len(id_) == 4:
+                    oficiales.setdefault(codigo, nombre)
+    for codigo, nombre in zip(codigos_shp, shp["ETIQUETA"]):
+        oficiales.setdefault(int(codigo), nombre.strip())
+
+    lau = pd.read_csv(LAU_CSV, dtype=str)
+    lau_sin_codigo = []
+    for c, n in zip(lau["id"].astype(int), lau["nombre"].str.strip()):
+        if c in validos:
+            filas.append((c, n, "lau"))
+        else:
+            lau_sin_codigo.append(n)
+
+    dimension = pd.DataFrame(filas, columns=["codigo_ine", "variante", "fuente"])
+    dimension["clave"] = dimension["variante"].map(clave_municipio)
+
+    _comprobar_ambiguas(dimension)
+    por_clave = dict(zip(dimension["clave"], dimension["codigo_ine"]))
+
+    # 3️⃣ Fuentes solo con nombre: clave exacta, alias manual o, si no, única
+    # clave oficial que empiece por (o contenga) la del nombre ("alcala")
+    claves_oficiales = {clave_municipio(n): c for c, n in oficiales.items()}
+
+    def resolver_nombre(nombre):
+        clave = clave_municipio(nombre)
+        if clave is None:
+            return None
+        if clave in por_clave:
+            return por_clave[clave]
+        alias = ALIAS_MANUALES.get(canon_key(nombre))
+        if alias:
+            return por_clave[clave_municipio(alias)]
+        for coincide in (str.startswith, str.__contains__):
+            candidatos = {c for k, c in claves_oficiales.items() if coincide(k, clave)}
+            if len(candidatos) == 1:
+                return candidatos.pop()
+        return None
+
+    idealista = [
+        os.path.splitext(os.path.basename(ruta))[0]
+        for directorio in IDEALISTA_DIRS
+        for ruta in sorted(glob.glob(os.path.join(directorio, "*.csv")))
+    ]
+    por_fuente = [("ine", sin_codigo), ("lau", lau_sin_codigo)] + [
+        (os.path.splitext(os.path.basename(ruta))[0], _variantes_fichero(ruta, columna, sep))
+        for ruta, columna, sep in NOMBRES_CSV
+    ] + [("idealista", idealista)]
+
+    no_resueltos = []
+    # 2️⃣ Los alias manuales entran como variantes más de la tabla
+    nuevas = [(por_clave[clave_municipio(n)], alias, "alias") for alias, n in ALIAS_MANUALES.items()]
+    for fuente, nombres in por_fuente:
+        for nombre in nombres:
+            codigo = resolver_nombre(nombre)
+            if codigo is None:
+                no_resueltos.append((nombre, fuente))
+            else:
+                nuevas.append((codigo, nombre, fuente))
+
+    nuevas = pd.DataFrame(nuevas, columns=["codigo_ine", "variante", "fuente"])
+    nuevas["clave"] = nuevas["variante"].map(clave_municipio)
+    dimension = pd.concat([dimension, nuevas], ignore_index=True)
+    _comprobar_ambiguas(dimension)
+
+    dimension.insert(1, "nombre", dimension["codigo_ine"].map(oficiales))
+    dimension = (
+        dimension.drop_duplicates(subset=["variante", "codigo_ine"])
+        .sort_values(["codigo_ine", "fuente", "variante"])
+        .reset_index(drop=True)
+    )
+    dimension.to_csv(destino, index=False)
+
+    informe_df = pd.DataFrame(sorted(set(no_resueltos)), columns=["variante", "fuente"])
+    informe_df.to_csv(informe, index=False)
+
+    print(f"Tabla de municipios guardada en {destino}: {dimension['codigo_ine'].nunique()} municipios, "
+          f"{len(dimension)} variantes, {len(informe_df)} sin resolver ({informe})")
+    return dimension
+
+
+# =========================
+# RESOLUCIÓN
+# =========================
+class ResolutorMunicipios:
+    """
+    Nombre (en cualquier variante) o código -> código INE, memoizado.
+
+    Los nombres que no se resuelven se acumulan en `no_resueltos` con la
+    fuente que los pidió, para el informe.
+    """
+
+    def __init__(self, dimension):
+        self.dimension = dimension
+        self._por_clave = dict(zip(dimension["clave"], dimension["codigo_ine"].astype(int)))
+        self.nombres = (
+            dimension.drop_duplicates("codigo_ine").set_index("codigo_ine")["nombre"].to_dict()
+        )
+        self._memo = {}
+        self.no_resueltos = Counter()
+
+    def _codigo(self, nombre):
+        if nombre not in self._memo:
+            texto = str(nombre).strip()
+            # '28001 Acebeda, La' (población): manda el código; '28 Madrid' es
+            # el total provincial y no se resuelve
+            prefijo = re.match(r"^(\d+)\s+", texto)
+            if prefijo:
+                texto = prefijo.group(1)
+            if texto.isdigit():
+                # Ya es un código (28001) o un id de 4 cifras de los CSV (0014)
+                codigo = codigo_ine([texto])[0]
+                codigo = int(codigo) if codigo in self.nombres else None
+            else:
+                # Clave con el artículo al final y, si no, la clave tal cual (alias)
+                codigo = self._por_clave.get(clave_municipio(texto))
+                if codigo is None:
+                    codigo = self._por_clave.get(canon_key(texto))
+            self._memo[nombre] = codigo
+        return self._memo[nombre]
+
+    def resolver(self, nombre, fuente=""):
+        if pd.isna(nombre):
+            return None
+        codigo = self._codigo(nombre)
+        if codigo is None:
+            self.no_resueltos[(str(nombre), fuente)] += 1
+        return codigo
+
+    def resolver_serie(self, serie, fuente=""):
+        """Códigos INE (Int32, <NA> si no se resuelve) para una Series de nombres."""
+        apariciones = serie.dropna().value_counts()
+        codigos = {n: self._codigo(n) for n in apariciones.index}
+        for nombre, veces in apariciones.items():
+            if codigos[nombre] is None:
+                self.no_resueltos[(str(nombre), fuente)] += int(veces)
+        return pd.array(serie.map(codigos).tolist(), dtype="Int32")
+
+    def nombre(self, codigo):
+        return self.nombres.get(int(codigo))
+
+    def informe_no_resueltos(self, ruta=None):
+        informe = pd.DataFrame(
+            [(n, f, veces) for (n, f), veces in sorted(self.no_resueltos.items())],
+            columns=["variante", "fuente", "apariciones"],
+        )
+        if ruta:
+            informe.to_csv(ruta, index=False)
+        return informe
+
+
+def cargar_dimension(ruta=DIMENSION_CSV):
+    return pd.read_csv(ruta, dtype={"codigo_ine": "int32", "clave": str})
+
+
+@lru_cache(maxsize=None)
+def resolutor(ruta=DIMENSION_CSV):
+    """Resolutor compartido por proceso."""
+    return ResolutorMunicipios(cargar_dimension(ruta))
+
+
+if __name__ == "__main__":
+    construir_dimension()
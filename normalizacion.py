@@ -0,0 +1,302 @@
+"""
+Normalización final de indicadores por bloque (sustituye a los bucles de
+normalizacion_final_2024.ipynb).
+
+Para cada año disponible (clusterAtractividadJuntos_<año>) y en una sola
+pasada sobre la tabla de todos los años:
+
+1. Invierte los indicadores en los que "menos es mejor" (100 - valor).
+2. Media, mínimo y máximo de cada bloque por municipio (operaciones por fila).
+3. Mínimo y máximo de cada bloque por (año, clúster) con groupby.transform.
+4. Valor del bloque = media / (máx - mín) del clúster, intervalos [mín, media]
+   por bloque y total por municipio.
+
+El resultado está indexado por año. valores.csv e intervalos_ia.csv del año de
+servicio (2024) se siguen escribiendo con las mismas columnas que el notebook;
+además se guardan valores_anuales e intervalos_anuales con todos los años.
+
+Todo el cálculo es local a cada partición (año, clúster), así que el CLI
+guarda el resultado de cada partición con la huella de sus filas de entrada
+(CACHE_PARTICIONES) y en la siguiente ejecución solo recalcula las que han
+cambiado: si un municipio cambia de clúster (clusters_poblacion.py) se
+rehacen su clúster anterior y el nuevo, cuyos rangos dependen de él.
+
+Los bloques, el sentido de cada indicador y los municipios excluidos vienen de
+CONFIG (o de un JSON con la misma forma, --config).
+
+Uso:
+    python normalizacion.py [--anios 2023 2024 2025] [--config config.json] [--reconstruir]
+"""
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import time
+
+import numpy as np
+import pandas as pd
+
+from almacen import escribir_tabla, leer_tabla, ruta_existente
+
+ANIOS = ["2023", "2024", "2025"]
+ANIO_SERVICIO = "2024"
+
+ENTRADA = os.path.join("data_interfaz", "clusterAtractividadJuntos_{anio}.csv")
+VALORES = os.path.join("data_interfaz", "valores.csv")
+INTERVALOS = os.path.join("data_interfaz", "intervalos_ia.csv")
+VALORES_ANUALES = os.path.join("data_interfaz", "valores_anuales.csv")
+INTERVALOS_ANUALES = os.path.join("data_interfaz", "intervalos_anuales.csv")
+CACHE_PARTICIONES = os.path.join("data_interfaz", "normalizacion_particiones.pkl")
+
+# Cambia cuando cambia el cálculo; una caché de otra versión se descarta
+VERSION_CACHE = 1
+
+# Bloques temáticos: indicadores en los que más es mejor y en los que menos es
+# mejor (estos se invierten como 100 - valor antes de agregar)
+CONFIG = {
+    "bloques": {
+        "educacion": {
+            "mayor_mejor": [
+                "bibliotecas_100_alumnos",
+                "centros_priv_100_alumnos_priv",
+                "centros_pub_100_alumnos_pub",
+                "extraescolares_10_alumnos",
+                "idiomas_10_alumnos",
+                "profesores_priv_100_alumnos_priv",
+                "profesores_pub_100_alumnos_pub",
+                "unidades_escolares_priv_100_alumnos_priv",
+                "unidades_escolares_publicas_por_100_alumnos",
+            ],
+            "menor_mejor": [],
+        },
+        "salud": {
+            "mayor_mejor": [
+                "centros_100",
+                "farmacias_100",
+                "centrosSociales_10",
+                "clinicaDental_10",
+                "consultaPrimaria_100",
+                "otroConsulta_100",
+                "orgNoSanitaria_total_100",
+            ],
+            "menor_mejor": [],
+        },
+        "transporte": {
+            "mayor_mejor": ["bus_100", "estaciontren_100", "servicioCoches_100", "estacionbus_100"],
+            "menor_mejor": ["distanciaCentro"],
+        },
+        "economia": {
+            "mayor_mejor": ["contratos_100", "ocupadosColectivos_100", "pension_media"],
+            "menor_mejor": ["paro_total", "pensionistas_100"],
+        },
+        "housing": {
+            "mayor_mejor": ["Familiares", "superficieFamiliares", "Habitaciones", "Banos"],
+            "menor_mejor": ["Precio"],
+        },
+    },
+    # Se resuelven a código INE con la tabla de municipios
+    "excluidos": ["Villanueva de la Calzada", "Las Rozas", "Madrid"],
+    # Clúster para los municipios sin grupo
+    "grupo_por_defecto": 1,
+}
+
+
+def cargar_config(ruta=None):
+    if ruta is None:
+        return CONFIG
+    with open(ruta, encoding="utf-8") as f:
+        return json.load(f)
+
+
+# =========================
+# 1️⃣ CARGA
+# =========================
+def cargar_anios(anios=ANIOS, plantilla=ENTRADA):
+    """
+    Tabla de todos los años con índice (anio, fila). `fila` es la posición
+    en la tabla del año, que es el índice que escribía el notebook.
+    """
+    tablas = {}
+    for anio in anios:
+        ruta = ruta_existente(plantilla.format(anio=anio))
+        if os.path.exists(ruta):
+            tablas[anio] = leer_tabla(ruta)
+    if not tablas:
+        raise FileNotFoundError(f"No hay tablas {plantilla} para los años {', '.join(anios)}. Ejecuta: python join.py")
+    return pd.concat(tablas, names=["anio", "fila"])
+
+
+def preparar(df, config=CONFIG):
+    """Grupo por defecto, sin duplicados ni excluidos, e indicadores invertidos."""
+    df = df.copy()
+    sin_grupo = df["grupo"].isna()
+    if sin_grupo.any():
+        print(f"⚠️ {int(sin_grupo.sum())} filas sin clúster de población: se les asigna "
+              f"el grupo {config['grupo_por_defecto']} (ver clusters_poblacion.py)")
+    df["grupo"] = df["grupo"].fillna(config["grupo_por_defecto"])
+
+    claves = pd.DataFrame({"anio": df.index.get_level_values("anio"), "Nombre": df["Nombre"].to_numpy()})
+    df = df[~claves.duplicated().to_numpy()]
+
+    if config["excluidos"]:
+        from municipios import resolutor
+
+        resolver = resolutor()
+        excluidos = {resolver.resolver(n) for n in config["excluidos"]} - {None}
+        sin_codigo = [n for n in config["excluidos"] if resolver.resolver(n) is None]
+        if sin_codigo:
+            print(f"⚠️ Municipios excluidos sin código INE (se ignoran): {', '.join(sin_codigo)}")
+        codigos = df["codigo_ine"] if "codigo_ine" in df else resolver.resolver_serie(df["Nombre"])
+        df = df[~pd.Series(codigos, index=df.index).isin(excluidos)]
+
+    inversas = [c for b in config["bloques"].values() for c in b["menor_mejor"] if c in df.columns]
+    df[inversas] = 100 - df[inversas]
+    return df
+
+
+# =========================
+# 2️⃣ NORMALIZACIÓN
+# =========================
+def normalizar(df, config=CONFIG):
+    """
+    (valores, intervalos) para una tabla ya preparada con índice (anio, fila).
+
+    valores:    Nombre, grupo, un valor por bloque, mean_per_row y total
+    intervalos: Nombre, grupo, [mín, media] por bloque y [mín, media] del total
+    """
+    bloques = {
+        nombre: [c for c in b["mayor_mejor"] + b["menor_mejor"] if c in df.columns]
+        for nombre, b in config["bloques"].items()
+    }
+    bloques = {nombre: columnas for nombre, columnas in bloques.items() if columnas}
+    claves = [df.index.get_level_values("anio"), df["grupo"]]
+
+    # Estadísticos de cada bloque por municipio (por fila, sin bucles)
+    medias = pd.DataFrame({b: df[c].mean(axis=1) for b, c in bloques.items()})
+    minimos = pd.DataFrame({b: df[c].min(axis=1) for b, c in bloques.items()})
+    maximos = pd.DataFrame({b: df[c].max(axis=1) for b, c in bloques.items()})
+
+    # Rango de cada bloque por (año, clúster)
+    rango = maximos.groupby(claves).transform("max") - minimos.groupby(claves).transform("min")
+
+    valores = medias / rango
+    valores.insert(0, "grupo", df["grupo"])
+    valores.insert(0, "Nombre", df["Nombre"])
+    columnas = list(bloques)
+
+    # Total: media de los bloques entre el rango de todos los bloques del clúster
+    valores["mean_per_row"] = valores[columnas].mean(axis=1)
+    por_grupo = valores[columnas].groupby(claves)
+    valores["total"] = valores["mean_per_row"] / (
+        por_grupo.transform("max").max(axis=1) - por_grupo.transform("min").min(axis=1)
+    )
+
+    intervalos = df[["Nombre", "grupo"]].copy()
+    for b in columnas:
+        intervalos[b] = _pares(minimos[b], medias[b])
+    intervalos["total"] = _pares(valores[columnas].min(axis=1), valores[columnas].mean(axis=1))
+
+    # El código INE solo va a las tablas anuales (ver exportar)
+    if "codigo_ine" in df:
+        valores["codigo_ine"] = df["codigo_ine"]
+        intervalos["codigo_ine"] = df["codigo_ine"]
+    return valores, intervalos
+
+
+def _pares(minimos, medias):
+    """Columna de listas [mín, media] (floats de Python, como las del notebook)."""
+    return pd.Series(pd.concat([minimos, medias], axis=1).to_numpy().tolist(), index=minimos.index)
+
+
+def normalizar_anios(anios=ANIOS, config=CONFIG, plantilla=ENTRADA):
+    return normalizar(preparar(cargar_anios(anios, plantilla), config), config)
+
+
+def particiones(df, config=CONFIG):
+    """{(año, grupo): (huella, posiciones)} de una tabla ya preparada."""
+    base = hashlib.sha256(json.dumps([VERSION_CACHE, config, list(df.columns)], sort_keys=True).encode())
+    # Hash de cada fila con su índice (año, fila)
+    filas = pd.util.hash_pandas_object(df, index=True).to_numpy()
+    resultado = {}
+    for clave, posiciones in df.groupby([df.index.get_level_values("anio"), df["grupo"]]).indices.items():
+        h = base.copy()
+        h.update(filas[posiciones].tobytes())
+        resultado[clave] = (h.hexdigest()[:16], posiciones)
+    return resultado
+
+
+def normalizar_incremental(df, config=CONFIG, cache=CACHE_PARTICIONES, reutilizar=True):
+    """
+    Como normalizar(), pero reutiliza de `cache` las particiones (año, grupo)
+    cuyas filas no han cambiado. Devuelve (valores, intervalos, recalculadas).
+    """
+    previas = {}
+    if reutilizar and os.path.exists(cache):
+        with open(cache, "rb") as f:
+            guardado = pickle.load(f)
+        if guardado.get("version") == VERSION_CACHE:
+            previas = guardado["particiones"]
+
+    actuales = particiones(df, config)
+    recalculadas = sorted(c for c, (h, _) in actuales.items() if c not in previas or previas[c][0] != h)
+    partes = {c: previas[c][1:] for c in actuales if c not in recalculadas}
+    if recalculadas:
+        posiciones = np.sort(np.concatenate([actuales[c][1] for c in recalculadas]))
+        valores, intervalos = normalizar(df.iloc[posiciones], config)
+        claves = [valores.index.get_level_values("anio"), valores["grupo"]]
+        for clave, filas in valores.groupby(claves).indices.items():
+            partes[clave] = (valores.iloc[filas], intervalos.iloc[filas])
+
+    valores = pd.concat([v for v, _ in partes.values()]).reindex(df.index)
+    intervalos = pd.concat([i for _, i in partes.values()]).reindex(df.index)
+
+    os.makedirs(os.path.dirname(cache) or ".", exist_ok=True)
+    with open(cache, "wb") as f:
+        pickle.dump({"version": VERSION_CACHE,
+                     "particiones": {c: (actuales[c][0],) + partes[c] for c in actuales}}, f)
+    return valores, intervalos, recalculadas
+
+
+# =========================
+# 3️⃣ EXPORTACIÓN
+# =========================
+def exportar(valores, intervalos, anio_servicio=ANIO_SERVICIO):
+    # Todos los años, con columnas anio y codigo_ine
+    escribir_tabla(valores.reset_index(level="fila", drop=True).reset_index(), VALORES_ANUALES)
+    escribir_tabla(intervalos.reset_index(level="fila", drop=True).reset_index(), INTERVALOS_ANUALES)
+    valores = valores.drop(columns="codigo_ine", errors="ignore")
+    intervalos = intervalos.drop(columns="codigo_ine", errors="ignore")
+
+    # Año de servicio con la forma de siempre: valores con el índice de fila
+    # de la tabla del año e intervalos ordenados por nombre
+    if anio_servicio not in valores.index.get_level_values("anio"):
+        print(f"⚠️ No hay datos de {anio_servicio}: no se actualizan {VALORES} ni {INTERVALOS}")
+        return
+    escribir_tabla(valores.xs(anio_servicio, level="anio").rename_axis(None), VALORES, index=True)
+    escribir_tabla(
+        intervalos.xs(anio_servicio, level="anio").sort_values("Nombre", kind="stable").reset_index(drop=True),
+        INTERVALOS, index=True,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Normalización final de indicadores por bloque")
+    parser.add_argument("--anios", nargs="*", default=ANIOS)
+    parser.add_argument("--config", default=None, help="JSON con bloques, excluidos y grupo_por_defecto")
+    parser.add_argument("--reconstruir", action="store_true", help="recalcula todas las particiones")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    config = cargar_config(args.config)
+    valores, intervalos, recalculadas = normalizar_incremental(
+        preparar(cargar_anios(args.anios), config), config, reutilizar=not args.reconstruir
+    )
+    exportar(valores, intervalos)
+
+    por_anio = valores.groupby(level="anio").size()
+    total = valores.groupby([valores.index.get_level_values("anio"), valores["grupo"]]).ngroups
+    print(f"Normalización de {len(por_anio)} años en {time.perf_counter() - inicio:.2f}s: "
+          + ", ".join(f"{anio} ({n} municipios)" for anio, n in por_anio.items()))
+    print(f"Particiones (año, grupo) recalculadas: {len(recalculadas)} de {total}"
+          + (": " + ", ".join(f"{a}/{g:g}" for a, g in recalculadas) if 0 < len(recalculadas) < total else ""))
@@ -0,0 +1,353 @@
+"""
+Ejecución incremental de las etapas del pipeline.
+
+Cada etapa declara su comando, su código, sus entradas y sus salidas. Tras
+ejecutarla se guarda en el manifiesto la huella (hash del comando, del código
+y de cada entrada) y el hash de cada salida. En la siguiente ejecución una
+etapa se salta si su huella no ha cambiado y sus salidas siguen intactas.
+
+Las dependencias entre etapas salen solas: las salidas de una etapa son
+entradas de las siguientes, así que si un cambio en data/vivienda regenera
+los CSV de vivienda, join.py y lo que cuelga de él se rehacen y el resto de
+bloques temáticos no.
+
+Los hashes de fichero se reutilizan mientras no cambien tamaño ni fecha de
+modificación, de modo que una ejecución sin cambios apenas lee disco.
+
+Uso:
+    python pipeline.py                 # ejecuta lo que haya cambiado
+    python pipeline.py --lista         # muestra qué se ejecutaría y por qué
+    python pipeline.py --forzar join   # fuerza una etapa aunque no haya cambiado
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+import bloques_tematicos
+
+MANIFIESTO = os.path.join("data_interfaz", "manifiesto_pipeline.json")
+
+PY = sys.executable
+
+# Formato de las tablas de data_interfaz (ver almacen.py): cambiarlo rehace las etapas
+FORMATO_INTERMEDIOS = os.environ.get("FORMATO_INTERMEDIOS", "csv").lower()
+
+
+def _tablas(*rutas):
+    """Patrones de una tabla intermedia en cualquiera de sus formatos."""
+    return [ruta + ext for ruta in rutas for ext in (".csv", ".parquet", ".arrow")]
+
+BLOQUES = bloques_tematicos.BLOQUES
+
+
+# Orden de ejecución (cada etapa solo depende de las anteriores)
+ETAPAS = [
+    {
+        "nombre": "dependencias",
+        "comando": [PY, "-m", "pip", "install", "-r", "requirements.txt"],
+        "codigo": ["requirements.txt"],
+        "entradas": [],
+        "salidas": [],
+    },
+    {
+        "nombre": "municipios",
+        "comando": [PY, "municipios.py"],
+        "codigo": ["municipios.py", "lector_ine.py"],
+        "entradas": [
+            "data/economia/**/*.csv", "data/educacion/**/*.csv", "data/sanidad/**/*.csv",
+            "data/transporte/**/*.csv", "data/vivienda/*.csv", "data/vivienda/datos_*/*.csv",
+            "data/muni2024/*", "external_data/lau_id_nombre.csv",
+            "external_data/municipios_madrid.csv", "external_data/municipios_con_cluster.csv",
+        ],
+        "salidas": ["external_data/dimension_municipios.csv", "external_data/municipios_no_resueltos.csv"],
+    },
+    {
+        "nombre": "clusters",
+        "comando": [PY, "clusters_poblacion.py"],
+        "codigo": ["clusters_poblacion.py", "lector_ine.py", "municipios.py"],
+        "entradas": ["external_data/poblacion_total.csv", "external_data/dimension_municipios.csv",
+                     "external_data/municipios_con_cluster_limpio.csv"],
+        "salidas": ["data_interfaz/clusters/*"],
+    },
+    {
+        "nombre": "limpieza",
+        "comando": [PY, "script-idealista/limpieza_idealista.py"],
+        "codigo": ["script-idealista/limpieza_idealista.py", "municipios.py", "almacen.py"],
+        "entradas": ["data/vivienda/*.zip", "external_data/dimension_municipios.csv"],
+        "salidas": _tablas("data/vivienda/limpios/anuncios"),
+    },
+    {
+        "nombre": "anuncios",
+        "comando": [PY, "anuncios.py"],
+        # Importa y asigna por coordenadas (asignacion_espacial.py) en la misma
+        # etapa: las dos escriben el almacén
+        "codigo": ["anuncios.py", "asignacion_espacial.py", "municipios.py", "almacen.py"],
+        "entradas": ["data/vivienda/datos_filtrados/*.csv", "external_data/dimension_municipios.csv",
+                     "data/muni2024/*"] + _tablas("data/vivienda/limpios/anuncios"),
+        "salidas": ["data/vivienda/anuncios.sqlite"],
+    },
+    {
+        "nombre": "resumenes_vivienda",
+        "comando": [PY, "resumenes_vivienda.py"],
+        "codigo": ["resumenes_vivienda.py", "anuncios.py", "asignacion_espacial.py", "almacen.py"],
+        "entradas": ["data/vivienda/anuncios.sqlite"],
+        "salidas": ["data/vivienda/resumenes/estado.npz"] + _tablas("data/vivienda/resumenes/municipios"),
+    },
+] + [
+    # Bloques temáticos: las etapas pendientes de este tramo se ejecutan a la
+    # vez en un pool de procesos (bloques_tematicos.py)
+    {
+        "nombre": nombre,
+        "comando": [PY, "bloques_tematicos.py", "--bloques", nombre],
+        "codigo": [f"{nombre}.ipynb", "bloques_tematicos.py", "lector_ine.py", "almacen.py"],
+        "entradas": bloques_tematicos.entradas(nombre),
+        "salidas": _tablas(*bloques_tematicos.salidas(nombre)),
+        "paralelo": True,
+    }
+    for nombre in BLOQUES
+] + [
+    {
+        "nombre": "join",
+        "comando": [PY, "join.py"],
+        "codigo": ["join.py", "municipios.py", "lector_ine.py", "almacen.py"],
+        "entradas": _tablas(*(f"data_interfaz/{carpeta}/**/*" for carpeta, _ in BLOQUES.values())) + [
+            "data_interfaz/clusters/grupos_*.csv", "external_data/dimension_municipios.csv",
+        ],
+        "salidas": _tablas("data_interfaz/clusterAtractividadJuntos_*"),
+    },
+    {
+        "nombre": "normalizacion",
+        "comando": [PY, "normalizacion.py"],
+        "codigo": ["normalizacion.py", "almacen.py", "municipios.py"],
+        "entradas": _tablas("data_interfaz/clusterAtractividadJuntos_*") + ["external_data/dimension_municipios.csv"],
+        "salidas": _tablas("data_interfaz/valores", "data_interfaz/intervalos_ia",
+                           "data_interfaz/valores_anuales", "data_interfaz/intervalos_anuales"),
+    },
+    {
+        "nombre": "historico",
+        "comando": [PY, "historico.py"],
+        "codigo": ["historico.py", "lector_ine.py", "almacen.py"],
+        "entradas": [f"data/{carpeta}/*.csv" for carpeta in ("economia", "educacion", "sanidad", "transporte",
+                                                              "vivienda")]
+                    + ["external_data/poblacion_total.csv"] + _tablas("data_interfaz/valores_anuales"),
+        "salidas": ["data_interfaz/historico/*"],
+    },
+    {
+        "nombre": "geometrias",
+        "comando": [PY, "geometrias-municipios.py"],
+        "codigo": ["geometrias-municipios.py", "topologia.py"],
+        "entradas": ["data/muni2024/*"],
+        "salidas": ["static/municipios_madrid.geojson", "static/geometrias/*"],
+    },
+    {
+        "nombre": "snapshot",
+        "comando": [PY, "snapshot.py"],
+        "codigo": ["snapshot.py", "estadisticas.py", "municipios.py", "lector_ine.py", "almacen.py",
+                   "proximidad.py", "entrega.py"],
+        "entradas": [
+            "static/municipios_madrid.geojson", "static/geometrias/*", "external_data/dimension_municipios.csv",
+        ] + _tablas("data_interfaz/valores"),
+        "salidas": ["data_interfaz/snapshot.pkl", "data_interfaz/snapshot_valores.arrow",
+                    "static/municipios_madrid_4326.geojson", "external_data/verificacion_nombres.csv"],
+    },
+    {
+        # Variantes gzip/brotli y hashes de static/ para servirlas con ETag
+        "nombre": "compresion",
+        "comando": [PY, "entrega.py"],
+        "codigo": ["entrega.py"],
+        "entradas": ["static/css/*", "static/js/*", "static/img/*", "static/geometrias/*", "static/*.geojson"],
+        "salidas": ["data_interfaz/estaticos/**/*"],
+    },
+]
+
+
+# =========================
+# HASHES
+# =========================
+class Hashes:
+    """sha256 de ficheros, reutilizado mientras no cambien tamaño ni mtime."""
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.leidos = 0
+
+    def fichero(self, ruta):
+        estado = os.stat(ruta)
+        firma = [estado.st_size, estado.st_mtime_ns]
+        guardado = self.cache.get(ruta)
+        if guardado and guardado[:2] == firma:
+            return guardado[2]
+        h = hashlib.sha256()
+        with open(ruta, "rb") as f:
+            for bloque in iter(lambda: f.read(1 << 20), b""):
+                h.update(bloque)
+        self.leidos += 1
+        self.cache[ruta] = firma + [h.hexdigest()]
+        return h.hexdigest()
+
+    def patrones(self, patrones):
+        """{ruta: hash} de todos los ficheros que casan con los patrones."""
+        rutas = set()
+        for patron in patrones:
+            rutas.update(r for r in glob.glob(patron, recursive=True) if os.path.isfile(r))
+        return {r.replace("\\", "/"): self.fichero(r) for r in sorted(rutas)}
+
+
+def huella(etapa, hashes):
+    """Hash del comando, del código y de las entradas de la etapa."""
+    # El intérprete concreto (venv) no forma parte de la huella
+    comando = ["python" if c == PY else c for c in etapa["comando"]]
+    h = hashlib.sha256(json.dumps(comando).encode())
+    h.update(f"formato:{FORMATO_INTERMEDIOS}\n".encode())
+    for grupo in ("codigo", "entradas"):
+        for ruta, valor in hashes.patrones(etapa[grupo]).items():
+            h.update(f"{grupo}:{ruta}:{valor}\n".encode())
+    return h.hexdigest()[:16]
+
+
+# =========================
+# EJECUCIÓN
+# =========================
+def cargar_manifiesto(ruta=MANIFIESTO):
+    if not os.path.exists(ruta):
+        return {"etapas": {}, "ficheros": {}}
+    with open(ruta, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def guardar_manifiesto(manifiesto, ruta=MANIFIESTO):
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    tmp = ruta + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifiesto, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, ruta)
+
+
+def motivo_ejecucion(etapa, registro, actual, hashes):
+    """None si la etapa está al día; si no, por qué hay que ejecutarla."""
+    if registro is None:
+        return "sin ejecuciones previas"
+    if registro["huella"] != actual:
+        return "han cambiado código o entradas"
+    if etapa["salidas"]:
+        salidas = hashes.patrones(etapa["salidas"])
+        if not salidas:
+            return "faltan las salidas"
+        if salidas != registro["salidas"]:
+            return "las salidas se han modificado fuera del pipeline"
+    return None
+
+
+def registrar(manifiesto, etapa, hashes, segundos):
+    """Guarda en el manifiesto una ejecución correcta de la etapa."""
+    anterior = manifiesto["etapas"].get(etapa["nombre"]) or {}
+    # La huella se recalcula por si la etapa ha cambiado sus propias entradas
+    manifiesto["etapas"][etapa["nombre"]] = {
+        "huella": huella(etapa, hashes),
+        "salidas": hashes.patrones(etapa["salidas"]),
+        "segundos": segundos,
+        "fecha": time.strftime("%Y-%m-%d %H:%M:%S"),
+        # Acumulados para /metrics (metricas.py)
+        "ejecuciones": anterior.get("ejecuciones", 0) + 1,
+        "segundos_total": round(anterior.get("segundos_total", 0) + segundos, 2),
+    }
+
+
+def ejecutar_paralelas(etapas, manifiesto, hashes):
+    """Bloques temáticos pendientes en un pool de procesos. Registra los que terminan bien."""
+    print(f"  ⇉ {len(etapas)} bloques en paralelo: {', '.join(e['nombre'] for e in etapas)}")
+    resultados = bloques_tematicos.ejecutar_bloques([e["nombre"] for e in etapas])
+    fallidas = []
+    for etapa in etapas:
+        resultado = resultados[etapa["nombre"]]
+        if resultado["ok"]:
+            registrar(manifiesto, etapa, hashes, resultado["segundos"])
+        else:
+            fallidas.append(etapa["nombre"])
+            print(f"❌ Error en la etapa {etapa['nombre']} (ver {resultado['log']}):\n{resultado['error']}")
+    return fallidas
+
+
+def ejecutar(forzar=(), solo_listar=False, manifiesto_path=MANIFIESTO):
+    inicio = time.perf_counter()
+    manifiesto = cargar_manifiesto(manifiesto_path)
+    hashes = Hashes(manifiesto["ficheros"])
+    forzar = set(forzar)
+    ejecutadas = []
+    paralelas = []
+
+    def vaciar_paralelas():
+        if not paralelas:
+            return True
+        fallidas = ejecutar_paralelas(paralelas, manifiesto, hashes)
+        ejecutadas.extend(e["nombre"] for e in paralelas if e["nombre"] not in fallidas)
+        paralelas.clear()
+        guardar_manifiesto(manifiesto, manifiesto_path)
+        if fallidas:
+            print("Abortando.")
+        return not fallidas
+
+    for etapa in ETAPAS:
+        nombre = etapa["nombre"]
+        # Al salir de un tramo de etapas paralelas se ejecutan las pendientes
+        if not etapa.get("paralelo") and not vaciar_paralelas():
+            return False
+
+        actual = huella(etapa, hashes)
+        registro = manifiesto["etapas"].get(nombre)
+        motivo = "forzada" if nombre in forzar else motivo_ejecucion(etapa, registro, actual, hashes)
+
+        if motivo is None:
+            print(f"✔ {nombre}: sin cambios")
+            continue
+        if solo_listar:
+            print(f"▶ {nombre}: se ejecutaría ({motivo})")
+            continue
+
+        print(f"▶ {nombre}: {motivo}")
+        if etapa.get("paralelo"):
+            paralelas.append(etapa)
+            continue
+
+        print("  $ " + " ".join(etapa["comando"]))
+        t0 = time.perf_counter()
+        resultado = subprocess.run(etapa["comando"])
+        if resultado.returncode != 0:
+            print(f"❌ Error en la etapa {nombre} (código {resultado.returncode}). Abortando.")
+            guardar_manifiesto(manifiesto, manifiesto_path)
+            return False
+
+        registrar(manifiesto, etapa, hashes, round(time.perf_counter() - t0, 2))
+        guardar_manifiesto(manifiesto, manifiesto_path)
+        ejecutadas.append(nombre)
+
+    if not vaciar_paralelas():
+        return False
+    # --lista solo lee: el manifiesto queda como estaba
+    if solo_listar:
+        return True
+    guardar_manifiesto(manifiesto, manifiesto_path)
+    print(f"\nPipeline al día en {time.perf_counter() - inicio:.2f}s "
+          f"({len(ejecutadas)} etapas ejecutadas, {hashes.leidos} ficheros rehasheados)")
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ejecución incremental del pipeline")
+    parser.add_argument("--forzar", nargs="*", default=[], metavar="ETAPA",
+                        help="etapas a ejecutar aunque no hayan cambiado")
+    parser.add_argument("--lista", action="store_true", help="solo muestra qué se ejecutaría")
+    args = parser.parse_args()
+
+    nombres = {e["nombre"] for e in ETAPAS}
+    desconocidas = set(args.forzar) - nombres
+    if desconocidas:
+        parser.error(f"Etapas desconocidas: {', '.join(sorted(desconocidas))}. Disponibles: {', '.join(e['nombre'] for e in ETAPAS)}")
+
+    if not ejecutar(forzar=args.forzar, solo_listar=args.lista):
+        sys.exit(1)
@@ -0,0 +1,190 @@
+"""
+Índice de proximidad entre municipios.
+
+Se construye una vez a partir de las geometrías municipales (el GeoJSON en
+EPSG:25830 que genera geometrias-municipios.py) y va dentro del snapshot de
+servicio:
+
+- centroides en coordenadas proyectadas (UTM 30N, en km, float32)
+- para cada municipio, los demás ordenados por distancia (float32 + índices)
+  mientras el número de municipios no pase de MAX_MATRIZ. Una consulta desde
+  un municipio es un searchsorted sobre su fila
+- para puntos arbitrarios (p. ej. un lugar de trabajo en lon/lat) o más
+  municipios, un KD-tree de scipy si está instalado; si no, distancias
+  vectorizadas con numpy sobre los centroides
+
+Consultas: municipios a menos de X km (`radio`) y los k más cercanos
+(`vecinos`), desde un código INE o desde un punto.
+
+Uso:
+    python proximidad.py 28079 --radio 15
+    python proximidad.py 28079 --k 5
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+
+GEOJSON = os.path.join("static", "municipios_madrid.geojson")
+CRS_PROYECTADO = "EPSG:25830"
+
+# Por encima de este número de municipios no se guardan las filas ordenadas
+# (n² distancias float32 + n² índices int32: 32 MB con 2000 municipios)
+MAX_MATRIZ = 2000
+
+
+def _kdtree(puntos):
+    """cKDTree de scipy si está disponible (opcional)."""
+    try:
+        from scipy.spatial import cKDTree
+    except ImportError:
+        return None
+    return cKDTree(puntos)
+
+
+class IndiceProximidad:
+    """Centroides proyectados y distancias entre municipios."""
+
+    def __init__(self, codigos, nombres, x_km, y_km, crs=CRS_PROYECTADO):
+        self.codigos = np.asarray(codigos, dtype=np.int32)
+        self.nombres = np.asarray(nombres, dtype=object)
+        self.puntos = np.column_stack([x_km, y_km]).astype(np.float32)
+        # Columnas contiguas para las distancias vectorizadas
+        self.x, self.y = self.puntos[:, 0].copy(), self.puntos[:, 1].copy()
+        self.crs = crs
+        self.posicion = {int(c): i for i, c in enumerate(self.codigos)}
+
+        self.orden = self.distancias = None
+        if len(self.codigos) <= MAX_MATRIZ:
+            # 1️⃣ Distancias entre todos los pares y cada fila ordenada
+            diferencia = self.puntos[:, None, :] - self.puntos[None, :, :]
+            matriz = np.sqrt((diferencia ** 2).sum(axis=2))
+            self.orden = np.argsort(matriz, axis=1, kind="stable").astype(np.int32)
+            self.distancias = np.take_along_axis(matriz, self.orden, axis=1)
+        self._inicializar()
+
+    def _inicializar(self):
+        # 2️⃣ KD-tree (si hay scipy) y proyección de lon/lat: se rehacen al cargar
+        self.arbol = _kdtree(self.puntos.astype(np.float64))
+        self._transformador = None
+
+    def __getstate__(self):
+        estado = self.__dict__.copy()
+        estado["arbol"] = estado["_transformador"] = None
+        return estado
+
+    def __setstate__(self, estado):
+        self.__dict__.update(estado)
+        self._inicializar()
+
+    @classmethod
+    def desde_geojson(cls, ruta=GEOJSON):
+        """Centroides de los polígonos del GeoJSON (ya en coordenadas proyectadas)."""
+        import geopandas as gpd
+
+        gdf = gpd.read_file(ruta)
+        if gdf.crs is None or not gdf.crs.is_projected:
+            gdf = gdf.to_crs(CRS_PROYECTADO)
+        centroides = gdf.geometry.centroid
+        return cls(
+            gdf["codigo_ine"].astype(int).to_numpy(),
+            gdf["DESCR"].to_numpy() if "DESCR" in gdf else gdf["codigo_ine"].astype(str).to_numpy(),
+            centroides.x.to_numpy() / 1000,
+            centroides.y.to_numpy() / 1000,
+            crs=gdf.crs.to_string(),
+        )
+
+    # =========================
+    # ORIGEN DE LAS CONSULTAS
+    # =========================
+    def proyectar(self, lon, lat):
+        """(x, y) en km de un punto en lon/lat (WGS84)."""
+        if self._transformador is None:
+            from pyproj import Transformer
+
+            self._transformador = Transformer.from_crs("EPSG:4326", self.crs, always_xy=True)
+        x, y = self._transformador.transform(lon, lat)
+        return np.array([x / 1000, y / 1000], dtype=np.float32)
+
+    def indice(self, codigo):
+        try:
+            return self.posicion[int(codigo)]
+        except (KeyError, TypeError, ValueError):
+            raise KeyError(f"Municipio sin geometría: {codigo}") from None
+
+    def _punto(self, origen):
+        """Índice del municipio (o None) y punto de origen en km."""
+        if isinstance(origen, (tuple, list)):
+            return None, self.proyectar(*origen)
+        i = self.indice(origen)
+        return i, self.puntos[i]
+
+    def _cuadrados(self, punto, indices=None):
+        """Distancias al cuadrado del punto a todos los municipios (o a `indices`)."""
+        x, y = (self.x, self.y) if indices is None else (self.x[indices], self.y[indices])
+        dx, dy = x - punto[0], y - punto[1]
+        return dx * dx + dy * dy
+
+    # =========================
+    # CONSULTAS
+    # =========================
+    def radio(self, origen, km):
+        """
+        Municipios a menos de `km` del origen (código INE o (lon, lat)).
+        Devuelve (índices, distancias) ordenados por distancia.
+        """
+        i, punto = self._punto(origen)
+        if i is not None and self.orden is not None:
+            fin = np.searchsorted(self.distancias[i], km, side="right")
+            return self.orden[i, :fin], self.distancias[i, :fin]
+        if self.arbol is not None:
+            indices = np.asarray(self.arbol.query_ball_point(punto, km), dtype=np.int64)
+        else:
+            indices = np.flatnonzero(self._cuadrados(punto) <= np.float32(km) ** 2)
+        distancias = np.sqrt(self._cuadrados(punto, indices))
+        orden = np.argsort(distancias, kind="stable")
+        return indices[orden], distancias[orden]
+
+    def vecinos(self, origen, k):
+        """Los k municipios más cercanos al origen (un municipio cuenta como su propio vecino a 0 km)."""
+        k = max(0, min(int(k), len(self.codigos)))
+        i, punto = self._punto(origen)
+        if i is not None and self.orden is not None:
+            return self.orden[i, :k], self.distancias[i, :k]
+        if k == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        if self.arbol is not None:
+            distancias, indices = self.arbol.query(punto, k=k)
+            return np.atleast_1d(indices), np.atleast_1d(distancias).astype(np.float32)
+        cuadrados = self._cuadrados(punto)
+        indices = np.argpartition(cuadrados, k - 1)[:k]
+        indices = indices[np.argsort(cuadrados[indices], kind="stable")]
+        return indices, np.sqrt(cuadrados[indices])
+
+    def codigos_en_radio(self, origen, km):
+        """Conjunto de códigos INE a menos de `km` del origen (filtro del recomendador)."""
+        indices, _ = self.radio(origen, km)
+        return set(self.codigos[indices].tolist())
+
+    def registros(self, indices, distancias):
+        return [
+            {"codigo_ine": int(self.codigos[i]), "Nombre": self.nombres[i], "distancia_km": round(float(d), 2)}
+            for i, d in zip(indices, distancias)
+        ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Municipios cercanos a un municipio")
+    parser.add_argument("municipio", type=int, help="código INE (p. ej. 28079)")
+    grupo = parser.add_mutually_exclusive_group()
+    grupo.add_argument("--radio", type=float, default=None, help="km")
+    grupo.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    indice = IndiceProximidad.desde_geojson()
+    if args.radio is not None:
+        resultado = indice.radio(args.municipio, args.radio)
+    else:
+        resultado = indice.vecinos(args.municipio, args.k + 1)
+    print(json.dumps(indice.registros(*resultado), ensure_ascii=False, indent=2))
@@ -0,0 +1,387 @@
+"""
+Resúmenes fusionables de los anuncios de vivienda por municipio.
+
+Para cada municipio y variable (precio, precio por m², habitaciones, baños)
+se guarda un resumen que se actualiza con cada lote de anuncios nuevos sin
+volver a leer los anteriores:
+
+- n, media y varianza exactas (Welford; dos resúmenes se fusionan con la
+  fórmula de Chan)
+- un histograma logarítmico (sketch tipo DDSketch) con error relativo
+  ERROR_RELATIVO en los cuantiles: mediana y p90 salen del histograma, cuyo
+  tamaño es fijo, así que la consulta no depende del número de anuncios
+
+Dos resúmenes se fusionan sumando (n, media, M2 por Chan, histogramas por
+suma), así que da igual procesar los anuncios de una vez o en lotes.
+
+La entrada es el almacén de anuncios (anuncios.py). Cada ejecución lee solo
+las apariciones con rowid mayor que la marca guardada, así que después de
+una descarga el coste es proporcional a lo nuevo. Igual que en
+AlmacenAnuncios.tabla(), un anuncio cuenta en el municipio en el que cae
+(asignacion_espacial.py) o, sin coordenadas, en el que lo vio primero; los
+municipios sin anuncios propios usan los que devolvió su búsqueda
+(AlmacenAnuncios.prestados()).
+
+Un histograma no permite quitar un valor concreto, así que cuando un anuncio
+ya resumido cambia (precio, tamaño, habitaciones, baños o municipio; tabla
+modificaciones del almacén, con su propia marca) se rehacen desde el almacén
+los municipios afectados: el anterior y el actual del anuncio y los de las
+búsquedas que lo devolvieron. El resto sigue siendo incremental.
+
+Uso:
+    python resumenes_vivienda.py                 # incremental
+    python resumenes_vivienda.py --reconstruir   # desde cero
+"""
+import argparse
+import math
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from almacen import escribir_tabla
+from anuncios import ALMACEN_ANUNCIOS, CODIGO_EFECTIVO, AlmacenAnuncios
+
+ESTADO = os.path.join("data", "vivienda", "resumenes", "estado.npz")
+TABLA = os.path.join("data", "vivienda", "resumenes", "municipios.csv")
+
+ERROR_RELATIVO = 0.01
+# Cambia cuando cambia qué se resume; un estado de otra versión se reconstruye
+VERSION_ESTADO = 3
+
+# Variable -> (mínimo, máximo, entera) del histograma. Fuera del rango se
+# satura al primer / último cubo; los valores <= 0 van a un contador aparte.
+# En las variables enteras los cuantiles se redondean.
+VARIABLES = {
+    "precio": (1e3, 1e8, False),
+    "precio_m2": (10.0, 1e5, False),
+    "habitaciones": (1.0, 100.0, True),
+    "banos": (1.0, 100.0, True),
+}
+
+
+class Sketch:
+    """
+    Resúmenes de una variable para muchos municipios a la vez (una fila por
+    municipio): n, media, M2, contador de ceros e histograma logarítmico.
+    """
+
+    def __init__(self, minimo, maximo, entero=False, error=ERROR_RELATIVO, filas=0):
+        self.minimo = float(minimo)
+        self.maximo = float(maximo)
+        self.entero = entero
+        self.gamma = (1 + error) / (1 - error)
+        self.log_gamma = math.log(self.gamma)
+        self.cubos = int(math.ceil(math.log(self.maximo / self.minimo) / self.log_gamma)) + 1
+        self.n = np.zeros(filas, dtype=np.int64)
+        self.media = np.zeros(filas, dtype=np.float64)
+        self.m2 = np.zeros(filas, dtype=np.float64)
+        self.ceros = np.zeros(filas, dtype=np.int64)
+        self.histograma = np.zeros((filas, self.cubos), dtype=np.int32)
+
+    def crecer(self, filas):
+        extra = filas - len(self.n)
+        if extra <= 0:
+            return
+        self.n = np.concatenate([self.n, np.zeros(extra, dtype=np.int64)])
+        self.media = np.concatenate([self.media, np.zeros(extra)])
+        self.m2 = np.concatenate([self.m2, np.zeros(extra)])
+        self.ceros = np.concatenate([self.ceros, np.zeros(extra, dtype=np.int64)])
+        self.histograma = np.vstack([self.histograma, np.zeros((extra, self.cubos), dtype=np.int32)])
+
+    def cubo(self, valores):
+        """Cubo de cada valor positivo: v está en (minimo·γ^(i-1), minimo·γ^i]."""
+        indices = np.ceil(np.log(np.maximum(valores, self.minimo) / self.minimo) / self.log_gamma)
+        return np.clip(indices, 0, self.cubos - 1).astype(np.intp)
+
+    def valor_cubo(self, indice):
+        """Valor representativo del cubo (error relativo <= ERROR_RELATIVO dentro del rango)."""
+        if indice == 0:
+            return self.minimo
+        valor = self.minimo * 2 * self.gamma ** indice / (self.gamma + 1)
+        return round(valor) if self.entero else valor
+
+    def _fusionar_momentos(self, filas, n, media, m2):
+        """Chan et al.: fusiona (n, media, M2) de un lote en las filas dadas."""
+        n_a = self.n[filas]
+        total = n_a + n
+        delta = media - self.media[filas]
+        con_datos = total > 0
+        peso = np.divide(n, total, out=np.zeros_like(media), where=con_datos)
+        self.media[filas] += delta * peso
+        self.m2[filas] += m2 + delta ** 2 * n_a * peso
+        self.n[filas] = total
+
+    def vaciar(self, filas):
+        """Deja a cero las filas dadas (para volver a llenarlas)."""
+        for campo in (self.n, self.media, self.m2, self.ceros, self.histograma):
+            campo[filas] = 0
+
+    def actualizar(self, filas, valores):
+        """Añade observaciones: `filas` (fila del municipio) y `valores`, ya sin NaN."""
+        if len(valores) == 0:
+            return
+        lote = pd.DataFrame({"fila": filas, "valor": valores})
+        grupos = lote.groupby("fila")["valor"]
+        n = grupos.size()
+        media = grupos.mean()
+        m2 = grupos.var(ddof=0) * n
+        self._fusionar_momentos(n.index.to_numpy(), n.to_numpy(), media.to_numpy(), m2.to_numpy())
+
+        positivos = valores > 0
+        np.add.at(self.ceros, filas[~positivos], 1)
+        np.add.at(self.histograma, (filas[positivos], self.cubo(valores[positivos])), 1)
+
+    def fusionar(self, otro, filas=None):
+        """Suma otro Sketch (mismo rango); `filas` traduce sus filas a las de este."""
+        filas = np.arange(len(otro.n)) if filas is None else np.asarray(filas)
+        self._fusionar_momentos(filas, otro.n, otro.media, otro.m2)
+        np.add.at(self.ceros, filas, otro.ceros)
+        np.add.at(self.histograma, filas, otro.histograma)
+
+    def cuantiles(self, fila, qs):
+        """Cuantiles de una fila a partir del histograma (NaN si está vacía)."""
+        total = int(self.ceros[fila] + self.histograma[fila].sum())
+        if total == 0:
+            return [float("nan")] * len(qs)
+        acumulado = np.cumsum(self.histograma[fila])
+        resultado = []
+        for q in qs:
+            rango = q * (total - 1)
+            if rango < self.ceros[fila]:
+                resultado.append(0.0)
+                continue
+            indice = int(np.searchsorted(acumulado, rango - self.ceros[fila], side="right"))
+            resultado.append(float(self.valor_cubo(min(indice, self.cubos - 1))))
+        return resultado
+
+    def varianza(self):
+        return np.divide(self.m2, self.n - 1, out=np.full(len(self.n), np.nan), where=self.n > 1)
+
+    def a_arrays(self, prefijo):
+        return {f"{prefijo}_{k}": getattr(self, k) for k in ("n", "media", "m2", "ceros", "histograma")}
+
+    @classmethod
+    def desde_arrays(cls, minimo, maximo, entero, arrays, prefijo, error=ERROR_RELATIVO):
+        sketch = cls(minimo, maximo, entero, error)
+        for k in ("n", "media", "m2", "ceros", "histograma"):
+            setattr(sketch, k, arrays[f"{prefijo}_{k}"])
+        return sketch
+
+
+class ResumenesVivienda:
+    """Un Sketch por variable, con las filas indexadas por código INE."""
+
+    def __init__(self, variables=VARIABLES, error=ERROR_RELATIVO):
+        self.error = error
+        self.codigos = []
+        self.filas = {}
+        self.sketches = {v: Sketch(mn, mx, entero, error) for v, (mn, mx, entero) in variables.items()}
+
+    def _filas_de(self, codigos):
+        for codigo in pd.unique(np.asarray(codigos)):
+            if codigo not in self.filas:
+                self.filas[codigo] = len(self.codigos)
+                self.codigos.append(codigo)
+        for sketch in self.sketches.values():
+            sketch.crecer(len(self.codigos))
+        return np.array([self.filas[c] for c in codigos], dtype=np.intp)
+
+    def actualizar(self, lote):
+        """
+        Lote de anuncios: codigo_ine, precio, tamano_m2, habitaciones, banos.
+        Calcula precio_m2 y añade cada variable (sin sus NaN).
+        """
+        lote = lote.dropna(subset=["codigo_ine"])
+        if lote.empty:
+            return
+        lote = lote.assign(precio_m2=lote["precio"] / lote["tamano_m2"].where(lote["tamano_m2"] > 0))
+        filas = self._filas_de(lote["codigo_ine"].astype(int).tolist())
+        for variable, sketch in self.sketches.items():
+            valores = pd.to_numeric(lote[variable], errors="coerce").to_numpy(dtype=np.float64)
+            validos = ~np.isnan(valores)
+            sketch.actualizar(filas[validos], valores[validos])
+
+    def vaciar(self, codigos):
+        filas = [self.filas[c] for c in codigos if c in self.filas]
+        for sketch in self.sketches.values():
+            sketch.vaciar(filas)
+
+    def fusionar(self, otro):
+        filas = self._filas_de(otro.codigos)
+        for variable, sketch in self.sketches.items():
+            sketch.fusionar(otro.sketches[variable], filas)
+
+    def cuantiles(self, codigo, variable, qs=(0.5, 0.9)):
+        fila = self.filas.get(codigo)
+        if fila is None:
+            return [float("nan")] * len(qs)
+        return self.sketches[variable].cuantiles(fila, qs)
+
+    def tabla(self):
+        """Una fila por municipio: n, media, desviación, mediana y p90 de cada variable."""
+        columnas = {"codigo_ine": self.codigos}
+        for variable, sketch in self.sketches.items():
+            columnas[f"{variable}_n"] = sketch.n
+            columnas[f"{variable}_media"] = np.where(sketch.n > 0, sketch.media, np.nan)
+            columnas[f"{variable}_desviacion"] = np.sqrt(sketch.varianza())
+            cuantiles = np.array([sketch.cuantiles(f, (0.5, 0.9)) for f in range(len(self.codigos))]).reshape(-1, 2)
+            columnas[f"{variable}_mediana"] = cuantiles[:, 0]
+            columnas[f"{variable}_p90"] = cuantiles[:, 1]
+        return pd.DataFrame(columnas).sort_values("codigo_ine", ignore_index=True)
+
+    def a_arrays(self):
+        arrays = {"codigos": np.array(self.codigos, dtype=np.int64)}
+        for variable, sketch in self.sketches.items():
+            arrays.update(sketch.a_arrays(variable))
+        return arrays
+
+    @classmethod
+    def desde_arrays(cls, arrays, variables=VARIABLES, error=ERROR_RELATIVO):
+        resumenes = cls(variables, error)
+        resumenes.codigos = arrays["codigos"].tolist()
+        resumenes.filas = {c: i for i, c in enumerate(resumenes.codigos)}
+        resumenes.sketches = {
+            v: Sketch.desde_arrays(mn, mx, entero, arrays, v, error) for v, (mn, mx, entero) in variables.items()
+        }
+        return resumenes
+
+
+# =========================
+# ESTADO INCREMENTAL
+# =========================
+def cargar_estado(ruta=ESTADO):
+    """(propios, vistos, marcas). Vacío si no hay estado guardado."""
+    if not os.path.exists(ruta):
+        return ResumenesVivienda(), ResumenesVivienda(), MARCAS_INICIALES
+    with np.load(ruta) as datos:
+        arrays = dict(datos)
+    version = int(arrays.pop("version", 1))
+    if float(arrays.pop("error")) != ERROR_RELATIVO or version != VERSION_ESTADO:
+        return ResumenesVivienda(), ResumenesVivienda(), MARCAS_INICIALES
+    marca = (int(arrays.pop("marca")), int(arrays.pop("marca_modificaciones")))
+    grupos = {"propios": {}, "vistos": {}}
+    for clave, valor in arrays.items():
+        grupo, _, resto = clave.partition("__")
+        grupos[grupo][resto] = valor
+    return ResumenesVivienda.desde_arrays(grupos["propios"]), ResumenesVivienda.desde_arrays(grupos["vistos"]), marca
+
+
+def guardar_estado(propios, vistos, marca, ruta=ESTADO):
+    os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+    arrays = {"marca": np.int64(marca[0]), "marca_modificaciones": np.int64(marca[1]), "error": np.float64(ERROR_RELATIVO), "version": np.int64(VERSION_ESTADO)}
+    arrays.update({f"propios__{k}": v for k, v in propios.a_arrays().items()})
+    arrays.update({f"vistos__{k}": v for k, v in vistos.a_arrays().items()})
+    tmp = ruta + ".tmp.npz"
+    np.savez(tmp, **arrays)
+    os.replace(tmp, ruta)
+
+
+# Marcas (rowid de apariciones, id de modificaciones) hasta las que se ha resumido
+MARCAS_INICIALES = (0, 0)
+
+CONSULTA_APARICIONES = f"""
+    SELECT p.rowid AS marca, p.codigo_ine AS codigo_busqueda,
+           {CODIGO_EFECTIVO.format(t="a.")} AS codigo_ine,
+           p.rowid = (SELECT min(q.rowid) FROM apariciones q WHERE q.propertyCode = p.propertyCode) AS primera,
+           a.codigo_ine_punto IS -1 AS fuera,
+           a.precio, a.tamano_m2, a.habitaciones, a.banos
+    FROM apariciones p JOIN anuncios a USING (propertyCode)
+    WHERE p.rowid <= ? AND (p.rowid > ? {{rehacer}})
+"""
+
+# Municipios afectados por cambios en anuncios que ya se habían resumido
+# (su primera aparición es anterior a la marca): los nuevos ya van en el lote
+CONSULTA_MODIFICADOS = f"""
+    SELECT m.codigo_anterior, {CODIGO_EFECTIVO.format(t="a.")} AS codigo_actual, p.codigo_ine AS codigo_busqueda
+    FROM modificaciones m JOIN anuncios a USING (propertyCode) JOIN apariciones p USING (propertyCode)
+    WHERE m.id > ? AND m.id <= ?
+      AND (SELECT min(q.rowid) FROM apariciones q WHERE q.propertyCode = m.propertyCode) <= ?
+"""
+
+
+def _codigos(*series):
+    return sorted({int(c) for serie in series for c in serie.dropna()})
+
+
+def actualizar(almacen, propios, vistos, marca=MARCAS_INICIALES):
+    """
+    Añade las apariciones posteriores a la marca y rehace los municipios
+    afectados por anuncios ya resumidos que han cambiado. Devuelve
+    (nuevas marcas, filas leídas, municipios rehechos).
+
+    Cada anuncio cuenta una vez en `propios` (con su primera aparición, en el
+    municipio del punto o el de la búsqueda) y en `vistos` de cada municipio
+    cuya búsqueda lo devolvió. Antes se asignan por coordenadas los anuncios
+    pendientes, para que un anuncio no se resuma en un municipio y luego
+    cambie a otro.
+    """
+    from asignacion_espacial import asignar_pendientes
+
+    asignar_pendientes(almacen)
+    marca_apariciones, marca_modificaciones = marca
+    tope = almacen.conexion.execute("SELECT coalesce(max(rowid), 0) FROM apariciones").fetchone()[0]
+    tope_modificaciones = almacen.conexion.execute(
+        "SELECT coalesce(max(id), 0) FROM modificaciones"
+    ).fetchone()[0]
+
+    modificados = pd.read_sql_query(
+        CONSULTA_MODIFICADOS, almacen.conexion,
+        params=(marca_modificaciones, tope_modificaciones, marca_apariciones),
+    )
+    rehacer_propios = _codigos(modificados["codigo_anterior"], modificados["codigo_actual"])
+    rehacer_vistos = _codigos(modificados["codigo_busqueda"])
+    propios.vaciar(rehacer_propios)
+    vistos.vaciar(rehacer_vistos)
+
+    # Lo nuevo y, de los municipios que se rehacen, todo
+    efectivo = CODIGO_EFECTIVO.format(t="a.")
+    condicion = "".join([
+        f" OR p.codigo_ine IN ({', '.join('?' * len(rehacer_vistos))})" if rehacer_vistos else "",
+        f" OR {efectivo} IN ({', '.join('?' * len(rehacer_propios))})" if rehacer_propios else "",
+    ])
+    filas = pd.read_sql_query(
+        CONSULTA_APARICIONES.format(rehacer=condicion), almacen.conexion,
+        params=(tope, marca_apariciones, *rehacer_vistos, *rehacer_propios),
+    )
+    nuevas = filas["marca"] > marca_apariciones
+    en_propios = filas["primera"].astype(bool) & (nuevas | filas["codigo_ine"].isin(rehacer_propios))
+    en_vistos = ~filas["fuera"].astype(bool) & (nuevas | filas["codigo_busqueda"].isin(rehacer_vistos))
+    propios.actualizar(filas[en_propios])
+    vistos.actualizar(
+        filas[en_vistos].drop(columns="codigo_ine").rename(columns={"codigo_busqueda": "codigo_ine"})
+    )
+    rehechos = sorted(set(rehacer_propios) | set(rehacer_vistos))
+    return (max(tope, marca_apariciones), max(tope_modificaciones, marca_modificaciones)), len(filas), rehechos
+
+
+def tabla_municipios(propios, vistos):
+    """Resúmenes por municipio: los propios y, si no tiene anuncios propios, los de su búsqueda."""
+    tabla_propios = propios.tabla()
+    tabla_vistos = vistos.tabla()
+    sin_propios = tabla_vistos[~tabla_vistos["codigo_ine"].isin(tabla_propios["codigo_ine"])]
+    return pd.concat([tabla_propios, sin_propios], ignore_index=True).sort_values("codigo_ine", ignore_index=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resúmenes incrementales de vivienda por municipio")
+    parser.add_argument("--almacen", default=ALMACEN_ANUNCIOS)
+    parser.add_argument("--estado", default=ESTADO)
+    parser.add_argument("--salida", default=TABLA)
+    parser.add_argument("--reconstruir", action="store_true", help="ignora el estado guardado")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    propios, vistos, marca = (
+        (ResumenesVivienda(), ResumenesVivienda(), MARCAS_INICIALES) if args.reconstruir
+        else cargar_estado(args.estado)
+    )
+    with AlmacenAnuncios(args.almacen) as almacen:
+        marca_nueva, leidas, rehechos = actualizar(almacen, propios, vistos, marca)
+    guardar_estado(propios, vistos, marca_nueva, args.estado)
+    tabla = tabla_municipios(propios, vistos)
+    destino = escribir_tabla(tabla, args.salida)
+    print(f"{leidas} apariciones leídas (marca {marca[0]} → {marca_nueva[0]}), "
+          f"{len(rehechos)} municipios rehechos por anuncios modificados, en {time.perf_counter() - inicio:.2f}s")
+    print(f"✅ Resúmenes de {len(tabla)} municipios en {destino}")
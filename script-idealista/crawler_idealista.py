@@ -0,0 +1,441 @@
+"""
+Descarga concurrente de anuncios de Idealista.
+
+- Varios municipios a la vez (concurrencia acotada); las páginas de un mismo
+  municipio van en orden porque la siguiente depende de la anterior.
+- Limitador de cubo de tokens compartido: ritmo medio de peticiones por
+  segundo y ráfaga máxima configurables.
+- Un 429 no para la descarga: se respeta Retry-After (pausa global del
+  limitador) y se reintenta con backoff exponencial.
+- El token OAuth se renueva solo cuando caduca o la API responde 401.
+- Cada página se escribe de una vez con un único fsync y después se guarda el
+  checkpoint (municipio, página) de forma atómica. Al reanudar se continúa en
+  la página siguiente y se descartan los anuncios que ya estaban en el CSV.
+- Cada página se vuelca también al almacén de anuncios (anuncios.py, SQLite
+  con upsert por propertyCode): en una descarga incremental solo se escriben
+  los anuncios nuevos o que han cambiado.
+
+Las peticiones HTTP usan requests en hilos (asyncio.to_thread), así que no
+hace falta ninguna dependencia nueva.
+"""
+import asyncio
+import base64
+import csv
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+import requests
+
+API_URL = os.getenv("IDEALISTA_API", "https://api.idealista.com")
+
+CAMPOS = ["municipio", "propertyCode", "precio", "banos", "habitaciones",
+          "tamano_m2", "direccion", "barrio", "url", "latitud", "longitud"]
+
+
+@dataclass
+class Config:
+    api_url: str = API_URL
+    client_id: str = ""
+    client_secret: str = ""
+    salida: Path = Path("data/vivienda/datos_filtrados")
+    checkpoint: Path = Path("progreso_idealista.json")
+    # Almacén SQLite sin duplicados (None para escribir solo los CSV)
+    almacen: Path | None = Path("data/vivienda/anuncios.sqlite")
+
+    operation: str = "buy"
+    property_type: str = "homes"
+    distancia_metros: int = 2000
+    max_items: int = 20
+    max_paginas: int = 2
+
+    # Limitador: peticiones por segundo de media y ráfaga máxima
+    ritmo: float = 1.0
+    rafaga: int = 1
+    # Municipios descargándose a la vez
+    concurrencia: int = 4
+
+    max_reintentos: int = 6
+    backoff_base: float = 1.0
+    backoff_max: float = 120.0
+    timeout: float = 30.0
+
+
+def slugify(s: str) -> str:
+    s = s.strip().replace(" ", "_")
+    return re.sub(r"[^A-Za-z0-9_\-ÁÉÍÓÚáéíóúÑñ]", "", s)
+
+
+def cargar_municipios(ruta="external_data/municipios_madrid.csv"):
+    out = []
+    with open(ruta, "r", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f, delimiter=";")
+        for row in reader:
+            m = row["Municipio"]
+            lat = float(row["Latitud"].replace(",", "."))
+            lon = float(row["Longitud"].replace(",", "."))
+            out.append((m, lat, lon))
+    return out
+
+
+# =========================
+# LIMITADOR
+# =========================
+class LimitadorTokens:
+    """Cubo de tokens: `ritmo` tokens por segundo, como mucho `capacidad` acumulados."""
+
+    def __init__(self, ritmo, capacidad=1):
+        self.ritmo = float(ritmo)
+        self.capacidad = float(capacidad)
+        self.tokens = float(capacidad)
+        self.ultimo = time.monotonic()
+        self.pausado_hasta = 0.0
+        self._lock = asyncio.Lock()
+
+    def _rellenar(self, ahora):
+        self.tokens = min(self.capacidad, self.tokens + (ahora - self.ultimo) * self.ritmo)
+        self.ultimo = ahora
+
+    async def adquirir(self):
+        # El lock reparte los tokens por orden de llegada
+        async with self._lock:
+            while True:
+                ahora = time.monotonic()
+                if ahora < self.pausado_hasta:
+                    await asyncio.sleep(self.pausado_hasta - ahora)
+                    continue
+                self._rellenar(ahora)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.ritmo)
+
+    def pausar(self, segundos):
+        """Nadie pide nada durante `segundos` (Retry-After afecta a toda la cuenta)."""
+        self.pausado_hasta = max(self.pausado_hasta, time.monotonic() + segundos)
+        self.tokens = 0.0
+
+
+# =========================
+# TOKEN OAUTH
+# =========================
+_sesiones = threading.local()
+
+
+def _sesion():
+    """Una sesión de requests por hilo (reutiliza conexiones)."""
+    if not hasattr(_sesiones, "s"):
+        _sesiones.s = requests.Session()
+    return _sesiones.s
+
+
+class GestorToken:
+    """Token compartido; se renueva al caducar o cuando la API lo rechaza."""
+
+    MARGEN = 60
+
+    def __init__(self, config):
+        self.config = config
+        self.token = None
+        self.caduca = 0.0
+        self.renovaciones = 0
+        self._lock = asyncio.Lock()
+
+    def _pedir(self):
+        auth = base64.b64encode(f"{self.config.client_id}:{self.config.client_secret}".encode()).decode()
+        headers = {"Authorization": f"Basic {auth}", "Content-Type": "application/x-www-form-urlencoded"}
+        data = {"grant_type": "client_credentials", "scope": "read"}
+        r = _sesion().post(f"{self.config.api_url}/oauth/token", headers=headers, data=data,
+                           timeout=self.config.timeout)
+        r.raise_for_status()
+        cuerpo = r.json()
+        return cuerpo["access_token"], float(cuerpo.get("expires_in", 3600))
+
+    async def obtener(self):
+        async with self._lock:
+            if self.token is None or time.monotonic() >= self.caduca:
+                token, expira = await asyncio.to_thread(self._pedir)
+                self.token = token
+                self.caduca = time.monotonic() + max(expira - self.MARGEN, expira / 2)
+                self.renovaciones += 1
+            return self.token
+
+    async def invalidar(self, token):
+        """Olvida el token si sigue siendo el actual (otro worker puede haberlo renovado ya)."""
+        async with self._lock:
+            if self.token == token:
+                self.token = None
+
+
+# =========================
+# PETICIONES
+# =========================
+class ErrorDescarga(Exception):
+    """Una página no se pudo descargar tras agotar los reintentos."""
+
+
+def _retry_after(valor):
+    try:
+        return max(0.0, float(valor))
+    except (TypeError, ValueError):
+        return None
+
+
+class Cliente:
+    def __init__(self, config, limitador=None, token=None):
+        self.config = config
+        self.limitador = limitador or LimitadorTokens(config.ritmo, config.rafaga)
+        self.token = token or GestorToken(config)
+        self.peticiones = 0
+        self.limitadas = 0
+
+    def _buscar(self, token, lat, lon, pagina):
+        headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/x-www-form-urlencoded"}
+        data = {
+            "country": "es",
+            "operation": self.config.operation,
+            "propertyType": self.config.property_type,
+            "center": f"{lat},{lon}",
+            "distance": self.config.distancia_metros,
+            "numPage": pagina,
+            "maxItems": self.config.max_items,
+        }
+        return _sesion().post(f"{self.config.api_url}/3.5/es/search", headers=headers, data=data,
+                              timeout=self.config.timeout)
+
+    def _espera(self, intento):
+        """Backoff exponencial con jitter."""
+        base = min(self.config.backoff_max, self.config.backoff_base * 2 ** intento)
+        return base * random.uniform(0.5, 1.0)
+
+    async def buscar_pagina(self, lat, lon, pagina):
+        motivo = ""
+        for intento in range(self.config.max_reintentos + 1):
+            await self.limitador.adquirir()
+            self.peticiones += 1
+            try:
+                token = await self.token.obtener()
+                r = await asyncio.to_thread(self._buscar, token, lat, lon, pagina)
+            except requests.RequestException as e:
+                motivo = type(e).__name__
+                await asyncio.sleep(self._espera(intento))
+                continue
+
+            if r.status_code == 200:
+                return r.json()
+            if r.status_code == 401:
+                # Token caducado o revocado: se renueva y se reintenta sin esperar
+                await self.token.invalidar(token)
+                motivo = "401"
+                continue
+            if r.status_code == 429:
+                self.limitadas += 1
+                espera = max(_retry_after(r.headers.get("Retry-After")) or 0.0, self._espera(intento))
+                print(f"  429: pausa de {espera:.1f}s (intento {intento + 1})")
+                self.limitador.pausar(espera)
+                motivo = "429"
+                continue
+            if r.status_code >= 500:
+                motivo = str(r.status_code)
+                await asyncio.sleep(self._espera(intento))
+                continue
+            raise ErrorDescarga(f"HTTP {r.status_code}: {r.text[:200]}")
+
+        raise ErrorDescarga(f"Sin respuesta válida tras {self.config.max_reintentos + 1} intentos (último: {motivo})")
+
+
+# =========================
+# CHECKPOINT Y ESCRITURA
+# =========================
+class Checkpoint:
+    """
+    {"municipios": {municipio: {"pagina": última página guardada, "terminado": bool}}}
+
+    Se escribe entero y de forma atómica tras cada página.
+    """
+
+    def __init__(self, ruta):
+        self.ruta = Path(ruta)
+        self.estado = {"municipios": {}}
+        if self.ruta.exists():
+            self.estado = json.loads(self.ruta.read_text(encoding="utf-8"))
+
+    def migrar_indice(self, ruta_txt, municipios):
+        """Convierte el progreso_idealista.txt antiguo (índice del primer municipio pendiente)."""
+        ruta_txt = Path(ruta_txt)
+        if self.estado["municipios"] or not ruta_txt.exists():
+            return
+        try:
+            indice = int(ruta_txt.read_text(encoding="utf-8").strip())
+        except ValueError:
+            return
+        for municipio, _, _ in municipios[:indice]:
+            self.estado["municipios"][municipio] = {"pagina": None, "terminado": True}
+        self.guardar()
+
+    def de(self, municipio):
+        return self.estado["municipios"].get(municipio, {"pagina": 0, "terminado": False})
+
+    def marcar(self, municipio, pagina, terminado=False):
+        self.estado["municipios"][municipio] = {"pagina": pagina, "terminado": terminado}
+        self.guardar()
+
+    def guardar(self):
+        tmp = self.ruta.with_suffix(self.ruta.suffix + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.estado, f, ensure_ascii=False, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.ruta)
+
+
+class SalidaMunicipio:
+    """CSV de un municipio: una escritura y un fsync por página, sin repetir anuncios."""
+
+    def __init__(self, ruta):
+        self.ruta = Path(ruta)
+        self.codigos = set()
+        self.campos = CAMPOS
+        if self.ruta.is_file():
+            # Anuncios de una ejecución anterior que se cortó a mitad de página
+            with open(self.ruta, encoding="utf-8", newline="") as f:
+                lector = csv.DictReader(f)
+                self.codigos = {fila["propertyCode"] for fila in lector}
+                # Un CSV de una versión anterior conserva sus columnas
+                self.campos = lector.fieldnames or CAMPOS
+
+    def escribir_pagina(self, filas):
+        nuevas = [fila for fila in filas if str(fila["propertyCode"]) not in self.codigos]
+        existe = self.ruta.is_file()
+        with open(self.ruta, "a", newline="", encoding="utf-8") as f:
+            w = csv.DictWriter(f, fieldnames=self.campos, extrasaction="ignore")
+            if not existe:
+                w.writeheader()
+            w.writerows(nuevas)
+            f.flush()
+            os.fsync(f.fileno())
+        self.codigos.update(str(fila["propertyCode"]) for fila in nuevas)
+        return len(nuevas)
+
+
+def fila_anuncio(municipio, e):
+    return {
+        "municipio": municipio,
+        "propertyCode": e.get("propertyCode", ""),
+        "precio": e.get("price", ""),
+        "banos": e.get("bathrooms", ""),
+        "habitaciones": e.get("rooms", e.get("bedrooms", "")),
+        "tamano_m2": e.get("size", ""),
+        "direccion": e.get("address", ""),
+        "barrio": e.get("neighborhood", ""),
+        "url": e.get("url", ""),
+        "latitud": e.get("latitude", ""),
+        "longitud": e.get("longitude", ""),
+    }
+
+
+# =========================
+# DESCARGA
+# =========================
+def _abrir_almacen(ruta):
+    """AlmacenAnuncios y resolutor de municipios (módulos de la raíz del repo)."""
+    raiz = str(Path(__file__).resolve().parent.parent)
+    if raiz not in sys.path:
+        sys.path.insert(0, raiz)
+    from anuncios import AlmacenAnuncios
+    from municipios import resolutor
+
+    return AlmacenAnuncios(str(ruta)), resolutor()
+
+
+async def descargar_municipio(cliente, checkpoint, municipio, lat, lon, estadisticas, almacen=None):
+    config = cliente.config
+    estado = checkpoint.de(municipio)
+    if estado["terminado"]:
+        return
+    salida = SalidaMunicipio(config.salida / f"{slugify(municipio)}.csv")
+    codigo_ine = None
+    if almacen is not None:
+        almacen, resolver = almacen
+        codigo_ine = resolver.resolver(municipio, fuente="crawler_idealista")
+
+    for pagina in range(estado["pagina"] + 1, config.max_paginas + 1):
+        data = await cliente.buscar_pagina(lat, lon, pagina)
+        elems = data.get("elementList", [])
+        filas = [fila_anuncio(municipio, e) for e in elems]
+        escritas = await asyncio.to_thread(salida.escribir_pagina, filas)
+        if almacen is not None:
+            cambios = await asyncio.to_thread(almacen.guardar, filas, codigo_ine)
+            estadisticas["nuevos"] += cambios["nuevos"]
+            estadisticas["cambiados"] += cambios["cambiados"]
+        ultima = len(elems) < config.max_items or pagina == config.max_paginas
+        checkpoint.marcar(municipio, pagina, terminado=ultima)
+
+        estadisticas["paginas"] += 1
+        estadisticas["anuncios"] += escritas
+        print(f"  {municipio} · página {pagina}: {len(elems)} anuncios (total API: {data.get('total', 0)})")
+        if ultima:
+            return
+
+
+async def rastrear(municipios, config, limite_paginas=None):
+    """
+    Descarga todos los municipios pendientes. Devuelve estadísticas.
+
+    limite_paginas corta la ejecución tras ese número de páginas (para probar
+    la reanudación contra el servidor simulado).
+    """
+    config.salida.mkdir(parents=True, exist_ok=True)
+    checkpoint = Checkpoint(config.checkpoint)
+    cliente = Cliente(config)
+    almacen = _abrir_almacen(config.almacen) if config.almacen else None
+    estadisticas = {"paginas": 0, "anuncios": 0, "nuevos": 0, "cambiados": 0, "fallidos": []}
+    inicio = time.perf_counter()
+
+    cola = asyncio.Queue()
+    for m in municipios:
+        if not checkpoint.de(m[0])["terminado"]:
+            cola.put_nowait(m)
+    pendientes = cola.qsize()
+
+    async def worker():
+        while True:
+            try:
+                municipio, lat, lon = cola.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                await descargar_municipio(cliente, checkpoint, municipio, lat, lon, estadisticas, almacen)
+            except ErrorDescarga as e:
+                # Queda pendiente en el checkpoint y se reintenta en la siguiente ejecución
+                print(f"  ❌ {municipio}: {e}")
+                estadisticas["fallidos"].append(municipio)
+
+    async def vigilar_limite(tareas):
+        while limite_paginas is not None and estadisticas["paginas"] < limite_paginas:
+            await asyncio.sleep(0.01)
+        for t in tareas:
+            t.cancel()
+
+    tareas = [asyncio.create_task(worker()) for _ in range(max(1, config.concurrencia))]
+    vigilante = asyncio.create_task(vigilar_limite(tareas)) if limite_paginas is not None else None
+    await asyncio.gather(*tareas, return_exceptions=limite_paginas is not None)
+    if vigilante:
+        vigilante.cancel()
+    if almacen:
+        almacen[0].close()
+
+    estadisticas.update(
+        municipios=pendientes,
+        segundos=time.perf_counter() - inicio,
+        peticiones=cliente.peticiones,
+        limitadas=cliente.limitadas,
+        renovaciones_token=cliente.token.renovaciones,
+    )
+    return estadisticas
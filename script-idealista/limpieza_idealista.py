@@ -1,46 +1,208 @@
+"""
+Limpieza de los anuncios de Idealista directamente desde los zip.
+
+Lee los CSV de data/vivienda/datos_filtrados_1.zip, datos_filtrados_2.zip y
+datos_nuevos.zip sin descomprimirlos en disco:
+
+- cada miembro del zip se lee en trozos (streaming) y solo con las columnas
+  necesarias; los tres formatos (crawler, crawler con centro del municipio y
+  el volcado ad_* con coordenadas) se llevan a las mismas columnas
+- los miembros se reparten en lotes (un zip abierto una vez por lote) entre
+  un pool de procesos
+- precio / tamano_m2 pasan a número, baños / habitaciones a entero (con
+  huecos), y el municipio de la búsqueda (nombre del fichero) a código INE
+- sale una única tabla ordenada por municipio en
+  data/vivienda/limpios/anuncios.csv (o .parquet / .arrow con
+  FORMATO_INTERMEDIOS, con un row group por municipio) en lugar de un CSV por
+  municipio
+
+Al terminar muestra filas/s y el pico de memoria (proceso principal y workers).
+
+Uso:
+    python script-idealista/limpieza_idealista.py [--procesos 4] [zip ...]
+"""
+import argparse
+import os
+import sys
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+
 import pandas as pd
 
-# Carpeta donde tienes los CSV (ajusta si hace falta)
-INPUT_DIR = Path("data/vivienda/datos_filtrados_1")          # o la carpeta que tengas
-OUTPUT_DIR = Path("data/vivienda/datos_filtrados_11")
-
-# Columnas que quieres conservar (en este orden)
-KEEP_COLS = [
-    "municipality",
-    "precio",
-    "banos",
-    "habitaciones",
-    "propertyCode",
-    "url",
+RAIZ = Path(__file__).resolve().parent.parent
+if str(RAIZ) not in sys.path:
+    sys.path.insert(0, str(RAIZ))
+
+from almacen import escribir_tabla  # noqa: E402
+
+ARCHIVOS = [
+    Path("data/vivienda/datos_filtrados_1.zip"),
+    Path("data/vivienda/datos_filtrados_2.zip"),
+    Path("data/vivienda/datos_nuevos.zip"),
 ]
+SALIDA = Path("data/vivienda/limpios/anuncios.csv")
+
+# Columna limpia -> nombres que tiene en los distintos formatos de origen
+ALIAS = {
+    "propertyCode": ["propertyCode", "ad_id"],
+    "precio": ["precio", "ad_price", "price"],
+    "banos": ["banos", "ad_bathnumber", "bathrooms"],
+    "habitaciones": ["habitaciones", "ad_roomnumber", "rooms"],
+    "tamano_m2": ["tamano_m2", "ad_area", "size"],
+    "latitud": ["ad_latitude", "latitude", "latitud"],
+    "longitud": ["ad_longitude", "longitude", "longitud"],
+    "url": ["url", "ad_urlactive"],
+}
+ORIGEN = {alias: limpia for limpia, alias_ in ALIAS.items() for alias in alias_}
+
+TIPOS = {
+    "precio": "float64",
+    "banos": "Int8",
+    "habitaciones": "Int8",
+    "tamano_m2": "float32",
+    "latitud": "float64",
+    "longitud": "float64",
+}
+COLUMNAS = ["codigo_ine", "fuente", "propertyCode"] + list(TIPOS) + ["url"]
+
+FILAS_TROZO = 50_000
+
 
+# =========================
+# WORKER
+# =========================
+def _limpiar_bloque(bloque):
+    codigos = bloque["propertyCode"].astype("string").str.strip().str.removesuffix(".0")
+    bloque["propertyCode"] = codigos.replace("", pd.NA)
+    for columna, tipo in TIPOS.items():
+        numero = pd.to_numeric(bloque[columna], errors="coerce")
+        if tipo == "Int8":
+            numero = numero.round()
+        bloque[columna] = numero.astype(tipo)
+    return bloque.dropna(subset=["propertyCode"])
 
-OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
-csv_files = sorted(INPUT_DIR.glob("*.csv"))
-if not csv_files:
-    raise SystemExit(f"No encuentro CSVs en: {INPUT_DIR.resolve()}")
+def _columnas_limpias(trozo):
+    trozo = trozo.rename(columns=ORIGEN)
+    # Si un fichero trae dos alias de la misma columna se queda el primero
+    trozo = trozo.loc[:, ~trozo.columns.duplicated()]
+    return trozo.reindex(columns=["propertyCode"] + list(TIPOS) + ["url"])
 
-for csv_path in csv_files:
-    df = pd.read_csv(csv_path)
 
-    # Nos quedamos solo con las columnas que existan en ese archivo
-    cols_presentes = [c for c in KEEP_COLS if c in df.columns]
-    df2 = df[cols_presentes].copy()
+def limpiar_lote(tarea):
+    """
+    (zip, [miembros]) -> (DataFrame limpio con la columna `miembro`, filas leídas).
 
-    # (Opcional) renombrar a español
-    rename_map = {
-        "municipality": "municipio",
-        "precio": "precio",
-        "banos": "banos",
-        "habitaciones": "habitaciones",
-        "propertyCode": "propertyCode",
-        "url": "url",
+    Abre el zip una vez en el propio worker y lee cada miembro en trozos. Los
+    ficheros son pequeños (una búsqueda por municipio), así que los trozos se
+    acumulan y se limpian juntos cada FILAS_TROZO filas.
+    """
+    archivo, nombres = tarea
+    limpios, pendientes, en_cola, leidas = [], [], 0, 0
+    with zipfile.ZipFile(archivo) as zf:
+        for miembro in nombres:
+            with zf.open(miembro) as f:
+                lector = pd.read_csv(f, usecols=lambda c: c in ORIGEN, dtype=str, chunksize=FILAS_TROZO)
+                for trozo in lector:
+                    leidas += len(trozo)
+                    trozo = _columnas_limpias(trozo)
+                    trozo["miembro"] = miembro
+                    pendientes.append(trozo)
+                    en_cola += len(trozo)
+                    if en_cola >= FILAS_TROZO:
+                        limpios.append(_limpiar_bloque(pd.concat(pendientes, ignore_index=True)))
+                        pendientes, en_cola = [], 0
+    if pendientes:
+        limpios.append(_limpiar_bloque(pd.concat(pendientes, ignore_index=True)))
+    if not limpios:
+        return pd.DataFrame(columns=["propertyCode"] + list(TIPOS) + ["url", "miembro"]), leidas
+    return pd.concat(limpios, ignore_index=True), leidas
+
+
+# =========================
+# ORQUESTACIÓN
+# =========================
+def lotes(archivos, por_archivo):
+    """(zip, [miembros]) con los CSV de cada zip repartidos en `por_archivo` lotes, en orden."""
+    tareas = []
+    for archivo in archivos:
+        with zipfile.ZipFile(archivo) as zf:
+            nombres = [n for n in zf.namelist() if n.lower().endswith(".csv")]
+        tamano = max(1, -(-len(nombres) // por_archivo))
+        tareas += [(str(archivo), nombres[i:i + tamano]) for i in range(0, len(nombres), tamano)]
+    return tareas
+
+
+def pico_memoria_mb():
+    """Pico de memoria residente (proceso principal, mayor de los workers) en MB."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None, None
+    # ru_maxrss va en KB en Linux y en bytes en macOS
+    escala = 1024 * 1024 if sys.platform == "darwin" else 1024
+    propio = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / escala
+    workers = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / escala
+    return propio, workers
+
+
+def limpiar(archivos=ARCHIVOS, salida=SALIDA, procesos=None):
+    """Limpia todos los zip y escribe la tabla consolidada. Devuelve estadísticas."""
+    from municipios import resolutor
+
+    inicio = time.perf_counter()
+    procesos = procesos or os.cpu_count() or 1
+    tareas = lotes(archivos, 2 * procesos)
+
+    partes, leidas = [], 0
+    with ProcessPoolExecutor(max_workers=procesos) as pool:
+        # map conserva el orden: si un anuncio sale dos veces gana el último zip
+        for (archivo, _), (df, n) in zip(tareas, pool.map(limpiar_lote, tareas)):
+            leidas += n
+            df.insert(0, "fuente", Path(archivo).stem)
+            partes.append(df)
+
+    anuncios = pd.concat(partes, ignore_index=True)
+    # Municipio de la búsqueda = nombre del fichero dentro del zip
+    municipio = anuncios.pop("miembro").map(lambda m: Path(m).stem)
+    anuncios["codigo_ine"] = resolutor().resolver_serie(municipio, fuente="limpieza_idealista")
+    # El mismo anuncio en el mismo municipio (varios zip o filas repetidas) una sola vez
+    anuncios = anuncios.drop_duplicates(["codigo_ine", "propertyCode"], keep="last")
+    anuncios = anuncios[COLUMNAS].sort_values(["codigo_ine", "propertyCode"], ignore_index=True)
+
+    destino = escribir_tabla(anuncios, str(salida), particion="codigo_ine")
+    segundos = time.perf_counter() - inicio
+    propio, workers = pico_memoria_mb()
+    return {
+        "ficheros": sum(len(nombres) for _, nombres in tareas),
+        "leidas": leidas,
+        "filas": len(anuncios),
+        "municipios": anuncios["codigo_ine"].nunique(),
+        "sin_municipio": int(anuncios["codigo_ine"].isna().sum()),
+        "segundos": segundos,
+        "procesos": procesos,
+        "pico_mb": propio,
+        "pico_workers_mb": workers,
+        "destino": destino,
     }
-    df2 = df2.rename(columns=rename_map)
 
-    out_path = OUTPUT_DIR / csv_path.name
-    df2.to_csv(out_path, index=False)
 
-print(f"✅ Listo. CSV filtrados en: {OUTPUT_DIR.resolve()}")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Limpieza de anuncios de Idealista desde los zip")
+    parser.add_argument("archivos", nargs="*", type=Path, default=ARCHIVOS)
+    parser.add_argument("--salida", type=Path, default=SALIDA)
+    parser.add_argument("--procesos", type=int, default=None)
+    args = parser.parse_args()
+
+    stats = limpiar(args.archivos, args.salida, args.procesos)
+    print(f"{stats['ficheros']} CSV de {len(args.archivos)} zip con {stats['procesos']} procesos: "
+          f"{stats['leidas']} filas leídas en {stats['segundos']:.2f}s "
+          f"({stats['leidas'] / stats['segundos']:,.0f} filas/s)")
+    if stats["pico_mb"] is not None:
+        print(f"Pico de memoria: {stats['pico_mb']:.0f} MB (proceso principal), "
+              f"{stats['pico_workers_mb']:.0f} MB (mayor worker)")
+    print(f"✅ {stats['filas']} anuncios de {stats['municipios']} municipios en {stats['destino']}")
+    if stats["sin_municipio"]:
+        print(f"⚠️ {stats['sin_municipio']} anuncios sin código INE (ver external_data/municipios_no_resueltos.csv)")
@@ -0,0 +1,161 @@
+"""
+Servidor local que imita la API de Idealista para probar el crawler sin cuota.
+
+- POST /oauth/token   → token que caduca a los --expira segundos
+- POST /3.5/es/search → páginas de anuncios deterministas por (center, numPage)
+
+Reproduce los fallos que el crawler tiene que aguantar:
+- 429 con Retry-After si se supera --ritmo peticiones/s (cubo de tokens)
+- 401 con un token caducado o desconocido
+- latencia de --latencia segundos por petición
+
+Uso:
+    python script-idealista/mock_idealista.py [--puerto 8765] [--ritmo 20] [--expira 30]
+"""
+import argparse
+import json
+import math
+import threading
+import time
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+class EstadoMock:
+    def __init__(self, ritmo=20.0, rafaga=5, expira=30.0, latencia=0.05, anuncios=35):
+        self.ritmo = ritmo
+        self.rafaga = rafaga
+        self.expira = expira
+        self.latencia = latencia
+        self.anuncios = anuncios
+        self.tokens_oauth = {}
+        self.cubo = float(rafaga)
+        self.ultimo = time.monotonic()
+        self.lock = threading.Lock()
+        self.contadores = {"token": 0, "busquedas": 0, "429": 0, "401": 0}
+
+    def permitir(self):
+        """Cubo de tokens del lado servidor. Devuelve (permitido, segundos hasta el siguiente)."""
+        with self.lock:
+            ahora = time.monotonic()
+            self.cubo = min(self.rafaga, self.cubo + (ahora - self.ultimo) * self.ritmo)
+            self.ultimo = ahora
+            if self.cubo >= 1:
+                self.cubo -= 1
+                return True, 0
+            return False, (1 - self.cubo) / self.ritmo
+
+    def anuncios_pagina(self, centro, pagina, max_items):
+        """Anuncios deterministas: el total depende del centro (0 a 2 * anuncios)."""
+        semilla = zlib.crc32(centro.encode())
+        total = semilla % (2 * self.anuncios + 1)
+        try:
+            lat, lon = (float(v) for v in centro.split(","))
+        except ValueError:
+            lat, lon = 40.4168, -3.7038
+        inicio = (pagina - 1) * max_items
+        elementos = [
+            {
+                "propertyCode": str(semilla % 10_000_000 * 100 + i),
+                "price": 100_000 + (semilla + i * 7919) % 900_000,
+                "bathrooms": 1 + i % 3,
+                "rooms": 1 + i % 5,
+                "size": 40 + (semilla + i) % 160,
+                "address": f"Calle {i}",
+                "neighborhood": "Centro",
+                "url": f"https://www.idealista.com/inmueble/{semilla % 10_000_000 * 100 + i}/",
+                # Dentro del círculo de búsqueda (hasta ~2 km del centro)
+                "latitude": round(lat + 0.018 * math.sin(i * 2.399) * (i % 7) / 7, 7),
+                "longitude": round(lon + 0.024 * math.cos(i * 2.399) * (i % 7) / 7, 7),
+            }
+            for i in range(inicio, min(total, inicio + max_items))
+        ]
+        return {"elementList": elementos, "total": total, "actualPage": pagina,
+                "totalPages": math.ceil(total / max_items) if max_items else 0}
+
+
+def crear_handler(estado):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _responder(self, codigo, cuerpo, cabeceras=None):
+            datos = json.dumps(cuerpo).encode()
+            self.send_response(codigo)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(datos)))
+            for k, v in (cabeceras or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(datos)
+
+        def do_POST(self):
+            longitud = int(self.headers.get("Content-Length", 0))
+            form = {k: v[0] for k, v in parse_qs(self.rfile.read(longitud).decode()).items()}
+
+            if self.path == "/oauth/token":
+                token = uuid.uuid4().hex
+                with estado.lock:
+                    estado.tokens_oauth[token] = time.monotonic() + estado.expira
+                    estado.contadores["token"] += 1
+                return self._responder(200, {"access_token": token, "token_type": "bearer",
+                                             "expires_in": estado.expira})
+
+            if self.path != "/3.5/es/search":
+                return self._responder(404, {"error": "not found"})
+
+            time.sleep(estado.latencia)
+            token = self.headers.get("Authorization", "").removeprefix("Bearer ")
+            with estado.lock:
+                caduca = estado.tokens_oauth.get(token, 0)
+            if time.monotonic() >= caduca:
+                with estado.lock:
+                    estado.contadores["401"] += 1
+                return self._responder(401, {"error": "invalid_token"})
+
+            permitido, espera = estado.permitir()
+            if not permitido:
+                with estado.lock:
+                    estado.contadores["429"] += 1
+                return self._responder(429, {"message": "Too Many Requests"},
+                                       {"Retry-After": f"{math.ceil(espera * 10) / 10:.1f}"})
+
+            with estado.lock:
+                estado.contadores["busquedas"] += 1
+            return self._responder(200, estado.anuncios_pagina(
+                form.get("center", ""), int(form.get("numPage", 1)), int(form.get("maxItems", 20))
+            ))
+
+    return Handler
+
+
+def arrancar(puerto=0, **opciones):
+    """Arranca el servidor en un hilo. Devuelve (servidor, estado, url)."""
+    estado = EstadoMock(**opciones)
+    servidor = ThreadingHTTPServer(("127.0.0.1", puerto), crear_handler(estado))
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, estado, f"http://127.0.0.1:{servidor.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="API de Idealista simulada")
+    parser.add_argument("--puerto", type=int, default=8765)
+    parser.add_argument("--ritmo", type=float, default=20.0, help="peticiones/s antes de responder 429")
+    parser.add_argument("--rafaga", type=int, default=5)
+    parser.add_argument("--expira", type=float, default=30.0, help="segundos de validez del token")
+    parser.add_argument("--latencia", type=float, default=0.05)
+    parser.add_argument("--anuncios", type=int, default=35, help="anuncios medios por municipio")
+    args = parser.parse_args()
+
+    servidor, estado, url = arrancar(args.puerto, ritmo=args.ritmo, rafaga=args.rafaga, expira=args.expira,
+                                     latencia=args.latencia, anuncios=args.anuncios)
+    print(f"API simulada en {url} (Ctrl+C para parar)")
+    try:
+        while True:
+            time.sleep(5)
+            print(f"  {estado.contadores}")
+    except KeyboardInterrupt:
+        servidor.shutdown()
@@ -1,171 +1,80 @@
-import os, csv, re, base64, time
+"""
+Descarga de anuncios de Idealista por municipio (ver crawler_idealista.py).
+
+Uso:
+    export IDEALISTA_CLIENT_ID=... IDEALISTA_CLIENT_SECRET=...
+    python script-idealista/script-idealista.py [--concurrencia 4] [--ritmo 1] [--rafaga 1]
+
+Contra el servidor simulado (sin cuota ni credenciales reales):
+    python script-idealista/mock_idealista.py --puerto 8765 &
+    IDEALISTA_API=http://127.0.0.1:8765 IDEALISTA_CLIENT_ID=x IDEALISTA_CLIENT_SECRET=x \\
+        python script-idealista/script-idealista.py --ritmo 50 --rafaga 10
+
+Si se interrumpe (o se agota la cuota), al volver a ejecutarlo sigue desde la
+última página guardada de cada municipio.
+"""
+import argparse
+import asyncio
+import os
 from pathlib import Path
-import requests
 
-# ==== Config ====
-TOKEN_URL = "https://api.idealista.com/oauth/token"
-SEARCH_URL = "https://api.idealista.com/3.5/es/search"
-
-CLIENT_ID = os.getenv("IDEALISTA_CLIENT_ID")
-CLIENT_SECRET = os.getenv("IDEALISTA_CLIENT_SECRET")
-if not CLIENT_ID or not CLIENT_SECRET:
-    raise RuntimeError("Faltan IDEALISTA_CLIENT_ID / IDEALISTA_CLIENT_SECRET")
+from crawler_idealista import Checkpoint, Config, cargar_municipios, rastrear
 
 MUNICIPIOS_CSV = "external_data/municipios_madrid.csv"
 OUTPUT_DIR = Path("data/vivienda/datos_filtrados")
 
-OPERATION = "buy"
-PROPERTY_TYPE = "homes"
-DISTANCE_METROS = 2000
-MAX_ITEMS = 20
-MAX_PAGINAS = 2
-
-# Espera normal entre peticiones (cuando todo va bien)
-SLEEP_OK = 1.0
-
-# Progreso (para reanudar)
-PROGRESO_FILE = Path("progreso_idealista.txt")
-
-def slugify(s: str) -> str:
-    s = s.strip().replace(" ", "_")
-    return re.sub(r"[^A-Za-z0-9_\-ÁÉÍÓÚáéíóúÑñ]", "", s)
-
-def get_access_token():
-    auth = base64.b64encode(f"{CLIENT_ID}:{CLIENT_SECRET}".encode()).decode()
-    headers = {"Authorization": f"Basic {auth}", "Content-Type": "application/x-www-form-urlencoded"}
-    data = {"grant_type": "client_credentials", "scope": "read"}
-    r = requests.post(TOKEN_URL, headers=headers, data=data, timeout=30)
-    r.raise_for_status()
-    return r.json()["access_token"]
-
-def cargar_municipios():
-    out = []
-    with open(MUNICIPIOS_CSV, "r", encoding="utf-8-sig") as f:
-        reader = csv.DictReader(f, delimiter=";")
-        for row in reader:
-            m = row["Municipio"]
-            lat = float(row["Latitud"].replace(",", "."))
-            lon = float(row["Longitud"].replace(",", "."))
-            out.append((m, lat, lon))
-    return out
-
-def abrir_csv(path: Path, fieldnames):
-    existe = path.is_file()
-    f = open(path, "a", newline="", encoding="utf-8")
-    w = csv.DictWriter(f, fieldnames=fieldnames)
-    if not existe:
-        w.writeheader()
-        f.flush()
-        os.fsync(f.fileno())
-    return f, w
+# Progreso (para reanudar): municipio y última página guardada
+PROGRESO_FILE = Path("progreso_idealista.json")
+# Almacén de anuncios sin duplicados (ver anuncios.py)
+ALMACEN_FILE = Path("data/vivienda/anuncios.sqlite")
+# Progreso del script anterior (índice del municipio), se migra si existe
+PROGRESO_ANTIGUO = Path("progreso_idealista.txt")
 
-def guardar_progreso(i: int):
-    PROGRESO_FILE.write_text(str(i), encoding="utf-8")
-
-def leer_progreso() -> int:
-    if PROGRESO_FILE.exists():
-        try:
-            return int(PROGRESO_FILE.read_text(encoding="utf-8").strip())
-        except:
-            return 0
-    return 0
-
-class RateLimited(Exception):
-    def __init__(self, retry_after=None, text=None):
-        self.retry_after = retry_after
-        self.text = text
-        super().__init__("Rate limited (429)")
-
-def buscar_pagina(token, lat, lon, page):
-    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/x-www-form-urlencoded"}
-    data = {
-        "country": "es",
-        "operation": OPERATION,
-        "propertyType": PROPERTY_TYPE,
-        "center": f"{lat},{lon}",
-        "distance": DISTANCE_METROS,
-        "numPage": page,
-        "maxItems": MAX_ITEMS
-    }
-    r = requests.post(SEARCH_URL, headers=headers, data=data, timeout=30)
-
-    if r.status_code == 429:
-        retry_after = r.headers.get("Retry-After")
-        raise RateLimited(retry_after=retry_after, text=r.text)
-
-    r.raise_for_status()
-    return r.json()
 
 def main():
-    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-
-    start_idx = leer_progreso()
-    municipios = cargar_municipios()
-
-    print(f"Reanudando desde índice {start_idx} de {len(municipios)} municipios.")
-    token = get_access_token()
-
-    fieldnames = ["municipio", "propertyCode", "precio", "banos", "habitaciones",
-                  "tamano_m2", "direccion", "barrio", "url"]
-
-    for i in range(start_idx, len(municipios)):
-        municipio, lat, lon = municipios[i]
-        slug = slugify(municipio)
-        csv_path = OUTPUT_DIR / f"{slug}.csv"
-
-        # Guardamos progreso ANTES de empezar este municipio
-        guardar_progreso(i)
-
-        print(f"\n=== {municipio} === -> {csv_path}")
-
-        f, w = abrir_csv(csv_path, fieldnames)
-        try:
-            for page in range(1, MAX_PAGINAS + 1):
-                try:
-                    data = buscar_pagina(token, lat, lon, page)
-                except RateLimited as rl:
-                    # Aquí paramos todo, para no quemar cuota
-                    msg = f"\n[STOP] 429 Rate Limit. Idealista te está limitando o has agotado cuota."
-                    if rl.retry_after:
-                        msg += f" Retry-After={rl.retry_after} (segundos)."
-                    print(msg)
-                    print("Guardado progreso. Cuando tengas cuota, vuelve a ejecutar el script y seguirá donde lo dejó.")
-                    return
-
-                elems = data.get("elementList", [])
-                total = data.get("total", 0)
-                print(f"  Página {page}: {len(elems)} (total API: {total})")
-
-                if not elems:
-                    break
-
-                for e in elems:
-                    row = {
-                        "municipio": municipio,
-                        "propertyCode": e.get("propertyCode", ""),
-                        "precio": e.get("price", ""),
-                        "banos": e.get("bathrooms", ""),
-                        "habitaciones": e.get("rooms", e.get("bedrooms", "")),
-                        "tamano_m2": e.get("size", ""),
-                        "direccion": e.get("address", ""),
-                        "barrio": e.get("neighborhood", ""),
-                        "url": e.get("url", ""),
-                    }
-                    w.writerow(row)
-                    f.flush()
-                    os.fsync(f.fileno())
-
-                if len(elems) < MAX_ITEMS:
-                    break
-
-                time.sleep(SLEEP_OK)
-
-        finally:
-            f.close()
+    parser = argparse.ArgumentParser(description="Descarga de anuncios de Idealista")
+    parser.add_argument("--concurrencia", type=int, default=4, help="municipios a la vez")
+    parser.add_argument("--ritmo", type=float, default=1.0, help="peticiones por segundo")
+    parser.add_argument("--rafaga", type=int, default=1, help="peticiones seguidas permitidas")
+    parser.add_argument("--max-paginas", type=int, default=2)
+    parser.add_argument("--salida", type=Path, default=OUTPUT_DIR)
+    parser.add_argument("--checkpoint", type=Path, default=PROGRESO_FILE)
+    parser.add_argument("--almacen", type=Path, default=ALMACEN_FILE,
+                        help="almacén SQLite de anuncios ('' para no usarlo)")
+    args = parser.parse_args()
+
+    client_id = os.getenv("IDEALISTA_CLIENT_ID")
+    client_secret = os.getenv("IDEALISTA_CLIENT_SECRET")
+    if not client_id or not client_secret:
+        raise RuntimeError("Faltan IDEALISTA_CLIENT_ID / IDEALISTA_CLIENT_SECRET")
+
+    config = Config(
+        client_id=client_id,
+        client_secret=client_secret,
+        salida=args.salida,
+        checkpoint=args.checkpoint,
+        almacen=args.almacen if str(args.almacen) not in ("", ".") else None,
+        max_paginas=args.max_paginas,
+        ritmo=args.ritmo,
+        rafaga=args.rafaga,
+        concurrencia=args.concurrencia,
+    )
+
+    municipios = cargar_municipios(MUNICIPIOS_CSV)
+    Checkpoint(config.checkpoint).migrar_indice(PROGRESO_ANTIGUO, municipios)
+
+    stats = asyncio.run(rastrear(municipios, config))
+    print(f"\n{stats['paginas']} páginas, {stats['anuncios']} anuncios nuevos de {stats['municipios']} municipios "
+          f"en {stats['segundos']:.1f}s ({stats['peticiones']} peticiones, {stats['limitadas']} con 429, "
+          f"{stats['renovaciones_token']} tokens)")
+    if config.almacen:
+        print(f"Almacén {config.almacen}: {stats['nuevos']} anuncios nuevos, {stats['cambiados']} cambiados")
+    if stats["fallidos"]:
+        print(f"⚠️ Pendientes ({len(stats['fallidos'])}): {', '.join(stats['fallidos'])}. "
+              "Vuelve a ejecutar el script para reintentarlos.")
+    else:
+        print("\n✅ Terminado. Todos los municipios procesados.")
 
-    # Si acabó todo, ponemos progreso al final
-    guardar_progreso(len(municipios))
-    print("\n✅ Terminado. Todos los municipios procesados.")
 
 if __name__ == "__main__":
     main()
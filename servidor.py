@@ -0,0 +1,123 @@
+"""
+Servidor de producción con varios procesos (prefork) para app.py.
+
+El proceso principal carga el snapshot una sola vez (app.crear_app), abre el
+socket y crea los trabajadores con fork. Cada trabajador hereda los datos ya
+cargados y comparte sus páginas con los demás mientras no se escriban
+(copy-on-write):
+
+- gc.freeze() antes del fork: el recolector de basura de los trabajadores no
+  recorre (ni escribe en) los objetos cargados por el proceso principal
+- los datos grandes son arrays de numpy (tabla de indicadores, índices de
+  proximidad y similares) o bytes (geometrías ya serializadas en el
+  snapshot), cuyo contenido no se toca al leerlos; con
+  FORMATO_INTERMEDIOS=arrow la tabla se mapea directamente desde disco
+- importar app.py no escribe ficheros, así que los trabajadores no compiten
+  por ninguna escritura
+
+Los trabajadores aceptan conexiones del mismo socket (el kernel las reparte).
+Si uno muere, el proceso principal lo sustituye. /metrics suma las series de
+todos los trabajadores (ver metricas.py). Solo funciona en sistemas con fork
+(Linux, macOS); en Windows queda `python app.py`.
+
+También sirve con gunicorn, si está instalado:
+
+    gunicorn -w 4 --preload "app:crear_app()"
+
+Uso:
+    python servidor.py --trabajadores 4 --puerto 8000
+"""
+import argparse
+import gc
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+
+from metricas import METRICAS
+
+
+def abrir_socket(host, puerto, cola=128):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, puerto))
+    sock.listen(cola)
+    sock.set_inheritable(True)
+    return sock
+
+
+def trabajador(app, sock, host, puerto):
+    """Atiende peticiones del socket compartido hasta recibir SIGTERM."""
+    from werkzeug.serving import BaseWSGIServer
+
+    def salir(*_):
+        METRICAS.volcar(forzar=True)
+        os._exit(0)
+
+    signal.signal(signal.SIGTERM, salir)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    METRICAS.arrancar_volcado()
+    servidor = BaseWSGIServer(host, puerto, app, fd=sock.fileno())
+    try:
+        servidor.serve_forever()
+    finally:
+        os._exit(0)
+
+
+def servir(host="127.0.0.1", puerto=8000, trabajadores=4, avisar=print):
+    # 1️⃣ Datos cargados una vez en el proceso principal
+    from app import crear_app
+
+    app = crear_app()
+    sock = abrir_socket(host, puerto)
+    METRICAS.directorio = tempfile.mkdtemp(prefix="metricas_")
+
+    # 2️⃣ Lo cargado hasta aquí pasa a la generación permanente del GC
+    gc.collect()
+    gc.freeze()
+
+    # 3️⃣ Trabajadores (y reposición de los que mueran)
+    hijos = set()
+
+    def lanzar():
+        pid = os.fork()
+        if pid == 0:
+            trabajador(app, sock, host, puerto)
+        hijos.add(pid)
+
+    def parar(*_):
+        for pid in hijos:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in list(hijos):
+            os.waitpid(pid, 0)
+        shutil.rmtree(METRICAS.directorio, ignore_errors=True)
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, parar)
+    signal.signal(signal.SIGINT, parar)
+
+    for _ in range(trabajadores):
+        lanzar()
+    avisar(f"Sirviendo en http://{host}:{puerto} con {trabajadores} trabajadores (pid {os.getpid()})")
+
+    while True:
+        pid, estado = os.wait()
+        if pid in hijos:
+            hijos.discard(pid)
+            avisar(f"⚠ Trabajador {pid} terminado (estado {estado}); se sustituye")
+            lanzar()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor de producción con varios procesos")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=8000)
+    parser.add_argument("--trabajadores", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    servir(args.host, args.puerto, args.trabajadores)
@@ -0,0 +1,106 @@
+"""
+Municipios con un perfil parecido.
+
+Índice de vecinos más cercanos sobre el vector de las cinco dimensiones
+(educacion, salud, transporte, economia, housing) de valores.csv. Se
+construye una vez por snapshot al arrancar app.py:
+
+- cada dimensión se normaliza min-max sobre toda la tabla (float32, una
+  fila contigua por dimensión)
+- las filas se ordenan por año (si hay columna `anio`) y clúster, así que
+  "mismo año" y "mismo clúster" son un tramo contiguo de la matriz
+- la distancia es euclídea ponderada con pesos elegidos en cada consulta
+  (suman 1, así que la distancia queda entre 0 y 1). Con pesos variables
+  un árbol no sirve; recorrer el tramo es un producto de (n, 5) por 5 y
+  sigue en decenas de microsegundos con los ~8000 municipios de España
+
+Los huecos de una dimensión se rellenan con su mediana.
+"""
+import numpy as np
+
+DIMENSIONES = ["educacion", "salud", "transporte", "economia", "housing"]
+
+# Municipios parecidos que se devuelven por defecto
+K_SIMILARES = 5
+
+
+class IndiceSimilares:
+    def __init__(self, df, dimensiones=DIMENSIONES, columna_grupo="grupo", columna_anio="anio"):
+        self.dimensiones = list(dimensiones)
+        df = df.dropna(subset=["codigo_ine"])
+
+        anios = df[columna_anio].to_numpy() if columna_anio in df else np.zeros(len(df), dtype=np.int64)
+        grupos = df[columna_grupo].fillna(-1).to_numpy(dtype=np.float64)
+        orden = np.lexsort((grupos, anios))
+
+        # 1️⃣ Matriz normalizada (min-max global por dimensión, huecos a la mediana)
+        valores = df[self.dimensiones].to_numpy(dtype=np.float64)[orden]
+        minimo = np.nanmin(valores, axis=0)
+        rango = np.nanmax(valores, axis=0) - minimo
+        normalizada = (valores - minimo) / np.where(rango > 0, rango, 1)
+        normalizada = np.where(np.isnan(normalizada), np.nanmedian(normalizada, axis=0), normalizada)
+        # (dimensiones, municipios): cada dimensión es un vector contiguo
+        self.matriz = np.ascontiguousarray(normalizada.T, dtype=np.float32)
+
+        self.codigos = df["codigo_ine"].to_numpy(dtype=np.int64)[orden]
+        self.nombres = df["Nombre"].to_numpy()[orden]
+        self.grupos = grupos[orden]
+        self.anios = anios[orden]
+        self.ultimo_anio = self.anios.max() if len(self.anios) else None
+
+        # 2️⃣ Tramos contiguos: (año,) y (año, grupo) -> (inicio, fin)
+        self.tramos = {}
+        for clave in (self.anios.tolist(), list(zip(self.anios.tolist(), self.grupos.tolist()))):
+            for i, c in enumerate(clave):
+                inicio, _ = self.tramos.get(c, (i, i))
+                self.tramos[c] = (inicio, i + 1)
+        self.fila = {(c, a): i for i, (c, a) in enumerate(zip(self.codigos.tolist(), self.anios.tolist()))}
+
+    def _pesos(self, pesos):
+        """Vector de pesos que suma 1 (por defecto, todas las dimensiones igual)."""
+        w = np.ones(len(self.dimensiones))
+        for d, valor in (pesos or {}).items():
+            if d not in self.dimensiones:
+                raise ValueError(f"Dimensión desconocida: {d}")
+            w[self.dimensiones.index(d)] = float(valor)
+        if (w < 0).any() or w.sum() == 0:
+            raise ValueError("Los pesos deben ser no negativos y no todos cero")
+        return (w / w.sum()).astype(np.float32)
+
+    def vecinos(self, codigo, k=K_SIMILARES, mismo_grupo=False, pesos=None, anio=None):
+        """
+        Los k municipios con el perfil más parecido al de `codigo` (sin incluirlo).
+        Devuelve (filas, distancias) de menor a mayor distancia.
+        """
+        anio = self.ultimo_anio if anio is None else int(anio)
+        fila = self.fila.get((int(codigo), anio))
+        if fila is None:
+            raise KeyError(f"Municipio sin perfil: {codigo}")
+
+        clave = (anio, self.grupos[fila]) if mismo_grupo else anio
+        inicio, fin = self.tramos[clave]
+        w = self._pesos(pesos)
+
+        diferencia = self.matriz[:, inicio:fin] - self.matriz[:, fila:fila + 1]
+        diferencia *= diferencia
+        cuadrados = w @ diferencia
+        cuadrados[fila - inicio] = np.inf
+
+        k = max(0, min(int(k), fin - inicio - 1))
+        if k == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        cercanos = np.argpartition(cuadrados, k - 1)[:k]
+        cercanos = cercanos[np.argsort(cuadrados[cercanos], kind="stable")]
+        return cercanos + inicio, np.sqrt(cuadrados[cercanos])
+
+    def registros(self, filas, distancias):
+        return [
+            {
+                "codigo_ine": int(self.codigos[f]),
+                "Nombre": self.nombres[f],
+                "grupo": float(self.grupos[f]),
+                "distancia": round(float(d), 4),
+                "similitud": round(1 - float(d), 4),
+            }
+            for f, d in zip(filas, distancias)
+        ]
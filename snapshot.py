@@ -0,0 +1,220 @@
+"""
+Snapshot de servicio para app.py.
+
+Se construye una sola vez (paso del pipeline) y contiene todo lo que la
+interfaz necesita en memoria:
+
+- códigos INE con geometría (el GeoJSON reproyectado a EPSG:4326 se
+  escribe aparte en static/)
+- tabla de indicadores (valores.csv) con la columna codigo_ine; con
+  FORMATO_INTERMEDIOS=arrow va aparte en un fichero Arrow que app.py mapea
+  en memoria en lugar de deserializarlo del pickle
+- informe de verificación de códigos contra el GeoJSON
+- resúmenes de caja por dimensión (globales y por clúster)
+- niveles de geometría simplificada (geometrias-municipios.py), separados por
+  clúster y ya serializados a JSON (bytes), con sus variantes gzip/brotli
+  (entrega.py) para servirlos sin comprimir en cada petición
+- índice de proximidad entre municipios (proximidad.py)
+
+El fichero se identifica por un hash de las entradas. app.py solo lo carga
+y se niega a arrancar si las entradas han cambiado desde que se generó.
+
+Con varios procesos (servidor.py) el snapshot se carga una vez en el proceso
+principal y los trabajadores lo heredan con fork. Por eso las geometrías van
+como un único bytes por clúster y nivel y no como árboles de dicts y listas:
+leer un objeto de Python escribe en su contador de referencias y copiaría la
+página en cada trabajador, mientras que el contenido de un bytes no se toca.
+
+Uso:
+    python snapshot.py
+"""
+import hashlib
+import json
+import os
+import pickle
+import time
+
+from almacen import FORMATO, escribir_tabla, leer_tabla, ruta_existente
+from entrega import variantes
+from estadisticas import calcular_estadisticas
+from municipios import DIMENSION_CSV, resolutor
+from proximidad import IndiceProximidad
+
+# Rutas
+GEOJSON_ORIGEN = os.path.join("static", "municipios_madrid.geojson")
+GEOJSON_4326 = os.path.join("static", "municipios_madrid_4326.geojson")
+CSV_VALORES = os.path.join("data_interfaz", "valores.csv")
+CSV_VERIFICACION = os.path.join("external_data", "verificacion_nombres.csv")
+SNAPSHOT_PATH = os.path.join("data_interfaz", "snapshot.pkl")
+VALORES_ARROW = os.path.join("data_interfaz", "snapshot_valores.arrow")
+GEOMETRIAS_DIR = os.path.join("static", "geometrias")
+NIVELES_PATH = os.path.join(GEOMETRIAS_DIR, "niveles.json")
+
+# Se incrementa cuando cambia el contenido o la forma del snapshot
+FORMATO_SNAPSHOT = 7
+
+
+class SnapshotObsoleto(RuntimeError):
+    """El snapshot no existe o no corresponde a las entradas actuales."""
+
+
+def entradas():
+    """Ficheros de los que depende el snapshot (incluidos los niveles de geometría)."""
+    if not os.path.exists(NIVELES_PATH):
+        raise SnapshotObsoleto(f"No existe {NIVELES_PATH}. Ejecuta: python geometrias-municipios.py")
+    with open(NIVELES_PATH, encoding="utf-8") as f:
+        niveles = json.load(f)
+    return [GEOJSON_ORIGEN, ruta_existente(CSV_VALORES), DIMENSION_CSV, NIVELES_PATH] + [
+        os.path.join(GEOMETRIAS_DIR, n["geojson"]) for n in niveles
+    ]
+
+
+def hash_entradas(rutas=None):
+    """Hash sha256 del contenido de las entradas y del formato del snapshot."""
+    rutas = entradas() if rutas is None else rutas
+    h = hashlib.sha256(f"formato={FORMATO_SNAPSHOT}".encode())
+    for ruta in rutas:
+        h.update(ruta.replace("\\", "/").encode())
+        with open(ruta, "rb") as f:
+            for bloque in iter(lambda: f.read(1 << 20), b""):
+                h.update(bloque)
+    return h.hexdigest()[:16]
+
+
+# =========================
+# CONSTRUCCIÓN
+# =========================
+def construir_snapshot(destino=SNAPSHOT_PATH):
+    # geopandas solo se necesita aquí, nunca al servir
+    import geopandas as gpd
+
+    inicio = time.perf_counter()
+    version = hash_entradas()
+
+    # 1️⃣ Geometrías en WGS84
+    gdf = gpd.read_file(GEOJSON_ORIGEN).to_crs(epsg=4326)
+    gdf.to_file(GEOJSON_4326, driver="GeoJSON")
+    geojson_data = json.loads(gdf.to_json(drop_id=True))
+
+    # 2️⃣ Indicadores con su código INE (tabla de dimensión de municipios)
+    origen_valores = ruta_existente(CSV_VALORES)
+    df = leer_tabla(origen_valores)
+    df["codigo_ine"] = resolutor().resolver_serie(df["Nombre"], fuente=origen_valores)
+
+    # 3️⃣ Verificación de códigos
+    geojson_codigos = {f["properties"]["codigo_ine"] for f in geojson_data["features"]}
+    verificacion = df[["Nombre", "codigo_ine"]].copy()
+    verificacion["coincide_con_geojson"] = verificacion["codigo_ine"].isin(geojson_codigos).map(
+        {True: "✅ SÍ", False: "❌ NO"}
+    )
+    verificacion.to_csv(CSV_VERIFICACION, index=False)
+
+    # 4️⃣ Niveles de geometría simplificada, completos y por clúster
+    geometrias = cargar_niveles_geometria(df)
+
+    # 5️⃣ Centroides y distancias entre municipios
+    proximidad = IndiceProximidad.desde_geojson(GEOJSON_ORIGEN)
+
+    snapshot = {
+        "formato": FORMATO_SNAPSHOT,
+        "version": version,
+        "geojson_codigos": sorted(geojson_codigos),
+        "valores": df,
+        "verificacion": verificacion,
+        "estadisticas": calcular_estadisticas(df),
+        "geometrias": geometrias,
+        "proximidad": proximidad,
+    }
+    if FORMATO == "arrow":
+        snapshot["valores"] = None
+        snapshot["valores_arrow"] = escribir_tabla(df, VALORES_ARROW, formato="arrow", index=True)
+
+    tmp = destino + ".tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, destino)
+
+    no_coinciden = int((verificacion["coincide_con_geojson"] == "❌ NO").sum())
+    print(f"Snapshot {version} guardado en {destino} ({time.perf_counter() - inicio:.2f}s)")
+    if snapshot.get("valores_arrow"):
+        snapshot["valores"] = df
+    print(f"  {len(df)} municipios, {len(geojson_data['features'])} geometrías, {no_coinciden} sin coincidencia")
+    return snapshot
+
+
+def _json_compacto(obj):
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def cargar_niveles_geometria(df):
+    """
+    {"niveles": [...], "todas": {nivel: bytes},
+     "por_cluster": {"1.0": {nivel: bytes}, ...},
+     "comprimidas": {"1.0": {nivel: {codificación: bytes}}, ...}}
+
+    Cada bytes es una FeatureCollection en JSON compacto.
+    """
+    with open(NIVELES_PATH, encoding="utf-8") as f:
+        niveles = json.load(f)
+
+    codigos_por_cluster = {
+        str(grupo): set(d["codigo_ine"].dropna().astype(int))
+        for grupo, d in df.dropna(subset=["grupo"]).groupby("grupo")
+    }
+
+    todas = {}
+    por_cluster = {cluster: {} for cluster in codigos_por_cluster}
+    for nivel in niveles:
+        with open(os.path.join(GEOMETRIAS_DIR, nivel["geojson"]), encoding="utf-8") as f:
+            fc = json.load(f)
+        todas[nivel["nivel"]] = _json_compacto(fc)
+
+        for cluster, codigos in codigos_por_cluster.items():
+            por_cluster[cluster][nivel["nivel"]] = _json_compacto({
+                "type": "FeatureCollection",
+                "features": [
+                    feature for feature in fc["features"]
+                    if feature["properties"]["codigo_ine"] in codigos
+                ],
+            })
+
+    comprimidas = {
+        cluster: {nivel: variantes(datos) for nivel, datos in por_nivel.items()}
+        for cluster, por_nivel in por_cluster.items()
+    }
+    return {"niveles": niveles, "todas": todas, "por_cluster": por_cluster, "comprimidas": comprimidas}
+
+
+# =========================
+# CARGA
+# =========================
+def cargar_snapshot(ruta=SNAPSHOT_PATH, comprobar=True):
+    """Carga el snapshot en memoria. Falla si no existe o está obsoleto."""
+    if not os.path.exists(ruta):
+        raise SnapshotObsoleto(f"No existe {ruta}. Ejecuta: python snapshot.py")
+
+    with open(ruta, "rb") as f:
+        snapshot = pickle.load(f)
+
+    if snapshot.get("formato") != FORMATO_SNAPSHOT:
+        raise SnapshotObsoleto(f"{ruta} tiene un formato antiguo. Ejecuta: python snapshot.py")
+
+    if comprobar:
+        actual = hash_entradas()
+        if snapshot["version"] != actual:
+            raise SnapshotObsoleto(
+                f"{ruta} ({snapshot['version']}) no corresponde a las entradas actuales "
+                f"({actual}). Ejecuta: python snapshot.py"
+            )
+
+    # Indicadores fuera del pickle: se mapean en memoria
+    if snapshot.get("valores_arrow"):
+        if not os.path.exists(snapshot["valores_arrow"]):
+            raise SnapshotObsoleto(f"No existe {snapshot['valores_arrow']}. Ejecuta: python snapshot.py")
+        snapshot["valores"] = leer_tabla(snapshot["valores_arrow"], formato="arrow", mmap=True)
+
+    return snapshot
+
+
+if __name__ == "__main__":
+    construir_snapshot()
@@ -0,0 +1,235 @@
+"""
+Simplificación de geometrías municipales conservando la topología.
+
+Los municipios vecinos comparten frontera vértice a vértice en muni2024.shp.
+En vez de simplificar cada polígono por separado (lo que abre huecos entre
+vecinos), se extraen los arcos compartidos, se simplifica cada arco una sola
+vez y se reconstruyen los polígonos a partir de ellos. Así dos municipios
+vecinos siempre usan exactamente la misma frontera.
+
+Con los mismos arcos se genera también la codificación TopoJSON (arcos
+compartidos, cuantizados y en deltas).
+"""
+from collections import defaultdict
+
+import numpy as np
+
+# Niveles de simplificación: tolerancia Douglas-Peucker en metros (sobre la
+# proyección original), decimales de las coordenadas en EPSG:4326 y zoom
+# mínimo del mapa a partir del que se usa cada nivel
+NIVELES = [
+    {"nivel": 0, "tolerancia_m": 0, "decimales": 6, "zoom_min": 13},
+    {"nivel": 1, "tolerancia_m": 10, "decimales": 5, "zoom_min": 11},
+    {"nivel": 2, "tolerancia_m": 50, "decimales": 5, "zoom_min": 9},
+    {"nivel": 3, "tolerancia_m": 200, "decimales": 4, "zoom_min": 7},
+    {"nivel": 4, "tolerancia_m": 500, "decimales": 4, "zoom_min": 0},
+]
+
+
+def nivel_para_zoom(zoom, niveles=NIVELES):
+    """Nivel más simplificado que sigue siendo fiel a ese zoom."""
+    for nivel in sorted(niveles, key=lambda n: n["zoom_min"], reverse=True):
+        if zoom >= nivel["zoom_min"]:
+            return nivel["nivel"]
+    return max(n["nivel"] for n in niveles)
+
+
+# =========================
+# 1️⃣ EXTRACCIÓN DE ARCOS
+# =========================
+def _anillos(geom):
+    """[[anillo exterior, huecos...], ...] con los anillos abiertos (sin repetir el primer punto)."""
+    poligonos = geom.geoms if geom.geom_type == "MultiPolygon" else [geom]
+    return [
+        [list(p.exterior.coords)[:-1]] + [list(h.coords)[:-1] for h in p.interiors]
+        for p in poligonos
+    ]
+
+
+def construir_topologia(geometrias):
+    """
+    Divide los anillos en arcos compartidos.
+
+    Devuelve (arcos, poligonos) donde `arcos` es una lista de listas de
+    puntos y `poligonos[i]` reproduce la estructura de la geometría i con
+    referencias a arcos (índice, o ~índice si el arco va invertido), como en
+    TopoJSON.
+    """
+    anillos_por_geom = [_anillos(g) for g in geometrias]
+
+    # Un vértice es nudo si aparece con vecinos distintos en algún anillo
+    vecinos = defaultdict(set)
+    for poligonos in anillos_por_geom:
+        for anillos in poligonos:
+            for anillo in anillos:
+                n = len(anillo)
+                for i, p in enumerate(anillo):
+                    vecinos[p].add(frozenset((anillo[i - 1], anillo[(i + 1) % n])))
+    nudos = {p for p, pares in vecinos.items() if len(pares) > 1}
+
+    arcos = []
+    indice = {}
+
+    def registrar(arco):
+        clave = tuple(arco)
+        if clave in indice:
+            return indice[clave]
+        inversa = clave[::-1]
+        if inversa in indice:
+            return ~indice[inversa]
+        indice[clave] = len(arcos)
+        arcos.append(arco)
+        return indice[clave]
+
+    poligonos_topo = []
+    for poligonos in anillos_por_geom:
+        geom_topo = []
+        for anillos in poligonos:
+            anillos_topo = []
+            for anillo in anillos:
+                cortes = [i for i, p in enumerate(anillo) if p in nudos]
+                if not cortes:
+                    # Anillo aislado: se rota al punto mínimo para que sus dos
+                    # caras (p. ej. enclave y hueco) den el mismo arco
+                    inicio = anillo.index(min(anillo))
+                    rotado = anillo[inicio:] + anillo[:inicio]
+                    anillos_topo.append([registrar(rotado + [rotado[0]])])
+                    continue
+
+                rotado = anillo[cortes[0]:] + anillo[:cortes[0]]
+                cortes = [c - cortes[0] for c in cortes] + [len(rotado)]
+                rotado = rotado + [rotado[0]]
+                anillos_topo.append([
+                    registrar(rotado[a:b + 1]) for a, b in zip(cortes[:-1], cortes[1:])
+                ])
+            geom_topo.append(anillos_topo)
+        poligonos_topo.append(geom_topo)
+
+    return arcos, poligonos_topo
+
+
+# =========================
+# 2️⃣ SIMPLIFICACIÓN + PRECISIÓN
+# =========================
+def _sin_repetidos(coords):
+    """Quita puntos consecutivos repetidos (tras redondear)."""
+    if len(coords) < 2:
+        return coords
+    distinto = np.any(coords[1:] != coords[:-1], axis=1)
+    return np.vstack([coords[:1], coords[1:][distinto]])
+
+
+def simplificar_arcos(arcos, tolerancia, decimales, crs_origen):
+    """Simplifica cada arco una vez, lo pasa a EPSG:4326 y redondea."""
+    # pyproj/shapely solo hacen falta al construir, no en app.py (nivel_para_zoom)
+    from pyproj import Transformer
+    from shapely.geometry import LineString
+
+    transformer = Transformer.from_crs(crs_origen, "EPSG:4326", always_xy=True)
+    simplificados = []
+    for arco in arcos:
+        coords = np.asarray(arco, dtype=np.float64)
+        if tolerancia > 0 and len(coords) > 2:
+            simple = np.asarray(LineString(coords).simplify(tolerancia, preserve_topology=False).coords)
+            cerrado = np.array_equal(coords[0], coords[-1])
+            if cerrado and len(simple) < 4:
+                # Un anillo aislado nunca se reduce por debajo de un triángulo
+                simple = coords[[0, len(coords) // 3, 2 * len(coords) // 3, 0]]
+            coords = simple
+        lon, lat = transformer.transform(coords[:, 0], coords[:, 1])
+        simplificados.append(_sin_repetidos(np.round(np.column_stack([lon, lat]), decimales)))
+    return simplificados
+
+
+# =========================
+# 3️⃣ RECONSTRUCCIÓN GEOJSON
+# =========================
+def _coords_arco(arcos, ref):
+    return arcos[ref] if ref >= 0 else arcos[~ref][::-1]
+
+
+def _anillo_desde_arcos(arcos, refs):
+    partes = []
+    for j, ref in enumerate(refs):
+        coords = _coords_arco(arcos, ref)
+        partes.append(coords if j == 0 else coords[1:])
+    anillo = _sin_repetidos(np.vstack(partes))
+    if not np.array_equal(anillo[0], anillo[-1]):
+        anillo = np.vstack([anillo, anillo[:1]])
+    return anillo
+
+
+def geometria_geojson(arcos, geom_topo):
+    """Polygon/MultiPolygon GeoJSON; descarta anillos que colapsan (< 4 puntos)."""
+    poligonos = []
+    for anillos_topo in geom_topo:
+        anillos = [_anillo_desde_arcos(arcos, refs) for refs in anillos_topo]
+        if len(anillos[0]) < 4:
+            continue
+        poligonos.append([a.tolist() for a in anillos if len(a) >= 4])
+
+    if not poligonos:
+        return None
+    if len(poligonos) == 1:
+        return {"type": "Polygon", "coordinates": poligonos[0]}
+    return {"type": "MultiPolygon", "coordinates": poligonos}
+
+
+def conservar_municipios(arcos_nivel, anteriores, poligonos_topo, decimales):
+    """
+    Evita que un municipio diminuto desaparezca en un nivel grueso.
+
+    Si todos sus anillos colapsan, sus arcos se toman del nivel anterior más
+    cercano (`anteriores`, del más fino al más grueso) en el que no colapsa,
+    redondeados a los decimales de este nivel. Como los arcos son compartidos,
+    los vecinos usan la misma frontera y el GeoJSON y el TopoJSON del nivel
+    salen de los mismos arcos.
+
+    Devuelve (arcos, índices de los municipios conservados).
+    """
+    arcos_nivel = list(arcos_nivel)
+    conservados = []
+    for i, geom_topo in enumerate(poligonos_topo):
+        if geometria_geojson(arcos_nivel, geom_topo) is not None:
+            continue
+        refs = {r if r >= 0 else ~r for anillos in geom_topo for refs_anillo in anillos for r in refs_anillo}
+        for previos in reversed(anteriores):
+            prueba = list(arcos_nivel)
+            for r in refs:
+                prueba[r] = _sin_repetidos(np.round(previos[r], decimales))
+            if geometria_geojson(prueba, geom_topo) is not None:
+                arcos_nivel = prueba
+                conservados.append(i)
+                break
+    return arcos_nivel, conservados
+
+
+# =========================
+# 4️⃣ TOPOJSON
+# =========================
+def topojson(arcos, poligonos_topo, propiedades, decimales, nombre_objeto="municipios"):
+    """TopoJSON con arcos cuantizados a la precisión del nivel y codificados en deltas."""
+    todos = np.vstack(arcos)
+    escala = 10.0 ** -decimales
+    origen = todos.min(axis=0)
+
+    arcos_q = []
+    for arco in arcos:
+        q = np.round((arco - origen) / escala).astype(np.int64)
+        q = _sin_repetidos(q)
+        arcos_q.append(np.vstack([q[:1], np.diff(q, axis=0)]).tolist())
+
+    geometrias = []
+    for geom_topo, props in zip(poligonos_topo, propiedades):
+        if len(geom_topo) == 1:
+            geometrias.append({"type": "Polygon", "arcs": geom_topo[0], "properties": props})
+        else:
+            geometrias.append({"type": "MultiPolygon", "arcs": geom_topo, "properties": props})
+
+    return {
+        "type": "Topology",
+        "transform": {"scale": [escala, escala], "translate": origen.tolist()},
+        "objects": {nombre_objeto: {"type": "GeometryCollection", "geometries": geometrias}},
+        "arcs": arcos_q,
+        "bbox": todos.min(axis=0).tolist() + todos.max(axis=0).tolist(),
+    }